@@ -0,0 +1,75 @@
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+class FieldSet:
+    """
+    The fields an API resource can return. Each field names the values() lookups
+    it reads and how a row becomes its JSON value, so a sparse ?fields= request
+    selects, and joins, only what it returns.
+    """
+
+    def __init__(self, fields, default):
+        self.fields = fields
+        self.default = default
+
+    def parse(self, param, default=None):
+        """Field names for a ?fields=a,b value, or the default fields when it is empty"""
+        if not param:
+            return list(default or self.default)
+        names = list(dict.fromkeys(name.strip() for name in param.split(',') if name.strip()))
+        unknown = [name for name in names if name not in self.fields]
+        if unknown or not names:
+            raise InvalidFields(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(self.fields)}")
+        return names
+
+    def lookups(self, names, *extra):
+        """values() lookups for the given fields, plus any extra ones such as the paging keys"""
+        lookups = [lookup for name in names for lookup in self.fields[name][0]]
+        return list(dict.fromkeys(lookups + list(extra)))
+
+    def render(self, names, row):
+        return {name: self.fields[name][1](row) for name in names}
+
+
+def _value(lookup):
+    return [lookup], lambda row: row[lookup]
+
+
+def _image(row):
+    return default_storage.url(row['image']) if row['image'] else None
+
+
+PRODUCTS = FieldSet({
+    'id': _value('id'),
+    'slug': _value('slug'),
+    'name': _value('name'),
+    'description': _value('description'),
+    'price': _value('price'),
+    'compare_price': _value('compare_price'),
+    'on_sale': (['price', 'compare_price'],
+                lambda row: bool(row['compare_price'] and row['compare_price'] > row['price'])),
+    'stock': _value('stock'),
+    'in_stock': (['stock'], lambda row: row['stock'] > 0),
+    'category': _value('category__slug'),
+    'vendor': _value('vendor__username'),
+    'image': (['image'], _image),
+    'url': (['slug'], lambda row: reverse('store:product_detail', args=[row['slug']])),
+    'created_at': _value('created_at'),
+    'updated_at': _value('updated_at'),
+}, default=['id', 'slug', 'name', 'price', 'compare_price', 'on_sale', 'in_stock', 'category', 'image', 'url',
+            'updated_at'])
+
+CATEGORIES = FieldSet({
+    'id': _value('id'),
+    'slug': _value('slug'),
+    'name': _value('name'),
+    'description': _value('description'),
+    'image': (['image'], _image),
+    'url': (['slug'], lambda row: reverse('store:product_list_by_category', args=[row['slug']])),
+    'product_count': _value('product_count'),
+}, default=['id', 'slug', 'name', 'image', 'url', 'product_count'])
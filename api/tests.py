@@ -0,0 +1,124 @@
+import json
+import warnings
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from store.models import Product
+from store.testing import QueryBudgetTestMixin
+from store.tests import NO_CACHE, seed_catalog
+from . import views
+
+# ETags embed cache version stamps, which the dummy cache never keeps
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'api-tests'}}
+
+
+def streamed_json(response):
+    return json.loads(b''.join(response.streaming_content))
+
+
+@override_settings(CACHES=NO_CACHE)
+class CatalogApiTests(QueryBudgetTestMixin, TestCase):
+    """The JSON catalog endpoints: paging, batches, sparse fields and conditional requests"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog()
+        cls.active = [product for product in cls.products if product.is_active]
+
+    def test_all_views_budgeted(self):
+        self.assertAllViewsBudgeted('api')
+
+    def test_listing_pages_with_cursor(self):
+        url = reverse('api:product_list')
+        response = self.assertWithinQueryBudget(f'{url}?limit=20')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        page = streamed_json(response)
+        seen = [row['id'] for row in page['products']]
+        self.assertEqual(len(seen), 20)
+        while page['next']:
+            page = streamed_json(self.assertWithinQueryBudget(page['next']))
+            seen.extend(row['id'] for row in page['products'])
+        self.assertIsNone(page['next_cursor'])
+        newest_first = sorted(self.active, key=lambda product: (product.created_at, product.id), reverse=True)
+        self.assertEqual(seen, [product.id for product in newest_first])
+
+    async def test_listing_streams_under_asgi(self):
+        url = reverse('api:product_list')
+        with warnings.catch_warnings(record=True) as caught, mock.patch.object(views, 'ROWS_PER_CHUNK', 10):
+            warnings.simplefilter('always')
+            response = await self.async_client.get(f'{url}?limit=30')
+            # An async iterator: the ASGI handler sends each chunk as it is produced
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertFalse([w for w in caught if 'synchronous iterators' in str(w.message)])
+        # The opening bracket, three chunks of rows and the tail with the cursor
+        self.assertEqual(len(chunks), 5)
+        page = json.loads(b''.join(chunks))
+        self.assertEqual(len(page['products']), 30)
+        self.assertIsNotNone(page['next_cursor'])
+
+    def test_listing_filters_and_sparse_fields(self):
+        category = self.categories[1]
+        response = self.client.get(reverse('api:product_list'), {
+            'category': category.slug, 'in_stock': '1', 'fields': 'slug,stock', 'limit': 500,
+        })
+        rows = streamed_json(response)['products']
+        expected = {product.slug for product in self.active if product.category_id == category.id and product.stock}
+        self.assertEqual({row['slug'] for row in rows}, expected)
+        self.assertEqual(set(rows[0]), {'slug', 'stock'})
+
+    def test_batch_keeps_request_order(self):
+        first, second = self.active[3], self.active[0]
+        inactive = next(product for product in self.products if not product.is_active)
+        response = self.assertWithinQueryBudget(
+            f"{reverse('api:product_list')}?slugs={first.slug},{inactive.slug},{second.slug},nope")
+        data = response.json()
+        self.assertEqual([row['id'] for row in data['products']], [first.id, second.id])
+        self.assertEqual(data['missing'], [inactive.slug, 'nope'])
+
+        data = self.client.get(reverse('api:product_list'), {'ids': f'{second.id},{first.id}'}).json()
+        self.assertEqual([row['id'] for row in data['products']], [second.id, first.id])
+
+    @override_settings(API_BATCH_LIMIT=2)
+    def test_bad_requests(self):
+        url = reverse('api:product_list')
+        for query in ({'ids': '1,x'}, {'ids': '1,2,3'}, {'fields': 'name,secret'}, {'limit': 'all'}, {'limit': 0}):
+            response = self.client.get(url, query)
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn('error', response.json())
+        self.assertEqual(self.client.post(url).status_code, 405)
+
+    @override_settings(CACHES=LOCAL_CACHE)
+    def test_listing_etag_changes_with_products(self):
+        url = reverse('api:product_list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        product = Product.objects.get(pk=self.active[0].pk)
+        product.stock += 1
+        product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail(self):
+        product = self.active[0]
+        url = reverse('api:product_detail', args=[product.slug])
+        response = self.assertWithinQueryBudget(url)
+        self.assertEqual(response.json()['vendor'], self.vendor.username)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        inactive = next(product for product in self.products if not product.is_active)
+        response = self.client.get(reverse('api:product_detail', args=[inactive.slug]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Product not found'})
+
+    def test_categories_count_active_products(self):
+        response = self.assertWithinQueryBudget(reverse('api:category_list'))
+        counts = {row['slug']: row['product_count'] for row in response.json()['categories']}
+        self.assertEqual(counts, {
+            category.slug: sum(product.category_id == category.id for product in self.active)
+            for category in self.categories
+        })
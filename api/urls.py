@@ -0,0 +1,10 @@
+from django.urls import path
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('categories/', views.category_list, name='category_list'),
+    path('products/', views.product_list, name='product_list'),
+    path('products/<slug:product_slug>/', views.product_detail, name='product_detail'),
+]
@@ -0,0 +1,262 @@
+import hashlib
+import json
+from dataclasses import dataclass
+from functools import cached_property
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Case, Count, IntegerField, Max, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_safe
+
+from store import cache, facets, search
+from store.models import Category, CategoryFacetCount, Product
+from store.pagination import KeysetPaginator
+from store.querybudget import query_budget
+
+from .fields import CATEGORIES, PRODUCTS, InvalidFields
+
+# Product rows serialized per chunk of a streamed listing
+ROWS_PER_CHUNK = 50
+
+
+class ApiError(Exception):
+    pass
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': str(message)}, status=status)
+
+
+def _etag(*parts):
+    return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder)
+
+
+def _categories_version():
+    # Product rows embed their category's slug
+    return cache.get_versions([cache.CATEGORIES])[cache.CATEGORIES]
+
+
+# ============ PRODUCT LISTING ============
+@dataclass
+class ProductQuery:
+    """A parsed product listing request, shared by the condition() callbacks and the view"""
+    queryset: object
+    fields: list
+    ordering: tuple = ('-created_at', '-id')
+    per_page: int = None
+    batch_field: str = None
+    batch_keys: list = None
+
+    @cached_property
+    def freshness(self):
+        """Newest updated_at and row count of the whole result set; the count changes when rows leave it"""
+        return self.queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('id'))
+
+
+def _keys(param, name, convert=str):
+    try:
+        keys = list(dict.fromkeys(convert(key) for key in param.split(',') if key))
+    except ValueError:
+        raise ApiError(f'{name} must be a comma-separated list of integers')
+    if len(keys) > settings.API_BATCH_LIMIT:
+        raise ApiError(f'At most {settings.API_BATCH_LIMIT} {name} can be requested at once')
+    return keys
+
+
+def _parse_products(request):
+    query = request.GET
+    try:
+        fields = PRODUCTS.parse(query.get('fields'))
+    except InvalidFields as e:
+        raise ApiError(e)
+    products = Product.objects.filter(is_active=True)
+
+    if query.get('ids') or query.get('slugs'):
+        field = 'id' if query.get('ids') else 'slug'
+        keys = _keys(query[f'{field}s'], f'{field}s', int if field == 'id' else str)
+        return ProductQuery(products.filter(**{f'{field}__in': keys}), fields, batch_field=field, batch_keys=keys)
+
+    try:
+        per_page = min(int(query.get('limit', settings.API_PAGE_SIZE)), settings.API_MAX_PAGE_SIZE)
+    except ValueError:
+        raise ApiError('limit must be an integer')
+    if per_page < 1:
+        raise ApiError('limit must be at least 1')
+
+    if query.get('category'):
+        products = products.filter(category__slug=query['category'])
+    products = products.filter(facets.FacetFilters.from_query(query).q())
+
+    search_query = query.get('search', '')
+    if not search_query:
+        return ProductQuery(products, fields, per_page=per_page)
+    ranked_ids = search.search_product_ids(search_query, products)
+    if ranked_ids is None:
+        return ProductQuery(search.filter_products(products, search_query), fields, per_page=per_page)
+    # Keep the index ranking: best match first
+    products = products.filter(id__in=ranked_ids).annotate(search_rank=Case(
+        *[When(id=product_id, then=rank) for rank, product_id in enumerate(ranked_ids)],
+        output_field=IntegerField(),
+    ))
+    return ProductQuery(products, fields, ordering=('search_rank', 'id'), per_page=per_page)
+
+
+def _product_query(request):
+    if not hasattr(request, '_api_products'):
+        request._api_products = _parse_products(request)
+    return request._api_products
+
+
+def _product_list_etag(request):
+    try:
+        freshness = _product_query(request).freshness
+    except ApiError:
+        return None
+    return _etag(freshness['last_modified'], freshness['count'], _categories_version(), request.GET.urlencode())
+
+
+def _product_list_last_modified(request):
+    try:
+        return _product_query(request).freshness['last_modified']
+    except ApiError:
+        return None
+
+
+def _stream_products(rows, fields, tail):
+    """
+    Serialize {"products": [...], **tail()} a chunk of rows at a time. tail()
+    is called once the rows are exhausted, when the next cursor is known.
+    """
+    yield '{"products": ['
+    separator, chunk = '', []
+    for row in rows:
+        chunk.append(_dumps(PRODUCTS.render(fields, row)))
+        if len(chunk) == ROWS_PER_CHUNK:
+            yield separator + ','.join(chunk)
+            separator, chunk = ',', []
+    if chunk:
+        yield separator + ','.join(chunk)
+    yield ']' + ''.join(f', {_dumps(key)}: {_dumps(value)}' for key, value in tail().items()) + '}'
+
+
+async def _astream(chunks):
+    """
+    Hand a sync chunk iterator to the ASGI handler one chunk at a time; given
+    the iterator itself, it would read it to the end before sending anything.
+    Every step runs in the thread the ORM uses, so the rows keep one connection.
+    """
+    step = sync_to_async(next)
+    while (chunk := await step(chunks, None)) is not None:
+        yield chunk
+
+
+def _product_batch(listing):
+    """Products in the order their ids or slugs were requested, and the keys not found"""
+    rows = listing.queryset.values(*PRODUCTS.lookups(listing.fields, listing.batch_field))
+    found = {row[listing.batch_field]: row for row in rows}
+    return JsonResponse({
+        'products': [PRODUCTS.render(listing.fields, found[key]) for key in listing.batch_keys if key in found],
+        'missing': [key for key in listing.batch_keys if key not in found],
+    }, encoder=DjangoJSONEncoder)
+
+
+@query_budget(4)
+@require_safe
+@cache_control(no_cache=True)
+@condition(etag_func=_product_list_etag, last_modified_func=_product_list_last_modified)
+def product_list(request):
+    """
+    Active products, newest first or by search rank, filtered by ?category=,
+    ?search= and the listing's facet filters, one keyset page at a time.
+    ?ids= or ?slugs= look up a batch of products instead.
+    """
+    try:
+        listing = _product_query(request)
+    except ApiError as e:
+        return _error(e)
+    if listing.batch_field:
+        return _product_batch(listing)
+
+    keys = [name.lstrip('-') for name in listing.ordering]
+    rows = listing.queryset.values(*PRODUCTS.lookups(listing.fields, *keys))
+    # Rows are read while the response streams, after the replica router's request state is gone
+    rows = rows.using(rows.db)
+    stream = KeysetPaginator(rows, listing.ordering, per_page=listing.per_page).stream(request.GET.get('cursor'))
+
+    def tail():
+        next_url = None
+        if stream.next_cursor:
+            query = request.GET.copy()
+            query['cursor'] = stream.next_cursor
+            next_url = f'{request.path}?{query.urlencode()}'
+        return {'next_cursor': stream.next_cursor, 'next': next_url}
+
+    content = _stream_products(stream, listing.fields, tail)
+    if isinstance(request, ASGIRequest):
+        content = _astream(content)
+    return StreamingHttpResponse(content, content_type='application/json')
+
+
+# ============ PRODUCT DETAIL ============
+def _product_updated_at(request, product_slug):
+    if not hasattr(request, '_api_updated_at'):
+        request._api_updated_at = (
+            Product.objects.filter(is_active=True, slug=product_slug).values_list('updated_at', flat=True).first()
+        )
+    return request._api_updated_at
+
+
+def _product_etag(request, product_slug):
+    updated_at = _product_updated_at(request, product_slug)
+    if updated_at is None:
+        return None
+    return _etag(updated_at, _categories_version(), request.GET.get('fields', ''))
+
+
+@query_budget(3)
+@require_safe
+@cache_control(no_cache=True)
+@condition(etag_func=_product_etag, last_modified_func=_product_updated_at)
+def product_detail(request, product_slug):
+    """One active product with every field, or the ?fields= asked for"""
+    try:
+        fields = PRODUCTS.parse(request.GET.get('fields'), default=list(PRODUCTS.fields))
+    except InvalidFields as e:
+        return _error(e)
+    row = Product.objects.filter(is_active=True, slug=product_slug).values(*PRODUCTS.lookups(fields)).first()
+    if row is None:
+        return _error('Product not found', status=404)
+    return JsonResponse(PRODUCTS.render(fields, row), encoder=DjangoJSONEncoder)
+
+
+# ============ CATEGORIES ============
+def _categories_etag(request):
+    # Saving any product bumps CATALOG, which covers the product counts
+    versions = cache.get_versions([cache.CATEGORIES, cache.CATALOG])
+    return _etag(versions[cache.CATEGORIES], versions[cache.CATALOG], request.GET.get('fields', ''))
+
+
+@query_budget(2)
+@require_safe
+@cache_control(no_cache=True)
+@condition(etag_func=_categories_etag)
+def category_list(request):
+    """Every category with its number of active products, read from the stored facet counts"""
+    try:
+        fields = CATEGORIES.parse(request.GET.get('fields'))
+    except InvalidFields as e:
+        return _error(e)
+    product_counts = CategoryFacetCount.objects.filter(category=OuterRef('pk')).order_by().values('category') \
+        .annotate(total=Sum('products')).values('total')
+    rows = Category.objects.annotate(product_count=Coalesce(Subquery(product_counts), 0)) \
+        .order_by('name').values(*CATEGORIES.lookups(fields))
+    return JsonResponse({'categories': [CATEGORIES.render(fields, row) for row in rows]}, encoder=DjangoJSONEncoder)
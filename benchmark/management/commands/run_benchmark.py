@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmark import report, scenarios
+from benchmark.seed import seeded_categories, seeded_users
+from store.models import Order, Product
+
+
+class Command(BaseCommand):
+    help = 'Run the scripted load scenarios and report latency percentiles and queries per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                            help=f"Scenarios to run (default: all of {', '.join(scenarios.SCENARIOS)})")
+        parser.add_argument('--iterations', type=int, default=50,
+                            help='Recorded runs of each scenario')
+        parser.add_argument('--warmup', type=int, default=2,
+                            help='Unrecorded runs per thread before measuring')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Threads (or asyncio tasks with --asgi) running each scenario at the same time')
+        parser.add_argument('--asgi', action='store_true',
+                            help='Serve requests through the ASGI handler on one event loop instead of WSGI')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed for the choices the scenarios make')
+        parser.add_argument('--host', default='localhost',
+                            help='Host header sent with every request; must be in ALLOWED_HOSTS')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--compare', metavar='REPORT', help='Show changes against an earlier JSON report')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(scenarios.SCENARIOS)
+        unknown = [name for name in names if name not in scenarios.SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(unknown)}")
+        if options['iterations'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--iterations and --concurrency must be at least 1.')
+        baseline = None
+        if options['compare']:
+            try:
+                baseline = report.load_report(options['compare'])
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Cannot read {options["compare"]}: {e}')
+
+        try:
+            recorder = scenarios.run(
+                names, options['iterations'], concurrency=options['concurrency'],
+                warmup=options['warmup'], seed=options['seed'], host=options['host'], asgi=options['asgi'],
+            )
+        except LookupError as e:
+            raise CommandError(str(e))
+
+        result = report.build_report(recorder, {
+            'scenarios': names,
+            'iterations': options['iterations'],
+            'warmup': options['warmup'],
+            'concurrency': options['concurrency'],
+            'handler': 'asgi' if options['asgi'] else 'wsgi',
+            'seed': options['seed'],
+        }, dataset={
+            'users': seeded_users().count(),
+            'categories': seeded_categories().count(),
+            'products': Product.objects.count(),
+            'orders': Order.objects.count(),
+        })
+        self.stdout.write(report.format_table(result, baseline))
+        errors = sum(row['errors'] for row in result['requests'].values())
+        if errors:
+            self.stderr.write(f'{errors} requests returned an error status.')
+        if options['output']:
+            report.write_report(result, options['output'])
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}."))
@@ -0,0 +1,32 @@
+from dataclasses import fields
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmark import seed
+from benchmark.seed import Volumes
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic catalog, customers, carts and orders for the load benchmarks'
+
+    def add_arguments(self, parser):
+        for field in fields(Volumes):
+            parser.add_argument(f"--{field.name.replace('_', '-')}", type=int, default=field.default,
+                                help=f'Default {field.default}')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed; the same seed and volumes give the same data')
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete previously seeded benchmark data first')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted = seed.clear()
+            self.stdout.write(f'Deleted {deleted} seeded rows.')
+        elif seed.seeded_users().exists():
+            raise CommandError('Benchmark data already exists; pass --clear to replace it.')
+
+        volumes = Volumes(**{field.name: options[field.name] for field in fields(Volumes)})
+        created = seed.seed(volumes, seed=options['seed'])
+        summary = ', '.join(f'{count} {name}' for name, count in created.items())
+        self.stdout.write(self.style.SUCCESS(f'Seeded {summary}.'))
+        self.stdout.write(f"Seeded users sign in with the password '{seed.PASSWORD}'.")
@@ -0,0 +1,108 @@
+import json
+import platform
+import subprocess
+from collections import defaultdict
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+REPORT_VERSION = 1
+
+# Figures compared between two reports, with the unit they are printed in
+COMPARED = [('p50_ms', 'ms'), ('p95_ms', 'ms'), ('p99_ms', 'ms'), ('queries_mean', 'q')]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(samples):
+    """Latency percentiles and query counts for a list of (elapsed, queries, ok) samples"""
+    times = sorted(elapsed * 1000 for elapsed, _, _ in samples)
+    queries = [count for _, count, _ in samples]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, _, ok in samples if not ok),
+        'p50_ms': round(percentile(times, 50), 2),
+        'p95_ms': round(percentile(times, 95), 2),
+        'p99_ms': round(percentile(times, 99), 2),
+        'mean_ms': round(sum(times) / len(times), 2) if times else 0.0,
+        'max_ms': round(times[-1], 2) if times else 0.0,
+        'queries_mean': round(sum(queries) / len(queries), 2) if queries else 0.0,
+        'queries_max': max(queries, default=0),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def build_report(recorder, options, dataset):
+    """A JSON-serialisable report: run metadata, then figures per scenario and per request"""
+    by_scenario = defaultdict(list)
+    for label, samples in recorder.samples.items():
+        by_scenario[label.split('.', 1)[0]].extend(samples)
+    return {
+        'version': REPORT_VERSION,
+        'meta': {
+            'created_at': timezone.now().isoformat(),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'cache': settings.CACHES['default']['BACKEND'],
+            'debug': settings.DEBUG,
+            'dataset': dataset,
+            **options,
+        },
+        'scenarios': {name: summarize(samples) for name, samples in sorted(by_scenario.items())},
+        'requests': {label: summarize(samples) for label, samples in sorted(recorder.samples.items())},
+    }
+
+
+def load_report(path):
+    report = json.loads(Path(path).read_text())
+    if report.get('version') != REPORT_VERSION:
+        raise ValueError(f'{path} is not a version {REPORT_VERSION} benchmark report')
+    return report
+
+
+def write_report(report, path):
+    Path(path).write_text(json.dumps(report, indent=2) + '\n')
+
+
+def format_table(report, baseline=None):
+    """Plain-text table of the per-request figures, with the change against a baseline report if given"""
+    header = f"{'request':<34}{'n':>6}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}"
+    lines = [header, '-' * len(header)]
+    previous = baseline['requests'] if baseline else {}
+    for label, row in report['requests'].items():
+        lines.append(
+            f"{label:<34}{row['requests']:>6}{row['errors']:>5}"
+            f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['queries_mean']:>9.1f}"
+        )
+        if label in previous:
+            lines.append(f"{'':<45}" + ''.join(
+                f"{_change(previous[label][key], row[key]):>{10 if unit == 'ms' else 9}}" for key, unit in COMPARED
+            ))
+    return '\n'.join(lines)
+
+
+def _change(old, new):
+    if not old:
+        return 'new' if new else '='
+    delta = (new - old) / old * 100
+    return '=' if abs(delta) < 0.5 else f'{delta:+.0f}%'
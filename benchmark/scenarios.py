@@ -0,0 +1,292 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from store.models import Product
+from store.querybudget import count_queries
+
+from .seed import ADJECTIVES, NOUNS, seeded_categories, seeded_users
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    """
+    Register a scenario: a generator function(data, rng) that yields one
+    visitor's steps, get()/post() requests and login(), and is sent back the
+    response to each request
+    """
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+# ============ DATA ============
+@dataclass
+class BenchData:
+    """Ids and slugs of the seeded rows, loaded once and shared read-only by all workers"""
+    categories: list
+    products: list  # (id, slug) of active products in stock
+    customers: list
+    vendors: list
+    search_terms: list
+
+    @classmethod
+    def load(cls):
+        users = seeded_users()
+        data = cls(
+            categories=list(seeded_categories().values_list('slug', flat=True)),
+            products=list(Product.objects.filter(
+                category__in=seeded_categories(), is_active=True, stock__gte=100,
+            ).values_list('id', 'slug')),
+            customers=list(users.filter(user_type='customer')),
+            vendors=list(users.filter(user_type='vendor')),
+            search_terms=ADJECTIVES + NOUNS + [f'{a} {n}' for a, n in zip(ADJECTIVES, NOUNS)],
+        )
+        if not (data.categories and data.products and data.customers and data.vendors):
+            raise LookupError('No benchmark data found; run the seed_benchmark command first')
+        return data
+
+
+# ============ STEPS ============
+@dataclass
+class Request:
+    label: str
+    url: str
+    method: str = 'get'
+    data: dict = None
+    record: bool = True
+
+
+@dataclass
+class Login:
+    user: object
+
+
+def get(label, url, data=None, record=True):
+    return Request(label, url, data=data, record=record)
+
+
+def post(label, url, data=None, record=True):
+    return Request(label, url, method='post', data=data, record=record)
+
+
+def login(user):
+    return Login(user)
+
+
+# ============ RECORDING ============
+class Recorder:
+    """Collects (elapsed seconds, queries, ok) samples per request label from all worker threads"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def add(self, label, elapsed, queries, ok):
+        with self.lock:
+            self.samples[label].append((elapsed, queries, ok))
+
+
+class Session:
+    """One simulated visitor: a test client through the WSGI handler whose requests are timed and counted"""
+
+    def __init__(self, client, recorder, scenario_name, record=True):
+        self.client = client
+        self.recorder = recorder
+        self.scenario_name = scenario_name
+        self.record = record
+
+    def add(self, step, elapsed, queries, response):
+        if self.record and step.record:
+            self.recorder.add(f'{self.scenario_name}.{step.label}', elapsed, queries, response.status_code < 400)
+
+    def request(self, step):
+        with count_queries() as queries:
+            start = time.perf_counter()
+            response = getattr(self.client, step.method)(step.url, step.data)
+            elapsed = time.perf_counter() - start
+        self.add(step, elapsed, queries.count, response)
+        return response
+
+    def play(self, steps):
+        """Run a scenario generator, sending it the response to each request"""
+        response = None
+        while True:
+            try:
+                step = steps.send(response)
+            except StopIteration:
+                return
+            if isinstance(step, Login):
+                self.client.force_login(step.user)
+                response = None
+            else:
+                response = self.request(step)
+
+
+class HostAsyncClient(AsyncClient):
+    """
+    AsyncClient that sends the given Host header. AsyncRequestFactory always
+    adds 'Host: testserver' first, and a host passed in headers only follows it.
+    """
+
+    def __init__(self, host, **kwargs):
+        super().__init__(**kwargs)
+        self.host = host.encode('latin1')
+
+    def _base_scope(self, **request):
+        scope = super()._base_scope(**request)
+        scope['headers'] = [(b'host', self.host)] + [
+            (name, value) for name, value in scope['headers'] if name != b'host'
+        ]
+        return scope
+
+
+class AsyncSession(Session):
+    """A visitor driving an AsyncClient through the ASGI handler, as under an ASGI server"""
+
+    async def request(self, step):
+        with count_queries() as queries:
+            start = time.perf_counter()
+            response = await getattr(self.client, step.method)(step.url, step.data)
+            elapsed = time.perf_counter() - start
+        self.add(step, elapsed, queries.count, response)
+        return response
+
+    async def play(self, steps):
+        response = None
+        while True:
+            try:
+                step = steps.send(response)
+            except StopIteration:
+                return
+            if isinstance(step, Login):
+                await self.client.aforce_login(step.user)
+                response = None
+            else:
+                response = await self.request(step)
+
+
+# ============ SCENARIOS ============
+CURSOR_RE = re.compile(r'[?&]cursor=([^&"\']+)')
+
+
+@scenario('browse')
+def browse(data, rng):
+    """Anonymous visitor: home page, a category and its next page, then a product"""
+    yield get('home', reverse('store:home'))
+    yield get('product_list', reverse('store:product_list'))
+    category_url = reverse('store:product_list_by_category', args=[rng.choice(data.categories)])
+    response = yield get('category', category_url)
+    match = CURSOR_RE.search(response.content.decode())
+    if match:
+        yield get('category_next_page', f'{category_url}?cursor={match.group(1)}')
+    yield get('product_detail', reverse('store:product_detail', args=[rng.choice(data.products)[1]]))
+
+
+@scenario('search')
+def search(data, rng):
+    """Anonymous visitor searching the catalog, alone and within a category"""
+    term = rng.choice(data.search_terms)
+    yield get('search', reverse('store:product_list'), data={'search': term})
+    yield get('search_category', reverse('store:product_list_by_category', args=[rng.choice(data.categories)]),
+              data={'search': term})
+
+
+@scenario('filter')
+def filter_catalog(data, rng):
+    """Anonymous visitor narrowing a category to a price band, then to products on sale"""
+    category_url = reverse('store:product_list_by_category', args=[rng.choice(data.categories)])
+    band = rng.randrange(len(settings.FACET_PRICE_BANDS) + 1)
+    yield get('filter_price', category_url, data={'price': band})
+    yield get('filter_price_on_sale', category_url, data={'price': band, 'on_sale': 1})
+
+
+@scenario('add_to_cart')
+def add_to_cart(data, rng):
+    """Signed-in customer adding a few products and reviewing the cart"""
+    yield login(rng.choice(data.customers))
+    for product_id, _ in rng.sample(data.products, 3):
+        yield post('add_to_cart', reverse('cart:add_to_cart', args=[product_id]))
+    yield get('cart', reverse('cart:cart_view'))
+    yield post('clear_cart', reverse('cart:clear_cart'), record=False)
+
+
+@scenario('checkout')
+def checkout(data, rng):
+    """Signed-in customer buying two products"""
+    yield login(rng.choice(data.customers))
+    yield post('clear_cart', reverse('cart:clear_cart'), record=False)
+    for product_id, _ in rng.sample(data.products, 2):
+        yield post('add_to_cart', reverse('cart:add_to_cart', args=[product_id]), record=False)
+    yield get('checkout', reverse('cart:checkout'))
+    response = yield post('place_order', reverse('cart:checkout'), data={'shipping_address': '1 Benchmark Street'})
+    if response.status_code == 302 and '/order/' in response.url:
+        yield get('order_complete', response.url)
+    yield get('order_history', reverse('store:order_history'))
+
+
+@scenario('dashboard')
+def dashboard(data, rng):
+    """Vendor checking the dashboard, then sorting the product table by stock"""
+    yield login(rng.choice(data.vendors))
+    yield get('dashboard', reverse('store:dashboard'))
+    yield get('dashboard_sorted', reverse('store:dashboard'), data={'sort': 'stock'})
+
+
+# ============ RUNNING ============
+def _split(total, parts):
+    return [total // parts + (n < total % parts) for n in range(parts)]
+
+
+def run(names, iterations, concurrency=1, warmup=0, seed=0, host='localhost', asgi=False):
+    """
+    Run each named scenario `iterations` times, spread over `concurrency`
+    threads that each drive their own test client through the WSGI handler,
+    or with `asgi` over as many asyncio tasks sharing one event loop, each
+    driving an AsyncClient through the ASGI handler. Warmup iterations run
+    first and are not recorded. Returns the Recorder.
+    """
+    data = BenchData.load()
+    recorder = Recorder()
+
+    def worker(name, worker_id, count):
+        rng = random.Random(f'{seed}-{name}-{worker_id}')
+        client = Client(headers={'host': host}, raise_request_exception=False)
+        try:
+            for n in range(warmup + count):
+                Session(client, recorder, name, record=n >= warmup).play(SCENARIOS[name](data, rng))
+        finally:
+            connections.close_all()
+
+    async def aworker(name, worker_id, count):
+        rng = random.Random(f'{seed}-{name}-{worker_id}')
+        client = HostAsyncClient(host, raise_request_exception=False)
+        for n in range(warmup + count):
+            await AsyncSession(client, recorder, name, record=n >= warmup).play(SCENARIOS[name](data, rng))
+
+    async def arun(name):
+        await asyncio.gather(*(aworker(name, worker_id, count)
+                               for worker_id, count in enumerate(_split(iterations, concurrency))))
+
+    for name in names:
+        if asgi:
+            asyncio.run(arun(name))
+            continue
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(worker, name, worker_id, count)
+                       for worker_id, count in enumerate(_split(iterations, concurrency))]
+            for future in futures:
+                future.result()
+    return recorder
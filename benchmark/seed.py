@@ -0,0 +1,157 @@
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from cart.models import Cart, CartItem
+from store import cache, currency, facets, rollups, search
+from store.models import Category, Order, OrderItem, Product
+
+User = get_user_model()
+
+# Every seeded row is named with this prefix so it can be told apart and cleared
+PREFIX = 'bench'
+PASSWORD = 'bench-password'
+
+BATCH_SIZE = 1000
+
+ADJECTIVES = ['classic', 'compact', 'deluxe', 'ergonomic', 'portable', 'premium', 'rugged',
+              'slim', 'smart', 'solar', 'vintage', 'wireless']
+NOUNS = ['backpack', 'blender', 'camera', 'chair', 'headphones', 'kettle', 'keyboard',
+         'lamp', 'laptop', 'monitor', 'phone', 'speaker', 'watch']
+ORDER_STATUSES = [('pending', 30), ('processing', 20), ('shipped', 20), ('delivered', 25), ('cancelled', 5)]
+
+
+@dataclass
+class Volumes:
+    customers: int = 200
+    vendors: int = 10
+    categories: int = 12
+    products: int = 5000
+    carts: int = 100
+    cart_items: int = 3
+    orders: int = 2000
+    order_items: int = 3
+    days: int = 90
+
+
+def seeded_users():
+    return User.objects.filter(username__startswith=f'{PREFIX}-')
+
+
+def seeded_categories():
+    return Category.objects.filter(slug__startswith=f'{PREFIX}-')
+
+
+def clear():
+    """Delete all seeded data; products, carts and orders go with their users"""
+    with transaction.atomic():
+        users = seeded_users().delete()[0]
+        categories = seeded_categories().delete()[0]
+        rollups.rebuild()
+        facets.rebuild()
+    cache.bump(cache.CATALOG, cache.CATEGORIES)
+    return users + categories
+
+
+def _order_number(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128)))[:20]
+
+
+def seed(volumes, seed=0):
+    """
+    Generate a synthetic catalog with customers, carts and order history.
+    The same volumes and seed always produce the same data. Rows are written
+    with bulk_create, so the search index, display prices, sales rollups, facet
+    counts and cache scopes that signals would normally maintain are refreshed
+    at the end.
+    Returns {table: rows created}.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    password = make_password(PASSWORD)
+
+    with transaction.atomic():
+        vendors = User.objects.bulk_create([
+            User(username=f'{PREFIX}-vendor-{n}', email=f'{PREFIX}-vendor-{n}@example.com',
+                 user_type='vendor', password=password)
+            for n in range(volumes.vendors)
+        ])
+        customers = User.objects.bulk_create([
+            User(username=f'{PREFIX}-customer-{n}', email=f'{PREFIX}-customer-{n}@example.com',
+                 address=f'{n} Benchmark Street', password=password)
+            for n in range(volumes.customers)
+        ], batch_size=BATCH_SIZE)
+        categories = Category.objects.bulk_create([
+            Category(name=f'Bench {NOUNS[n % len(NOUNS)]}s {n}', slug=f'{PREFIX}-category-{n}')
+            for n in range(volumes.categories)
+        ])
+
+        products = []
+        for n in range(volumes.products):
+            name = f'{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS)} {n}'
+            price = Decimal(rng.randrange(500, 200000)) / 100
+            products.append(Product(
+                name=name, slug=f'{PREFIX}-product-{n}',
+                description=f'{name} generated for load benchmarks.',
+                price=price,
+                compare_price=(price * Decimal('1.2')).quantize(Decimal('0.01')) if rng.random() < 0.25 else None,
+                category=rng.choice(categories), vendor=rng.choice(vendors),
+                stock=rng.randrange(0, 10) if rng.random() < 0.05 else rng.randrange(100, 1000),
+                is_active=rng.random() < 0.95,
+            ))
+        Product.objects.bulk_create(products, batch_size=BATCH_SIZE)
+        on_sale = [product for product in products if product.is_active and product.stock]
+
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in customers[:volumes.carts]])
+        cart_items = [
+            CartItem(cart=cart, product=product, quantity=rng.randint(1, 3))
+            for cart in carts
+            for product in rng.sample(on_sale, min(volumes.cart_items, len(on_sale)))
+        ]
+        CartItem.objects.bulk_create(cart_items, batch_size=BATCH_SIZE)
+
+        orders, order_items = [], []
+        statuses, weights = zip(*ORDER_STATUSES)
+        for _ in range(volumes.orders if customers and on_sale else 0):
+            lines = rng.sample(on_sale, min(rng.randint(1, 2 * volumes.order_items - 1), len(on_sale)))
+            items = [OrderItem(product=product, quantity=rng.randint(1, 3), price=product.price) for product in lines]
+            order = Order(
+                user=rng.choice(customers), order_number=_order_number(rng),
+                status=rng.choices(statuses, weights)[0], shipping_address='1 Benchmark Street',
+                total_amount=sum(item.price * item.quantity for item in items),
+            )
+            order.created_at = now - timedelta(seconds=rng.randrange(volumes.days * 86400))
+            orders.append((order, items))
+        placed_at = [order.created_at for order, _ in orders]
+        Order.objects.bulk_create([order for order, _ in orders], batch_size=BATCH_SIZE)
+        # bulk_create stamps auto_now_add fields with the current time
+        for (order, items), created_at in zip(orders, placed_at):
+            order.created_at = created_at
+            for item in items:
+                item.order = order
+                order_items.append(item)
+        Order.objects.bulk_update([order for order, _ in orders], ['created_at'], batch_size=BATCH_SIZE)
+        OrderItem.objects.bulk_create(order_items, batch_size=BATCH_SIZE)
+
+        search.index_products(products)
+        for start in range(0, len(products), BATCH_SIZE):
+            currency.refresh_product_prices(product_ids=[product.pk for product in products[start:start + BATCH_SIZE]])
+        rollups.rebuild()
+        facets.rebuild()
+
+    cache.bump(cache.CATALOG, cache.CATEGORIES, *(cache.category_scope(category.pk) for category in categories))
+    return {
+        'users': len(vendors) + len(customers),
+        'categories': len(categories),
+        'products': len(products),
+        'cart items': len(cart_items),
+        'orders': len(orders),
+        'order items': len(order_items),
+    }
@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from store.models import Order, Product
+from store.tests import NO_CACHE
+from . import report, scenarios, seed
+from .management.commands import run_benchmark, seed_benchmark
+from .seed import Volumes
+
+SMALL = Volumes(customers=4, vendors=2, categories=3, products=300, carts=2, cart_items=2, orders=10,
+                order_items=2, days=5)
+
+
+@override_settings(CACHES=NO_CACHE)
+class BenchmarkSmokeTests(TransactionTestCase):
+    """
+    Seed a small data set and drive every scenario through the real handlers.
+    A TransactionTestCase: the scenarios run in worker threads with their own
+    connections, which cannot see the data of an open test transaction.
+    """
+    databases = '__all__'  # The replica too, under DJANGO_DB_PROFILE=production
+    serialized_rollback = True
+
+    def test_seed_is_repeatable_and_clears(self):
+        created = seed.seed(SMALL, seed=3)
+        self.assertEqual(created['products'], SMALL.products)
+        self.assertEqual(created['orders'], SMALL.orders)
+        first = list(Product.objects.filter(slug__startswith=seed.PREFIX).order_by('slug').values_list('slug', 'price'))
+
+        self.assertGreater(seed.clear(), 0)
+        self.assertFalse(seed.seeded_users().exists())
+        self.assertFalse(Product.objects.filter(slug__startswith=seed.PREFIX).exists())
+
+        seed.seed(SMALL, seed=3)
+        self.assertEqual(
+            list(Product.objects.filter(slug__startswith=seed.PREFIX).order_by('slug').values_list('slug', 'price')),
+            first,
+        )
+
+    def test_scenarios_and_report(self):
+        with self.assertRaises(LookupError):
+            scenarios.run(['browse'], 1)
+        seed.seed(SMALL)
+        orders = Order.objects.count()
+
+        for asgi in (False, True):
+            recorder = scenarios.run(list(scenarios.SCENARIOS), 2, host='testserver', asgi=asgi)
+            result = report.build_report(recorder, {'handler': 'asgi' if asgi else 'wsgi'}, dataset={})
+            self.assertEqual(set(result['scenarios']), set(scenarios.SCENARIOS))
+            for label, row in result['requests'].items():
+                self.assertEqual(row['errors'], 0, label)
+                self.assertGreater(row['queries_mean'], 0, label)
+            self.assertEqual(result['scenarios']['checkout']['requests'] % 2, 0)
+        # Each checkout run placed an order
+        self.assertEqual(Order.objects.count(), orders + 4)
+
+        # Read-only scenarios only: writers from several threads hit table locks
+        # on the in-memory test database that busy_timeout handles on a file
+        recorder = scenarios.run(['browse', 'search'], 4, concurrency=2, warmup=1, host='testserver')
+        self.assertEqual(len(recorder.samples['search.search']), 4)
+        self.assertFalse(any(not ok for samples in recorder.samples.values() for _, _, ok in samples))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            report.write_report(result, path)
+            self.assertEqual(report.load_report(path), json.loads(json.dumps(result)))
+            with open(path, 'w') as f:
+                json.dump({'version': 0}, f)
+            with self.assertRaises(ValueError):
+                report.load_report(path)
+
+        table = report.format_table(result, baseline=result)
+        self.assertIn('browse.home', table)
+        self.assertIn('=', table)
+
+    @override_settings(ALLOWED_HOSTS=['bench.example'])
+    def test_host_header(self):
+        seed.seed(SMALL)
+        for asgi in (False, True):
+            recorder = scenarios.run(['browse'], 1, host='bench.example', asgi=asgi)
+            self.assertTrue(all(ok for samples in recorder.samples.values() for _, _, ok in samples), asgi)
+
+    def test_commands(self):
+        out = StringIO()
+        call_command(seed_benchmark.Command(), products=50, orders=5, customers=3, stdout=out)
+        self.assertIn('Seeded', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command(seed_benchmark.Command(), stdout=StringIO())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            out = StringIO()
+            call_command(run_benchmark.Command(), 'browse', iterations=1, warmup=0, host='testserver',
+                         output=path, stdout=out, stderr=StringIO())
+            self.assertIn('browse.product_detail', out.getvalue())
+            self.assertEqual(report.load_report(path)['meta']['dataset']['categories'], 12)
+        with self.assertRaises(CommandError):
+            call_command(run_benchmark.Command(), 'nope', stdout=StringIO())
+
+
+class ReportTests(SimpleTestCase):
+
+    def test_percentile(self):
+        values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+        self.assertEqual(report.percentile(values, 50), 5)
+        self.assertEqual(report.percentile(values, 95), 10)
+        self.assertEqual(report.percentile([], 50), 0.0)
+
+    def test_summarize(self):
+        summary = report.summarize([(0.010, 3, True), (0.030, 5, False), (0.020, 4, True)])
+        self.assertEqual((summary['requests'], summary['errors']), (3, 1))
+        self.assertEqual((summary['p50_ms'], summary['max_ms'], summary['queries_mean']), (20.0, 30.0, 4.0))
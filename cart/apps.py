@@ -3,4 +3,7 @@ from django.apps import AppConfig
 class CartConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cart'
-    verbose_name = 'Shopping Cart'
\ No newline at end of file
+    verbose_name = 'Shopping Cart'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,78 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from store import cache, facets, rollups
+from store.models import Order, OrderItem, Product
+from .models import Cart
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCart(CheckoutError):
+    pass
+
+
+class InsufficientStock(CheckoutError):
+    """Raised with the products that cannot cover the requested quantities"""
+
+    def __init__(self, products):
+        self.products = products
+        names = ', '.join(product.name for product in products)
+        super().__init__(f"Not enough stock for: {names}")
+
+
+def place_order(user, shipping_address):
+    """
+    Turn the user's cart into an Order in one transaction.
+
+    Stock for every line is decremented by a single conditional UPDATE; if any
+    product is inactive or short on stock nothing is written and
+    InsufficientStock is raised. Order items are bulk inserted with the
+    product prices at the time of purchase.
+    """
+    with transaction.atomic():
+        cart = Cart.objects.filter(user=user).first()
+        items = list(cart.items.select_related('product').order_by('id')) if cart else []
+        if not items:
+            raise EmptyCart("Your cart is empty.")
+
+        quantities = Case(
+            *[When(id=item.product_id, then=Value(item.quantity)) for item in items],
+            output_field=IntegerField(),
+        )
+        product_ids = [item.product_id for item in items]
+        # update() skips auto_now; updated_at drives the catalog API's conditional responses
+        updated = Product.objects.filter(
+            id__in=product_ids, is_active=True, stock__gte=quantities,
+        ).update(stock=F('stock') - quantities, updated_at=timezone.now())
+
+        if updated != len(product_ids):
+            short = Product.objects.filter(id__in=product_ids).filter(
+                Q(is_active=False) | Q(stock__lt=quantities)
+            )
+            raise InsufficientStock(list(short))
+
+        order = Order.objects.create(
+            user=user,
+            total_amount=sum(item.product.price * item.quantity for item in items),
+            shipping_address=shipping_address,
+        )
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=item.product, quantity=item.quantity, price=item.product.price)
+            for item in items
+        ])
+        # bulk_create sends no signals; the Order itself was counted on save
+        rollups.record_items(order, order_items)
+        cart.items.all().delete()
+
+        # Stock changed through update(), which sends no model signals
+        facets.sold_out([item.product for item in items if item.product.stock == item.quantity])
+        scopes = {cache.CATALOG}
+        for item in items:
+            scopes.add(cache.product_scope(item.product.slug))
+            scopes.add(cache.category_scope(item.product.category_id))
+        transaction.on_commit(lambda: cache.bump(*scopes))
+    return order
@@ -1,49 +1,83 @@
-from .models import Cart
+from decimal import Decimal
 from django.conf import settings
+from django.utils.functional import SimpleLazyObject, lazy
+from store.async_context import preloadable
+from store.currency import aget_active_currency, format_in, get_active_currency
+from .cookie import CookieCart
+from .models import Cart, CartItem
+from .summary import aget_cart_summary, get_cart_summary, summary_total
 
+
+def _totals(total, currency):
+    """Badge totals in the visitor's currency; cart_total_raw stays in the base currency"""
+    return {
+        'cart_total': format_in(total, currency),  # $1,350.00
+        'cart_total_no_decimal': format_in(total, currency, 0),  # $1,350
+        'cart_currency_symbol': currency.symbol if currency else settings.CURRENCY_SYMBOL,  # $
+        'cart_currency_code': currency.code if currency else settings.CURRENCY_CODE,  # USD
+    }
+
+@preloadable
 def cart(request):
     """
-    Make cart information available to all templates
+    Make cart information available to all templates.
+    Totals come from the cached cart summary; cart objects are only loaded if a template uses them.
     """
+    currency = get_active_currency(request)
     if request.user.is_authenticated:
-        try:
-            cart_obj = Cart.objects.get(user=request.user)
-            return {
-                'cart': cart_obj,
-                'cart_items_count': cart_obj.get_total_quantity(),
-                # ============ UPDATED FOR USD CURRENCY ============
-                'cart_total': cart_obj.get_total_price_display(),  # $1,350.00
-                'cart_total_no_decimal': cart_obj.get_total_price_no_decimal(),  # $1,350
-                'cart_total_raw': cart_obj.get_total_price(),  # 1350.00 (for calculations)
-                'cart_items': cart_obj.items.all(),  # Added for easy access
-                'cart_currency_symbol': settings.CURRENCY_SYMBOL,  # $
-                'cart_currency_code': settings.CURRENCY_CODE,  # USD
-                # ===================================================
-            }
-        except Cart.DoesNotExist:
-            return {
-                'cart': None,
-                'cart_items_count': 0,
-                # ============ UPDATED FOR USD CURRENCY ============
-                'cart_total': f"{settings.CURRENCY_SYMBOL}0.00",
-                'cart_total_no_decimal': f"{settings.CURRENCY_SYMBOL}0",
-                'cart_total_raw': 0,
-                'cart_items': [],
-                'cart_currency_symbol': settings.CURRENCY_SYMBOL,
-                'cart_currency_code': settings.CURRENCY_CODE,
-                # ===================================================
-            }
+        user = request.user
+        summary = get_cart_summary(user)
+        return {
+            'cart': SimpleLazyObject(lambda: Cart.objects.filter(user=user).first()),
+            'cart_items_count': summary['quantity'],
+            **_totals(summary_total(summary, currency), currency),
+            'cart_total_raw': summary['total'],  # 1350.00 (for calculations)
+            'cart_items': CartItem.objects.filter(cart__user=user).select_related('product'),  # Lazy queryset
+        }
     
-    # For anonymous users
+    # For anonymous users: the cart lives in a signed cookie
+    cookie_cart = CookieCart(request)
+    if cookie_cart:
+        # Only the badge count is read eagerly; totals need product prices
+        total = lazy(lambda: cookie_cart.snapshot.total_price, Decimal)
+        display_total = lambda: cookie_cart.snapshot.in_currency(currency).display_total_price
+        return {
+            'cart': None,
+            'cart_items_count': cookie_cart.get_total_quantity(),
+            **_totals(Decimal(0), currency),
+            'cart_total': lazy(lambda: format_in(display_total(), currency), str)(),
+            'cart_total_no_decimal': lazy(lambda: format_in(display_total(), currency, 0), str)(),
+            'cart_total_raw': total(),
+            'cart_items': SimpleLazyObject(lambda: [line.item for line in cookie_cart.snapshot]),
+        }
+
     return {
         'cart': None,
         'cart_items_count': 0,
-        # ============ UPDATED FOR USD CURRENCY ============
-        'cart_total': f"{settings.CURRENCY_SYMBOL}0.00",
-        'cart_total_no_decimal': f"{settings.CURRENCY_SYMBOL}0",
+        **_totals(Decimal(0), currency),
         'cart_total_raw': 0,
         'cart_items': [],
-        'cart_currency_symbol': settings.CURRENCY_SYMBOL,
-        'cart_currency_code': settings.CURRENCY_CODE,
-        # ===================================================
-    }
\ No newline at end of file
+    }
+
+async def acart(request):
+    """
+    Async cart(). Every value is loaded before rendering, so the lazy 'cart'
+    and 'cart_items' are left out; async pages only show the totals.
+    """
+    user = await request.auser()
+    currency = await aget_active_currency(request)
+    if user.is_authenticated:
+        summary = await aget_cart_summary(user)
+        quantity, total = summary['quantity'], summary['total']
+        display_total = summary_total(summary, currency)
+    else:
+        cookie_cart = CookieCart(request)
+        quantity = cookie_cart.get_total_quantity()
+        snapshot = (await cookie_cart.asnapshot()).in_currency(currency) if cookie_cart else None
+        total = snapshot.total_price if snapshot else Decimal('0.00')
+        display_total = snapshot.display_total_price if snapshot else Decimal('0.00')
+    return {
+        'cart_items_count': quantity,
+        **_totals(display_total, currency),
+        'cart_total_raw': total,
+    }
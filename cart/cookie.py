@@ -0,0 +1,112 @@
+import json
+
+from django.conf import settings
+from django.utils.functional import cached_property
+
+from store.models import Product
+from .models import CartItem
+from .operations import merge_items
+from .summary import CartSnapshot
+
+SALT = 'cart.cookie'
+
+# Keeps the signed cookie well under the 4KB browser limit
+MAX_LINES = 50
+
+
+class CookieCart:
+    """
+    Cart for anonymous visitors, stored as {product_id: quantity} in a signed cookie.
+    Reading and changing it never writes to the database.
+    """
+
+    def __init__(self, request):
+        self.quantities = {}
+        raw = request.get_signed_cookie(settings.CART_COOKIE_NAME, default=None, salt=SALT)
+        if raw:
+            try:
+                data = json.loads(raw)
+                self.quantities = {
+                    int(product_id): int(quantity)
+                    for product_id, quantity in data.items() if int(quantity) > 0
+                }
+            except (ValueError, TypeError, AttributeError):
+                self.quantities = {}
+
+    def __bool__(self):
+        return bool(self.quantities)
+
+    def get_total_quantity(self):
+        return sum(self.quantities.values())
+
+    def add(self, product_id, quantity=1):
+        """
+        Add a product after checking it is active and in stock.
+        Returns (product_name, new_quantity), None when out of stock,
+        or raises Product.DoesNotExist.
+        """
+        product = Product.objects.only('name', 'stock').get(id=product_id, is_active=True)
+        new_quantity = self.quantities.get(product.id, 0) + quantity
+        if new_quantity > product.stock or (product.id not in self.quantities and len(self.quantities) >= MAX_LINES):
+            return None
+        self.quantities[product.id] = new_quantity
+        return product.name, new_quantity
+
+    def update(self, product_id, quantity):
+        if quantity > 0 and product_id in self.quantities:
+            self.quantities[product_id] = quantity
+        else:
+            self.remove(product_id)
+
+    def remove(self, product_id):
+        self.quantities.pop(product_id, None)
+
+    def clear(self):
+        self.quantities = {}
+
+    def _products(self):
+        return Product.objects.filter(
+            id__in=self.quantities, is_active=True,
+        ).select_related('category').order_by('id')
+
+    def _snapshot(self, products):
+        return CartSnapshot(
+            CartItem(product=product, quantity=self.quantities[product.id]) for product in products
+        )
+
+    @cached_property
+    def snapshot(self):
+        """CartSnapshot of the cookie contents, loaded in one query"""
+        return self._snapshot(self._products() if self.quantities else [])
+
+    async def asnapshot(self):
+        if 'snapshot' not in self.__dict__:
+            self.__dict__['snapshot'] = self._snapshot(
+                [product async for product in self._products()] if self.quantities else []
+            )
+        return self.snapshot
+
+    def save(self, response):
+        if self.quantities:
+            response.set_signed_cookie(
+                settings.CART_COOKIE_NAME,
+                json.dumps({str(k): v for k, v in self.quantities.items()}, separators=(',', ':')),
+                salt=SALT,
+                max_age=settings.CART_COOKIE_AGE,
+                httponly=True,
+                samesite='Lax',
+            )
+        else:
+            response.delete_cookie(settings.CART_COOKIE_NAME, samesite='Lax')
+
+
+def merge_cookie_cart(request, response, user):
+    """
+    Move an anonymous visitor's cart into their database cart after login,
+    with one bulk upsert, and drop the cookie.
+    """
+    cookie_cart = CookieCart(request)
+    if cookie_cart:
+        merge_items(user, cookie_cart.quantities)
+        cookie_cart.clear()
+        cookie_cart.save(response)
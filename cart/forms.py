@@ -0,0 +1,7 @@
+from django import forms
+
+
+class CheckoutForm(forms.Form):
+    shipping_address = forms.CharField(
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3, 'placeholder': 'Street, city, postal code'})
+    )
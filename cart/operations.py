@@ -0,0 +1,102 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from store.models import Product
+from .models import Cart, CartItem
+from .summary import invalidate_cart_summary
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def ensure_cart_id(user, product_id=None):
+    """
+    Create the user's cart on first use and return its id, in one statement.
+    Given a product_id, the cart is only touched while that product is active;
+    otherwise nothing is written and None is returned.
+    """
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    params = [user.pk, now, now]
+    if product_id is None:
+        rows = "VALUES (%s, %s, %s)"
+    else:
+        rows = f"SELECT %s, %s, %s WHERE EXISTS (SELECT 1 FROM {_table(Product)} WHERE id = %s AND is_active)"
+        params.append(product_id)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {_table(Cart)} (user_id, created_at, updated_at) {rows} "
+            "ON CONFLICT (user_id) DO UPDATE SET updated_at = excluded.updated_at "
+            "RETURNING id",
+            params,
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def add_item(user, product_id, quantity=1):
+    """
+    Add quantity of a product to the user's cart with a single upsert.
+
+    The INSERT ... ON CONFLICT(cart, product) DO UPDATE relies on the
+    CartItem unique_together and only writes while the product is active
+    and has enough stock for the new total, so concurrent clicks can neither
+    lose increments nor overfill the cart.
+    Returns (product_name, new_quantity), or None when there is not enough
+    stock. Raises Product.DoesNotExist, without writing anything, when the
+    product is missing or inactive.
+    """
+    cart_item, product = _table(CartItem), _table(Product)
+    with transaction.atomic():
+        cart_id = ensure_cart_id(user, product_id)
+        if cart_id is None:
+            raise Product.DoesNotExist(f'No active product with id {product_id}')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {cart_item} (cart_id, product_id, quantity) "
+                f"SELECT %s, p.id, %s FROM {product} p "
+                "WHERE p.id = %s AND p.is_active AND p.stock >= %s "
+                "ON CONFLICT (cart_id, product_id) DO UPDATE "
+                f"SET quantity = {cart_item}.quantity + excluded.quantity "
+                f"WHERE (SELECT stock FROM {product} WHERE id = excluded.product_id) "
+                f">= {cart_item}.quantity + excluded.quantity "
+                f"RETURNING quantity, (SELECT name FROM {product} WHERE id = product_id)",
+                [cart_id, quantity, product_id, quantity],
+            )
+            row = cursor.fetchone()
+    # Raw SQL sends no CartItem signals
+    invalidate_cart_summary(user.pk)
+    if row is None:
+        return None
+    new_quantity, product_name = row
+    return product_name, new_quantity
+
+
+def merge_items(user, quantities):
+    """
+    Add several {product_id: quantity} lines to the user's cart in one bulk upsert.
+    Quantities are summed with any existing line and capped at the product's
+    stock; lines for inactive or sold-out products are skipped.
+    """
+    if not quantities:
+        return
+    cart_item, product = _table(CartItem), _table(Product)
+    values = ', '.join(['(%s, %s)'] * len(quantities))
+    params = [value for line in quantities.items() for value in line]
+    stock = f"(SELECT stock FROM {product} WHERE id = excluded.product_id)"
+    with transaction.atomic():
+        cart_id = ensure_cart_id(user)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"WITH v (product_id, quantity) AS (VALUES {values}) "
+                f"INSERT INTO {cart_item} (cart_id, product_id, quantity) "
+                "SELECT %s, p.id, CASE WHEN v.quantity < p.stock THEN v.quantity ELSE p.stock END "
+                f"FROM v INNER JOIN {product} p ON p.id = v.product_id "
+                "WHERE p.is_active AND p.stock > 0 "
+                "ON CONFLICT (cart_id, product_id) DO UPDATE "
+                f"SET quantity = CASE WHEN {cart_item}.quantity + excluded.quantity < {stock} "
+                f"THEN {cart_item}.quantity + excluded.quantity ELSE {stock} END "
+                f"WHERE {cart_item}.quantity < {stock}",
+                params + [cart_id],
+            )
+    invalidate_cart_summary(user.pk)
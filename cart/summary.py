@@ -0,0 +1,125 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from store.cache import CATALOG, aget_versions, get_versions
+from store.currency import format_in, in_currency
+from .models import CartItem
+
+
+def _summary_key(user_id):
+    # 'cart-totals': entries cached before 'prices' was added are never read
+    return f'cart-totals:{user_id}'
+
+
+def _grouped(user):
+    """Cart rows grouped by unit price, so totals can be converted the way each line is"""
+    return CartItem.objects.filter(cart__user=user).order_by().values('product__price').annotate(
+        line_count=Count('id'), total_quantity=Sum('quantity'),
+    ).values_list('product__price', 'line_count', 'total_quantity')
+
+
+def get_cart_summary(user):
+    """
+    Return {'lines', 'quantity', 'total', 'prices'} for a user's cart.
+
+    Computed with a single grouped query and cached until the cart changes
+    (CartItem signals) or any product price changes (catalog version).
+    """
+    key = _summary_key(user.pk)
+    catalog_version = get_versions([CATALOG])[CATALOG]
+    summary = cache.get(key)
+    if summary is None or summary['catalog_version'] != catalog_version:
+        summary = _summary(list(_grouped(user)), catalog_version)
+        cache.set(key, summary, None)
+    return summary
+
+
+async def aget_cart_summary(user):
+    key = _summary_key(user.pk)
+    catalog_version = (await aget_versions([CATALOG]))[CATALOG]
+    summary = await cache.aget(key)
+    if summary is None or summary['catalog_version'] != catalog_version:
+        summary = _summary([row async for row in _grouped(user)], catalog_version)
+        await cache.aset(key, summary, None)
+    return summary
+
+
+def _summary(rows, catalog_version):
+    return {
+        'lines': sum(lines for _, lines, _ in rows),
+        'quantity': sum(quantity for _, _, quantity in rows),
+        'total': sum((price * quantity for price, _, quantity in rows), Decimal('0.00')),
+        'prices': [(price, quantity) for price, _, quantity in rows],
+        'catalog_version': catalog_version,
+    }
+
+
+def summary_total(summary, currency):
+    """The summary total in a display currency, summed from converted unit prices like CartSnapshot"""
+    return sum((in_currency(price, currency) * quantity for price, quantity in summary['prices']), Decimal('0.00'))
+
+
+def invalidate_cart_summary(user_id):
+    cache.delete(_summary_key(user_id))
+
+
+class CartLine:
+    """One cart row with its line total computed once"""
+
+    def __init__(self, item, currency=None):
+        self.item = item
+        self.id = item.id
+        self.product = item.product
+        self.quantity = item.quantity
+        self.total_price = item.product.price * item.quantity
+        # Shown in the visitor's currency: the unit price converted as ProductPrice
+        # converts it, so the cart matches the listings
+        self.display_unit_price = in_currency(item.product.price, currency)
+        self.display_total_price = self.display_unit_price * item.quantity
+        self.price_display = format_in(self.display_unit_price, currency)
+        self.total_display = format_in(self.display_total_price, currency)
+
+
+class CartSnapshot:
+    """
+    Read-only view of a cart for rendering.
+    Loads every item with its product and category in one query and computes
+    the line totals and grand total a single time.
+
+    total_price stays in the base currency, which orders are charged in;
+    the display_* values are in the given currency for rendering.
+    """
+
+    def __init__(self, items, currency=None):
+        self.currency = currency
+        self.lines = [CartLine(item, currency) for item in items]
+        self.total_quantity = sum(line.quantity for line in self.lines)
+        self.total_price = sum((line.total_price for line in self.lines), Decimal('0.00'))
+        self.display_total_price = sum((line.display_total_price for line in self.lines), Decimal('0.00'))
+        self.total_display = format_in(self.display_total_price, currency)
+        self.zero_display = format_in(Decimal(0), currency)
+        self.base_total_display = format_in(self.total_price, None)
+
+    @classmethod
+    def for_cart(cls, cart, currency=None):
+        return cls(cart.items.select_related('product__category').order_by('id'), currency)
+
+    @classmethod
+    async def afor_user(cls, user, currency=None):
+        items = CartItem.objects.filter(cart__user=user).select_related('product__category').order_by('id')
+        return cls([item async for item in items], currency)
+
+    def in_currency(self, currency):
+        """The same lines priced in another display currency, without reloading them"""
+        return CartSnapshot([line.item for line in self.lines], currency)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __bool__(self):
+        return bool(self.lines)
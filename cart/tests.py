@@ -1,3 +1,471 @@
-from django.test import TestCase
+from decimal import Decimal, ROUND_HALF_UP
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from store.models import Currency, Order, OrderItem, Product
+from store.testing import QueryBudgetTestMixin
+from store.tests import LOCAL_CACHE, NO_CACHE, seed_catalog
+from .checkout import EmptyCart, InsufficientStock, place_order
+from .cookie import CookieCart
+from .models import Cart, CartItem
+from .operations import add_item
+from .summary import CartSnapshot, get_cart_summary
+
+User = get_user_model()
+
+
+@override_settings(CACHES=NO_CACHE)
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Cart views stay within their @query_budget however many lines the cart holds"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog()
+        cls.in_stock = [product for product in cls.products if product.is_active and product.stock > 2][:6]
+
+    def fill_cart(self, user):
+        for product in self.in_stock:
+            add_item(user, product.id)
+
+    def fill_cookie_cart(self):
+        for product in self.in_stock:
+            self.client.post(reverse('cart:add_to_cart', args=[product.id]))
+
+    def test_all_views_budgeted(self):
+        self.assertAllViewsBudgeted('cart')
+
+    def cart_quantities(self):
+        """{product_id: quantity} of the buyer's cart"""
+        return dict(CartItem.objects.filter(cart__user=self.buyer).values_list('product_id', 'quantity'))
+
+    def cookie_quantities(self):
+        request = RequestFactory().get('/')
+        request.COOKIES = {name: morsel.value for name, morsel in self.client.cookies.items()}
+        return CookieCart(request).quantities
+
+    def test_cart_page(self):
+        self.fill_cart(self.buyer)
+        response = self.assertWithinQueryBudget(reverse('cart:cart_view'), user=self.buyer)
+        for product in self.in_stock:
+            self.assertContains(response, product.name)
+
+    def test_cookie_cart_page(self):
+        self.fill_cookie_cart()
+        response = self.assertWithinQueryBudget(reverse('cart:cart_view'))
+        for product in self.in_stock:
+            self.assertContains(response, product.name)
+        self.assertWithinQueryBudget(reverse('store:product_list'))
+
+    def test_cart_actions(self):
+        self.fill_cart(self.buyer)
+        product = self.in_stock[0]
+        cart_url = reverse('cart:cart_view')
+        response = self.assertWithinQueryBudget(reverse('cart:add_to_cart', args=[product.id]), method='post',
+                                                user=self.buyer, status=302)
+        self.assertEqual(response.url, cart_url)
+        self.assertEqual(self.cart_quantities()[product.id], 2)
+        self.assertWithinQueryBudget(reverse('cart:update_cart_item', args=[product.id]), method='post',
+                                     data={'quantity': 3}, status=302)
+        self.assertEqual(self.cart_quantities()[product.id], 3)
+        self.assertWithinQueryBudget(reverse('cart:remove_from_cart', args=[product.id]), method='post', status=302)
+        self.assertNotIn(product.id, self.cart_quantities())
+        self.assertWithinQueryBudget(reverse('cart:clear_cart'), method='post', status=302)
+        self.assertEqual(self.cart_quantities(), {})
+
+    def test_cookie_cart_actions(self):
+        self.fill_cookie_cart()
+        product = self.in_stock[0]
+        self.assertWithinQueryBudget(reverse('cart:add_to_cart', args=[product.id]), method='post', status=302)
+        self.assertEqual(self.cookie_quantities()[product.id], 2)
+        self.assertWithinQueryBudget(reverse('cart:update_cart_item', args=[product.id]), method='post',
+                                     data={'quantity': 3}, status=302)
+        self.assertEqual(self.cookie_quantities()[product.id], 3)
+        self.assertWithinQueryBudget(reverse('cart:remove_from_cart', args=[product.id]), method='post', status=302)
+        self.assertNotIn(product.id, self.cookie_quantities())
+        self.assertWithinQueryBudget(reverse('cart:clear_cart'), method='post', status=302)
+        self.assertEqual(self.cookie_quantities(), {})
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_checkout(self):
+        self.fill_cart(self.buyer)
+        self.assertWithinQueryBudget(reverse('cart:checkout'), user=self.buyer)
+        response = self.assertWithinQueryBudget(reverse('cart:checkout'), method='post',
+                                                data={'shipping_address': '1 Main Street'}, status=302)
+        order = Order.objects.get(user=self.buyer, shipping_address='1 Main Street')
+        self.assertEqual(response.url, reverse('cart:order_complete', args=[order.order_number]))
+        self.assertEqual(order.items.count(), len(self.in_stock))
+        self.assertEqual(self.cart_quantities(), {})
+        self.assertContains(self.assertWithinQueryBudget(response.url), order.order_number)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CartSummaryTests(TestCase):
+    """The cached cart summary is dropped whenever the cart or a product price changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(orders=0)
+        cls.first, cls.second = [product for product in cls.products if product.is_active and product.stock > 2][:2]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.buyer)
+
+    def assertSummary(self, lines, quantity, total):
+        summary = get_cart_summary(self.buyer)
+        self.assertEqual((summary['lines'], summary['quantity'], summary['total']), (lines, quantity, total))
+        # The second read is a cache hit
+        with CaptureQueriesContext(connection) as captured:
+            get_cart_summary(self.buyer)
+        self.assertEqual(len(captured), 0)
+
+    def test_cart_changes(self):
+        self.assertSummary(0, 0, Decimal('0.00'))
+        add_item(self.buyer, self.first.id)
+        add_item(self.buyer, self.first.id)
+        self.assertSummary(1, 2, 2 * self.first.price)
+        self.client.post(reverse('cart:add_to_cart', args=[self.second.id]))
+        self.assertSummary(2, 3, 2 * self.first.price + self.second.price)
+
+        self.client.post(reverse('cart:update_cart_item', args=[self.first.id]), {'quantity': 1})
+        self.assertSummary(2, 2, self.first.price + self.second.price)
+        self.client.post(reverse('cart:remove_from_cart', args=[self.second.id]))
+        self.assertSummary(1, 1, self.first.price)
+        self.client.post(reverse('cart:clear_cart'))
+        self.assertSummary(0, 0, Decimal('0.00'))
+
+    def test_price_change(self):
+        add_item(self.buyer, self.first.id)
+        self.assertSummary(1, 1, self.first.price)
+        self.first.price = Decimal('99.00')
+        self.first.save()
+        self.assertSummary(1, 1, Decimal('99.00'))
+
+    def test_cart_deleted(self):
+        add_item(self.buyer, self.first.id)
+        self.assertSummary(1, 1, self.first.price)
+        Cart.objects.get(user=self.buyer).delete()
+        self.assertFalse(CartItem.objects.exists())
+        self.assertSummary(0, 0, Decimal('0.00'))
+
+
+@override_settings(CACHES=NO_CACHE)
+class CartSnapshotTests(TestCase):
+    """CartSnapshot totals and line count follow adds, quantity changes and removals"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(orders=0)
+        cls.first, cls.second = [product for product in cls.products if product.is_active and product.stock > 2][:2]
+
+    def setUp(self):
+        self.client.force_login(self.buyer)
+
+    def snapshot(self):
+        cart = Cart.objects.filter(user=self.buyer).first()
+        return CartSnapshot.for_cart(cart) if cart else CartSnapshot([])
+
+    def assertSnapshot(self, lines, quantity, total):
+        snapshot = self.snapshot()
+        self.assertEqual((len(snapshot), snapshot.total_quantity, snapshot.total_price), (lines, quantity, total))
+        self.assertEqual(bool(snapshot), lines > 0)
+        self.assertEqual(sum((line.total_price for line in snapshot), Decimal('0.00')), total)
+        # The async loader builds the same snapshot
+        snapshot = async_to_sync(CartSnapshot.afor_user)(self.buyer)
+        self.assertEqual((len(snapshot), snapshot.total_quantity, snapshot.total_price), (lines, quantity, total))
+        return snapshot
+
+    def test_add_change_remove(self):
+        self.assertSnapshot(0, 0, Decimal('0.00'))
+        self.client.post(reverse('cart:add_to_cart', args=[self.first.id]))
+        self.client.post(reverse('cart:add_to_cart', args=[self.first.id]))
+        self.client.post(reverse('cart:add_to_cart', args=[self.second.id]))
+        snapshot = self.assertSnapshot(2, 3, 2 * self.first.price + self.second.price)
+        self.assertEqual([(line.product.id, line.quantity, line.total_price) for line in snapshot],
+                         [(self.first.id, 2, 2 * self.first.price), (self.second.id, 1, self.second.price)])
+
+        self.client.post(reverse('cart:update_cart_item', args=[self.second.id]), {'quantity': 3})
+        self.assertSnapshot(2, 5, 2 * self.first.price + 3 * self.second.price)
+        self.client.post(reverse('cart:remove_from_cart', args=[self.first.id]))
+        self.assertSnapshot(1, 3, 3 * self.second.price)
+        self.client.post(reverse('cart:remove_from_cart', args=[self.second.id]))
+        self.assertSnapshot(0, 0, Decimal('0.00'))
+
+    def test_one_query(self):
+        for product in (self.first, self.second):
+            add_item(self.buyer, product.id)
+        cart = Cart.objects.get(user=self.buyer)
+        with self.assertNumQueries(1):
+            snapshot = CartSnapshot.for_cart(cart)
+            # Products and categories come with the lines
+            self.assertTrue(all(line.product.category.name for line in snapshot))
+
+
+@override_settings(CACHES=NO_CACHE)
+class CartCurrencyTests(TestCase):
+    """The cart, checkout and badge show prices in the visitor's currency, converted per unit like the listings"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(orders=0)
+        cls.first, cls.second = [product for product in cls.products if product.is_active and product.stock > 2][:2]
+        # A rate where converting the total once would round differently from the lines
+        Currency.objects.create(code='EUR', name='Euro', symbol='€', rate=Decimal('0.3333'))
+
+    def euros(self, amount):
+        return (amount * Decimal('0.3333')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    def expected(self):
+        lines = [(self.euros(self.first.price), 2), (self.euros(self.second.price), 1)]
+        return lines, sum(unit * quantity for unit, quantity in lines)
+
+    def switch(self):
+        self.client.post(reverse('store:set_currency', args=['EUR']))
+
+    def assertEuroPage(self, response, total):
+        self.assertContains(response, f'€{total:,.2f}')
+        self.assertNotContains(response, f'${total:,.2f}')
+        self.assertEqual(response.context['cart_total'], f'€{total:,.2f}')
+        self.assertEqual(response.context['cart_currency_code'], 'EUR')
+
+    def test_signed_in(self):
+        self.client.force_login(self.buyer)
+        add_item(self.buyer, self.first.id, quantity=2)
+        add_item(self.buyer, self.second.id)
+        self.switch()
+        lines, total = self.expected()
+
+        response = self.client.get(reverse('cart:cart_view'))
+        for unit, quantity in lines:
+            self.assertContains(response, f'€{unit:,.2f}')
+            self.assertContains(response, f'€{unit * quantity:,.2f}')
+        self.assertEuroPage(response, total)
+
+        response = self.client.get(reverse('cart:checkout'))
+        self.assertEuroPage(response, total)
+        # Orders are still charged in the base currency
+        base_total = 2 * self.first.price + self.second.price
+        self.assertContains(response, f'Charged in {settings.CURRENCY_CODE}: {settings.CURRENCY_SYMBOL}{base_total:,.2f}')
+        self.assertEqual(response.context['cart_total_raw'], base_total)
+
+    def test_cookie_cart(self):
+        for product in (self.first, self.first, self.second):
+            self.client.post(reverse('cart:add_to_cart', args=[product.id]))
+        self.switch()
+        _, total = self.expected()
+        self.assertEuroPage(self.client.get(reverse('cart:cart_view')), total)
+        self.assertEqual(self.client.get(reverse('store:home')).context['cart_total'], f'€{total:,.2f}')
+
+    def test_base_currency(self):
+        self.client.force_login(self.buyer)
+        add_item(self.buyer, self.first.id)
+        response = self.client.get(reverse('cart:cart_view'))
+        self.assertContains(response, f'{settings.CURRENCY_SYMBOL}{self.first.price:,.2f}')
+        self.assertEqual(response.context['cart_total'], f'{settings.CURRENCY_SYMBOL}{self.first.price:,.2f}')
+        self.assertNotContains(self.client.get(reverse('cart:checkout')), 'Charged in')
+
+
+@override_settings(CACHES=NO_CACHE)
+class CheckoutTests(TestCase):
+    """place_order turns a cart into an order atomically, in a fixed number of queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(orders=0)
+        cls.in_stock = [product for product in cls.products if product.is_active and product.stock > 2]
+
+    def fill_cart(self, products, quantity=1):
+        cart, _ = Cart.objects.get_or_create(user=self.buyer)
+        for product in products:
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+        return cart
+
+    def stock(self, products):
+        return list(Product.objects.filter(id__in=[p.id for p in products]).order_by('id').values_list('stock', flat=True))
+
+    def test_order_placed(self):
+        products = self.in_stock[:3]
+        self.fill_cart(products, quantity=2)
+        before = self.stock(products)
+        order = place_order(self.buyer, '1 Main Street')
+
+        self.assertEqual(order.total_amount, sum(2 * product.price for product in products))
+        self.assertEqual(
+            sorted(OrderItem.objects.filter(order=order).values_list('product_id', 'quantity', 'price')),
+            sorted((product.id, 2, product.price) for product in products),
+        )
+        self.assertEqual(self.stock(products), [stock - 2 for stock in before])
+        self.assertFalse(CartItem.objects.filter(cart__user=self.buyer).exists())
+
+    def test_insufficient_stock_rolls_back(self):
+        plenty, short = self.in_stock[-1], self.in_stock[0]
+        cart = self.fill_cart([plenty])
+        CartItem.objects.create(cart=cart, product=short, quantity=short.stock + 1)
+        before = self.stock([plenty, short])
+
+        with self.assertRaises(InsufficientStock) as raised:
+            place_order(self.buyer, '1 Main Street')
+        self.assertEqual(raised.exception.products, [short])
+        # The UPDATE that covered the other line is rolled back with the order
+        self.assertEqual(self.stock([plenty, short]), before)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.filter(cart=cart).count(), 2)
+
+    def test_inactive_product(self):
+        product = self.in_stock[0]
+        self.fill_cart([product])
+        Product.objects.filter(id=product.id).update(is_active=False)
+        with self.assertRaises(InsufficientStock):
+            place_order(self.buyer, '1 Main Street')
+        self.assertFalse(Order.objects.exists())
+
+    def test_empty_cart(self):
+        with self.assertRaises(EmptyCart):
+            place_order(self.buyer, '1 Main Street')
+        Cart.objects.create(user=self.buyer)
+        with self.assertRaises(EmptyCart):
+            place_order(self.buyer, '1 Main Street')
+        self.assertFalse(Order.objects.exists())
+
+    def count_checkout_queries(self, lines):
+        CartItem.objects.filter(cart__user=self.buyer).delete()
+        self.fill_cart(self.in_stock[:lines])
+        with CaptureQueriesContext(connection) as captured:
+            place_order(self.buyer, '1 Main Street')
+        return len(captured)
+
+    def test_constant_queries(self):
+        self.assertEqual(self.count_checkout_queries(1), self.count_checkout_queries(8))
+
+
+@override_settings(CACHES=NO_CACHE)
+class AddItemTests(TestCase):
+    """add_item upserts one cart line, guarded by stock and the product's state"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(orders=0)
+        cls.product = next(product for product in cls.products if product.is_active and product.stock == 3)
+        cls.inactive = next(product for product in cls.products if not product.is_active)
+
+    def quantity(self, product):
+        return CartItem.objects.filter(cart__user=self.buyer, product=product).values_list('quantity', flat=True).first()
+
+    def test_increments_existing_line(self):
+        self.assertEqual(add_item(self.buyer, self.product.id), (self.product.name, 1))
+        self.assertEqual(add_item(self.buyer, self.product.id, quantity=2), (self.product.name, 3))
+        self.assertEqual(CartItem.objects.filter(cart__user=self.buyer).count(), 1)
+        self.assertEqual(self.quantity(self.product), 3)
+
+    def test_stock_guard(self):
+        self.assertIsNone(add_item(self.buyer, self.product.id, quantity=4))
+        self.assertIsNone(self.quantity(self.product))
+        add_item(self.buyer, self.product.id, quantity=2)
+        self.assertIsNone(add_item(self.buyer, self.product.id, quantity=2))
+        self.assertEqual(self.quantity(self.product), 2)
+
+    def test_invalid_product_writes_nothing(self):
+        for product_id in (self.inactive.id, 999999):
+            with self.assertRaises(Product.DoesNotExist):
+                add_item(self.buyer, product_id)
+        self.assertFalse(Cart.objects.exists())
+
+        self.client.force_login(self.buyer)
+        response = self.client.post(reverse('cart:add_to_cart', args=[self.inactive.id]))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_view_reports_short_stock(self):
+        self.client.force_login(self.buyer)
+        add_item(self.buyer, self.product.id, quantity=3)
+        response = self.client.post(reverse('cart:add_to_cart', args=[self.product.id]), follow=True)
+        self.assertContains(response, f'Sorry, not enough {self.product.name} in stock.')
+        self.assertEqual(self.quantity(self.product), 3)
+
+
+@override_settings(CACHES=NO_CACHE)
+class CookieCartTests(QueryBudgetTestMixin, TestCase):
+    """The anonymous cart lives in a signed cookie and moves into the database cart at login"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(orders=0)
+        cls.short = next(product for product in cls.products if product.is_active and product.stock == 3)
+        cls.plenty = next(product for product in cls.products if product.is_active and product.stock > 10)
+        cls.inactive = next(product for product in cls.products if not product.is_active)
+
+    def cookie_request(self, value):
+        request = RequestFactory().get('/')
+        request.COOKIES[settings.CART_COOKIE_NAME] = value
+        return request
+
+    def signed_value(self, quantities):
+        cart = CookieCart(RequestFactory().get('/'))
+        cart.quantities = quantities
+        response = HttpResponse()
+        cart.save(response)
+        return response.cookies[settings.CART_COOKIE_NAME].value
+
+    def test_signed_round_trip(self):
+        value = self.signed_value({self.short.id: 2, self.plenty.id: 1})
+        self.assertEqual(CookieCart(self.cookie_request(value)).quantities, {self.short.id: 2, self.plenty.id: 1})
+
+    def test_tampered_cookie_is_empty(self):
+        value = self.signed_value({self.short.id: 2})
+        tampered = value.replace(':2}', ':9}')
+        self.assertNotEqual(tampered, value)
+        for raw in (tampered, f'{{"{self.short.id}":9}}', 'garbage'):
+            self.assertFalse(CookieCart(self.cookie_request(raw)), raw)
+
+    def test_add_checks_stock_and_product(self):
+        cart = CookieCart(RequestFactory().get('/'))
+        self.assertEqual(cart.add(self.short.id, 3), (self.short.name, 3))
+        self.assertIsNone(cart.add(self.short.id))
+        with self.assertRaises(Product.DoesNotExist):
+            cart.add(self.inactive.id)
+        self.assertEqual(cart.quantities, {self.short.id: 3})
+
+    def test_merge_at_login(self):
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=self.short, quantity=2)
+        CartItem.objects.create(cart=cart, product=self.plenty, quantity=1)
+        for product in (self.short, self.short, self.plenty):
+            self.client.post(reverse('cart:add_to_cart', args=[product.id]))
+        self.assertFalse(CartItem.objects.filter(cart=cart, quantity__gt=2).exists())
+
+        response = self.assertWithinQueryBudget(reverse('users:login'), method='post',
+                                                data={'username': self.buyer.username, 'password': 'pw'}, status=302)
+        self.assertRedirects(response, reverse('store:home'), fetch_redirect_response=False)
+        self.assertEqual(response.cookies[settings.CART_COOKIE_NAME].value, '')
+        self.assertEqual(dict(CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity')), {
+            # 2 in the database plus 2 from the cookie, capped at the 3 in stock
+            self.short.id: 3,
+            self.plenty.id: 2,
+        })
+
+    def test_merge_skips_unavailable(self):
+        sold_out = self.short
+        Product.objects.filter(id=sold_out.id).update(stock=0)
+        value = self.signed_value({self.plenty.id: 2, self.inactive.id: 1, sold_out.id: 1})
+        self.client.cookies[settings.CART_COOKIE_NAME] = value
+        self.client.post(reverse('users:login'), {'username': self.buyer.username, 'password': 'pw'})
+        self.assertEqual(dict(CartItem.objects.filter(cart__user=self.buyer).values_list('product_id', 'quantity')),
+                         {self.plenty.id: 2})
+
+    def test_merge_at_registration(self):
+        self.client.post(reverse('cart:add_to_cart', args=[self.plenty.id]))
+        response = self.assertWithinQueryBudget(reverse('users:register'), method='post', data={
+            'username': 'newcomer', 'email': 'newcomer@example.com', 'user_type': 'customer',
+            'password1': 'a-long-Passw0rd', 'password2': 'a-long-Passw0rd',
+        }, status=302)
+        self.assertRedirects(response, reverse('store:home'), fetch_redirect_response=False)
+        self.assertEqual(list(CartItem.objects.filter(cart__user__username='newcomer').values_list('product_id', 'quantity')),
+                         [(self.plenty.id, 1)])
@@ -6,7 +6,9 @@ app_name = 'cart'
 urlpatterns = [
     path('', views.cart_view, name='cart_view'),
     path('add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
-    path('remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
-    path('update/<int:item_id>/', views.update_cart_item, name='update_cart_item'),
+    path('remove/<int:product_id>/', views.remove_from_cart, name='remove_from_cart'),
+    path('update/<int:product_id>/', views.update_cart_item, name='update_cart_item'),
     path('clear/', views.clear_cart, name='clear_cart'),
+    path('checkout/', views.checkout, name='checkout'),
+    path('order/<str:order_number>/', views.order_complete, name='order_complete'),
 ]
\ No newline at end of file
@@ -1,75 +1,172 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.http import Http404
 from .models import Cart, CartItem
-from store.models import Product
+from .cookie import CookieCart
+from .summary import CartSnapshot
+from .forms import CheckoutForm
+from .checkout import place_order, EmptyCart, InsufficientStock
+from .operations import add_item
+from store.models import Order, Product
+from store.async_context import arender
+from store.currency import aget_active_currency, get_active_currency
+from store.querybudget import query_budget
 
-@login_required
-def cart_view(request):
+@query_budget(9)
+async def cart_view(request):
     """
-    Display shopping cart
+    Display shopping cart. Looking at the cart never creates one.
     """
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    return render(request, 'cart/cart.html', {'cart': cart})
+    user = await request.auser()
+    currency = await aget_active_currency(request)
+    if user.is_authenticated:
+        snapshot = await CartSnapshot.afor_user(user, currency)
+    else:
+        snapshot = (await CookieCart(request).asnapshot()).in_currency(currency)
+    return await arender(request, 'cart/cart.html', {'snapshot': snapshot})
 
-@login_required
+@query_budget(8)
 def add_to_cart(request, product_id):
     """
     Add product to cart
     """
-    product = get_object_or_404(Product, id=product_id, is_active=True)
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart, 
-        product=product
-    )
-    
-    if not created:
-        cart_item.quantity += 1
-        cart_item.save()
-        messages.success(request, f'Updated {product.name} quantity in cart.')
+    cookie_cart = None
+    try:
+        if request.user.is_authenticated:
+            added = add_item(request.user, product_id)
+        else:
+            cookie_cart = CookieCart(request)
+            added = cookie_cart.add(product_id)
+    except Product.DoesNotExist:
+        raise Http404("No Product matches the given query.")
+
+    if added is None:
+        product = get_object_or_404(Product, id=product_id, is_active=True)
+        messages.error(request, f'Sorry, not enough {product.name} in stock.')
+        return redirect('cart:cart_view')
+
+    product_name, quantity = added
+    if quantity > 1:
+        messages.success(request, f'Updated {product_name} quantity in cart.')
     else:
-        messages.success(request, f'Added {product.name} to cart.')
+        messages.success(request, f'Added {product_name} to cart.')
     
-    return redirect('cart:cart_view')
+    response = redirect('cart:cart_view')
+    if cookie_cart is not None:
+        cookie_cart.save(response)
+    return response
 
-@login_required
-def remove_from_cart(request, item_id):
+@query_budget(6)
+def remove_from_cart(request, product_id):
     """
     Remove item from cart
     """
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    product_name = cart_item.product.name
-    cart_item.delete()
-    messages.success(request, f'Removed {product_name} from cart.')
-    return redirect('cart:cart_view')
+    response = redirect('cart:cart_view')
+    if request.user.is_authenticated:
+        cart_item = get_object_or_404(
+            CartItem.objects.select_related('cart', 'product'), product_id=product_id, cart__user=request.user
+        )
+        product_name = cart_item.product.name
+        cart_item.delete()
+        messages.success(request, f'Removed {product_name} from cart.')
+    else:
+        cookie_cart = CookieCart(request)
+        cookie_cart.remove(product_id)
+        cookie_cart.save(response)
+        messages.success(request, 'Item removed from cart.')
+    return response
 
-@login_required
-def update_cart_item(request, item_id):
+@query_budget(6)
+def update_cart_item(request, product_id):
     """
     Update cart item quantity
     """
+    response = redirect('cart:cart_view')
     if request.method == 'POST':
-        quantity = int(request.POST.get('quantity', 1))
-        cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-        
-        if quantity > 0:
-            cart_item.quantity = quantity
-            cart_item.save()
-            messages.success(request, 'Cart updated successfully.')
+        try:
+            quantity = int(request.POST.get('quantity', 1))
+        except ValueError:
+            messages.error(request, 'Please enter a valid quantity.')
+            return response
+
+        if request.user.is_authenticated:
+            cart_item = get_object_or_404(
+                CartItem.objects.select_related('cart', 'product'), product_id=product_id, cart__user=request.user
+            )
+            if quantity > cart_item.product.stock:
+                messages.error(request, f'Only {cart_item.product.stock} {cart_item.product.name} left in stock.')
+            elif quantity > 0:
+                cart_item.quantity = quantity
+                cart_item.save()
+                messages.success(request, 'Cart updated successfully.')
+            else:
+                cart_item.delete()
+                messages.success(request, 'Item removed from cart.')
         else:
-            cart_item.delete()
-            messages.success(request, 'Item removed from cart.')
+            cookie_cart = CookieCart(request)
+            product = get_object_or_404(Product, id=product_id, is_active=True)
+            if quantity > product.stock:
+                messages.error(request, f'Only {product.stock} {product.name} left in stock.')
+            else:
+                cookie_cart.update(product_id, quantity)
+                cookie_cart.save(response)
+                messages.success(request, 'Cart updated successfully.')
     
-    return redirect('cart:cart_view')
+    return response
 
-@login_required
+@query_budget(6)
 def clear_cart(request):
     """
     Clear all items from cart
     """
-    cart = get_object_or_404(Cart, user=request.user)
-    cart.items.all().delete()
+    response = redirect('cart:cart_view')
+    if request.user.is_authenticated:
+        cart = Cart.objects.filter(user=request.user).first()
+        if cart:
+            cart.items.all().delete()
+    else:
+        cookie_cart = CookieCart(request)
+        cookie_cart.clear()
+        cookie_cart.save(response)
     messages.success(request, 'Cart cleared successfully.')
-    return redirect('cart:cart_view')
\ No newline at end of file
+    return response
+
+@query_budget(20)
+@login_required
+def checkout(request):
+    """
+    Confirm the shipping address and place the order
+    """
+    if request.method == 'POST':
+        form = CheckoutForm(request.POST)
+        if form.is_valid():
+            try:
+                order = place_order(request.user, form.cleaned_data['shipping_address'])
+            except InsufficientStock as e:
+                messages.error(request, str(e))
+                return redirect('cart:cart_view')
+            except EmptyCart as e:
+                messages.info(request, str(e))
+                return redirect('cart:cart_view')
+            messages.success(request, f'Order {order.order_number} placed successfully.')
+            return redirect('cart:order_complete', order_number=order.order_number)
+    else:
+        form = CheckoutForm(initial={'shipping_address': request.user.address})
+
+    cart = Cart.objects.filter(user=request.user).first()
+    currency = get_active_currency(request)
+    snapshot = CartSnapshot.for_cart(cart, currency) if cart else CartSnapshot([], currency)
+    if not snapshot:
+        messages.info(request, 'Your cart is empty.')
+        return redirect('cart:cart_view')
+    return render(request, 'cart/checkout.html', {'form': form, 'snapshot': snapshot})
+
+@query_budget(9)
+@login_required
+def order_complete(request, order_number):
+    """
+    Order confirmation page
+    """
+    order = get_object_or_404(Order, order_number=order_number, user=request.user)
+    return render(request, 'cart/order_complete.html', {'order': order})
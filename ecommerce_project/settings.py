@@ -30,6 +30,8 @@ INSTALLED_APPS = [
     'store',
     'cart',
     'contact',  # Your contact app
+    'jobs',
+    'api',  # Read-only JSON catalog API under /api/
     
     # Third party apps
     'crispy_forms',
@@ -38,6 +40,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'store.querybudget.QueryBudgetMiddleware',  # Active when QUERY_BUDGET_ENABLED
+    'store.db.ReplicaPinMiddleware',  # Active when a replica database is configured
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -67,7 +71,16 @@ TEMPLATES = [
     },
 ]
 
+# Async equivalents of the custom context processors, run up front by
+# store.async_context.arender() since async views cannot query while rendering
+ASYNC_CONTEXT_PROCESSORS = [
+    'store.context_processors.acategories',
+    'store.context_processors.acurrency_settings',
+    'cart.context_processors.acart',
+]
+
 WSGI_APPLICATION = 'ecommerce_project.wsgi.application'
+ASGI_APPLICATION = 'ecommerce_project.asgi.application'
 
 # Database
 DATABASES = {
@@ -77,6 +90,67 @@ DATABASES = {
     }
 }
 
+# ========== DATABASE PROFILE ==========
+# DJANGO_DB_PROFILE=production turns on WAL and tuned pragmas, keeps connections
+# open between requests and serves catalog reads from a replica file. Create the
+# replica before starting the server and keep it current with:
+#   python manage.py sync_replica --every 30
+DB_PROFILE = os.environ.get('DJANGO_DB_PROFILE', 'development')
+SQLITE_PRAGMAS = {}             # Run on every new SQLite connection
+REPLICA_DATABASE = 'replica'
+REPLICA_READ_MODELS = ['store.category', 'store.product', 'store.productprice', 'store.currency',
+                       'store.categoryfacetcount', 'store.productrecommendation']
+REPLICA_PIN_APPS = ['cart', 'store']  # Writes here pin the visitor to the primary
+REPLICA_PIN_COOKIE = 'db_pin'
+REPLICA_SYNC_INTERVAL = 30      # Seconds between sync_replica runs
+REPLICA_PIN_SECONDS = 2 * REPLICA_SYNC_INTERVAL  # Also how long reads skip the replica after a cache bump
+
+if DB_PROFILE == 'production':
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',          # Readers no longer wait for cart and checkout writes
+        'synchronous': 'NORMAL',        # Safe with WAL; fsync at checkpoints only
+        'busy_timeout': 5000,           # Milliseconds to wait for the write lock
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -32000,           # KiB of page cache per connection
+        'temp_store': 'MEMORY',
+    }
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        # Take the write lock at BEGIN so busy_timeout applies instead of failing on upgrade
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+    })
+    DATABASES[REPLICA_DATABASE] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db-replica.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'PRAGMAS': {'query_only': 'ON'},
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['store.db.ReplicaRouter']
+# ======================================
+
+# Cache
+# Catalog pages and version stamps live here. Version bumps come from the web
+# workers, the job worker and the offline commands (build_recommendations,
+# import_products, rebuild_facet_counts, build_image_derivatives), so every
+# process must share one cache: the development LocMemCache only suits
+# runserver with those commands run in the same process or not at all.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecommerce',
+    }
+}
+if DB_PROFILE == 'production':
+    # Shared by every process on this host; use Redis/Memcached across hosts
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('DJANGO_CACHE_DIR', BASE_DIR / 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',},
@@ -99,6 +173,51 @@ CURRENCY_SYMBOL_HTML = '$'      # Dollar symbol
 DECIMAL_PLACES = 2              # Decimal places for prices
 # ===========================================
 
+# ========== CATALOG SETTINGS ==========
+SEARCH_RESULT_LIMIT = 500       # Max ranked matches returned by the search index
+PRODUCTS_PER_PAGE = 24          # Product cards per listing page
+ORDERS_PER_PAGE = 10            # Orders per order history page
+PAGE_CACHE_TIMEOUT = 60 * 60    # Seconds; pages are invalidated by model signals well before this
+CART_COOKIE_NAME = 'cart'       # Signed cookie holding anonymous visitors' carts
+CART_COOKIE_AGE = 60 * 60 * 24 * 30
+LOW_STOCK_THRESHOLD = 10        # Vendor dashboard flags products at or below this stock
+# Upper bounds of the listing's price filter bands in the base currency; the last band is open-ended.
+# Run `manage.py rebuild_facet_counts` after changing them.
+FACET_PRICE_BANDS = [25, 50, 100, 250, 500, 1000]
+FACET_VENDOR_LIMIT = 10         # Vendors listed in the filter sidebar, most products first
+RECOMMENDATIONS_PER_PRODUCT = 4 # Products recommended on each detail page
+RECOMMENDATIONS_MIN_ORDERS = 2  # Orders two products must share to count as bought together
+RECOMMENDATIONS_ORDER_DAYS = 365  # Orders older than this do not count towards co-purchases
+# ======================================
+
+# ========== API SETTINGS ==========
+API_PAGE_SIZE = 50              # Products per listing page unless ?limit= asks for fewer or more
+API_MAX_PAGE_SIZE = 500         # Largest ?limit=; listing pages are streamed, not built in memory
+API_BATCH_LIMIT = 100           # Most ids or slugs one ?ids= / ?slugs= lookup accepts
+# ==================================
+
+# ========== BENCHMARK PROFILE ==========
+# DJANGO_BENCHMARK=1 installs the benchmark app and its seed_benchmark /
+# run_benchmark commands; leave it unset on deployed sites
+if os.environ.get('DJANGO_BENCHMARK') == '1':
+    INSTALLED_APPS.append('benchmark')
+# =======================================
+
+# ========== QUERY BUDGETS ==========
+# Count queries per view, log views over their @query_budget and send a Server-Timing header
+QUERY_BUDGET_ENABLED = DEBUG
+# ===================================
+
+# ========== JOB QUEUE SETTINGS ==========
+# Run the worker with: python manage.py run_jobs
+JOBS_BATCH_SIZE = 50            # Jobs claimed per round; queued emails share one SMTP connection
+JOBS_MAX_ATTEMPTS = 5           # Attempts before a job moves to the dead-letter table
+JOBS_RETRY_BACKOFF = 30         # Seconds before the first retry, doubled on each attempt
+JOBS_RETRY_BACKOFF_MAX = 60 * 60
+JOBS_LOCK_TIMEOUT = 60 * 10     # Running jobs older than this are assumed lost and requeued
+JOBS_POLL_INTERVAL = 2          # Seconds the worker sleeps when no jobs are due
+# ========================================
+
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
@@ -112,6 +231,7 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Authentication settings
+AUTHENTICATION_BACKENDS = ['users.backends.EmailOrUsernameBackend']  # Username or email login
 LOGIN_REDIRECT_URL = 'store:home'
 LOGOUT_REDIRECT_URL = 'store:home'
 LOGIN_URL = 'users:login'
@@ -9,6 +9,7 @@ urlpatterns = [
     path('users/', include('users.urls', namespace='users')),
     path('cart/', include('cart.urls', namespace='cart')),
     path('contact/', include('contact.urls')),
+    path('api/', include('api.urls', namespace='api')),
 
 
 ]
@@ -0,0 +1,25 @@
+from django.contrib import admin
+
+from .models import DeadLetter, Job
+from .queue import retry_dead_letters
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'max_attempts', 'run_at', 'created_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['locked_at', 'last_error', 'created_at']
+
+
+@admin.register(DeadLetter)
+class DeadLetterAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'attempts', 'created_at', 'failed_at']
+    list_filter = ['name']
+    readonly_fields = ['name', 'payload', 'attempts', 'error', 'created_at', 'failed_at']
+    actions = ['retry']
+
+    @admin.action(description="Retry selected jobs")
+    def retry(self, request, queryset):
+        count = queryset.count()
+        retry_dead_letters(queryset)
+        self.message_user(request, f"{count} job(s) queued again.")
@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs import queue
+
+
+class Command(BaseCommand):
+    help = 'Run the background job worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.JOBS_BATCH_SIZE,
+                            help='Jobs claimed per round')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once no jobs are due instead of polling')
+
+    def handle(self, *args, **options):
+        succeeded = failed = 0
+        try:
+            while True:
+                queue.release_stale()
+                jobs = queue.claim(options['batch_size'])
+                if not jobs:
+                    if options['burst']:
+                        break
+                    time.sleep(settings.JOBS_POLL_INTERVAL)
+                    continue
+                ok, bad = queue.run_jobs(jobs)
+                succeeded += ok
+                failed += bad
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'Ran {len(jobs)} jobs: {ok} succeeded, {bad} failed')
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Worker stopped: {succeeded} succeeded, {failed} failed.'))
@@ -0,0 +1,136 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DeadLetter, Job
+
+logger = logging.getLogger(__name__)
+
+# name -> handler(payloads) returning one error (or None) per payload
+_handlers = {}
+
+
+# ============ REGISTRY ============
+def register(name):
+    """
+    Register a job handler. Handlers receive a list of payloads claimed in one
+    batch and return a list of the same length holding None for every payload
+    that succeeded and the exception for every one that failed.
+    """
+    def decorator(func):
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def get_handler(name):
+    return _handlers.get(name)
+
+
+# ============ PRODUCER ============
+def enqueue(name, payload=None, run_at=None, max_attempts=None):
+    """
+    Queue a job. Inside a transaction the job becomes visible to the worker
+    only when the transaction commits.
+    """
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+
+
+# ============ WORKER ============
+def backoff(attempts):
+    """Seconds to wait before the next attempt: base * 2^(attempts-1), capped"""
+    return min(settings.JOBS_RETRY_BACKOFF * 2 ** max(attempts - 1, 0), settings.JOBS_RETRY_BACKOFF_MAX)
+
+
+def release_stale():
+    """Requeue jobs whose worker died while running them"""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    return Job.objects.filter(status='running', locked_at__lt=cutoff).update(status='queued', locked_at=None)
+
+
+def claim(limit):
+    """Lock up to `limit` due jobs for this worker and return them"""
+    now = timezone.now()
+    with transaction.atomic():
+        due = Job.objects.filter(status='queued', run_at__lte=now).order_by('run_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        # The status condition keeps two workers from claiming the same job
+        Job.objects.filter(id__in=ids, status='queued').update(
+            status='running', locked_at=now, attempts=F('attempts') + 1,
+        )
+        return list(Job.objects.filter(id__in=ids, status='running', locked_at=now).order_by('run_at', 'id'))
+
+
+def run_jobs(jobs):
+    """Run claimed jobs grouped by handler. Returns (succeeded, failed) counts."""
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job.name, []).append(job)
+
+    succeeded = failed = 0
+    for name, group in groups.items():
+        handler = get_handler(name)
+        if handler is None:
+            errors = [LookupError(f"No handler registered for job '{name}'")] * len(group)
+        else:
+            try:
+                errors = list(handler([job.payload for job in group]))
+                if len(errors) != len(group):
+                    # Results cannot be matched to jobs; zip() would leave the extra jobs running forever
+                    raise ValueError(f"Handler for '{name}' returned {len(errors)} results for {len(group)} jobs")
+            except Exception as e:
+                errors = [e] * len(group)
+
+        done = [job.id for job, error in zip(group, errors) if error is None]
+        Job.objects.filter(id__in=done).delete()
+        succeeded += len(done)
+        for job, error in zip(group, errors):
+            if error is not None:
+                _fail(job, error)
+                failed += 1
+    return succeeded, failed
+
+
+def _fail(job, error):
+    message = ''.join(traceback.format_exception(error)) if error.__traceback__ else repr(error)
+    if job.attempts >= job.max_attempts:
+        logger.error("Job %s #%s moved to dead letters after %s attempts: %r", job.name, job.pk, job.attempts, error)
+        with transaction.atomic():
+            DeadLetter.objects.create(
+                name=job.name,
+                payload=job.payload,
+                attempts=job.attempts,
+                error=message,
+                created_at=job.created_at,
+            )
+            job.delete()
+        return
+    Job.objects.filter(id=job.id).update(
+        status='queued',
+        locked_at=None,
+        last_error=message,
+        run_at=timezone.now() + timedelta(seconds=backoff(job.attempts)),
+    )
+    logger.warning("Job %s #%s failed (attempt %s), retrying: %r", job.name, job.pk, job.attempts, error)
+
+
+def retry_dead_letters(dead_letters):
+    """Move dead letters back onto the queue with a fresh set of attempts"""
+    with transaction.atomic():
+        for dead in dead_letters:
+            enqueue(dead.name, dead.payload)
+            dead.delete()
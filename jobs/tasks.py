@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+from .queue import enqueue, register
+
+SEND_MAIL = 'mail.send'
+
+
+def queue_mail(subject, message, recipient_list, from_email=None, html_message=None, reply_to=None):
+    """Queue an email for the job worker instead of sending it inside the request"""
+    return enqueue(SEND_MAIL, {
+        'subject': subject,
+        'message': message,
+        'from_email': from_email or settings.DEFAULT_FROM_EMAIL,
+        'recipient_list': list(recipient_list),
+        'html_message': html_message,
+        'reply_to': list(reply_to or []),
+    })
+
+
+@register(SEND_MAIL)
+def send_mail_batch(payloads):
+    """Send a batch of queued emails over a single SMTP connection"""
+    errors = []
+    with get_connection() as mail_connection:
+        for payload in payloads:
+            email = EmailMultiAlternatives(
+                subject=payload['subject'],
+                body=payload['message'],
+                from_email=payload.get('from_email'),
+                to=payload['recipient_list'],
+                reply_to=payload.get('reply_to') or None,
+                connection=mail_connection,
+            )
+            if payload.get('html_message'):
+                email.attach_alternative(payload['html_message'], 'text/html')
+            try:
+                email.send()
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+    return errors
@@ -0,0 +1,129 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import queue, tasks
+from .models import DeadLetter, Job
+
+FLAKY = 'tests.flaky'
+
+
+def fail_all(payloads):
+    return [RuntimeError(f"failed {payload['n']}") for payload in payloads]
+
+
+def fail_odd(payloads):
+    return [RuntimeError('odd') if payload['n'] % 2 else None for payload in payloads]
+
+
+@override_settings(JOBS_RETRY_BACKOFF=10, JOBS_RETRY_BACKOFF_MAX=25)
+class QueueTests(TestCase):
+    """Claiming, retrying and dead-lettering jobs"""
+
+    def handlers(self, **handlers):
+        patcher = mock.patch.dict(queue._handlers, handlers)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_due(self):
+        Job.objects.update(run_at=timezone.now() - timedelta(seconds=1))
+
+    def test_claim(self):
+        jobs = [queue.enqueue(FLAKY, {'n': n}) for n in range(3)]
+        later = queue.enqueue(FLAKY, {'n': 3}, run_at=timezone.now() + timedelta(hours=1))
+
+        claimed = queue.claim(2)
+        self.assertEqual([job.id for job in claimed], [jobs[0].id, jobs[1].id])
+        self.assertTrue(all(job.status == 'running' and job.attempts == 1 for job in claimed))
+        self.assertEqual([job.id for job in queue.claim(2)], [jobs[2].id])
+        self.assertEqual(queue.claim(2), [])
+        self.assertEqual(Job.objects.get(id=later.id).status, 'queued')
+
+    def test_release_stale(self):
+        queue.enqueue(FLAKY, {'n': 0})
+        queue.claim(1)
+        self.assertEqual(queue.release_stale(), 0)
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(queue.release_stale(), 1)
+        self.assertEqual(len(queue.claim(1)), 1)
+
+    def test_retry_backoff(self):
+        self.assertEqual([queue.backoff(attempts) for attempts in (1, 2, 3, 4)], [10, 20, 25, 25])
+        self.handlers(**{FLAKY: fail_odd})
+        for n in range(4):
+            queue.enqueue(FLAKY, {'n': n})
+
+        before = timezone.now()
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            self.assertEqual(queue.run_jobs(queue.claim(10)), (2, 2))
+        retried = Job.objects.all()
+        self.assertEqual(sorted(job.payload['n'] for job in retried), [1, 3])
+        for job in retried:
+            self.assertEqual((job.status, job.attempts, job.locked_at), ('queued', 1, None))
+            self.assertIn('odd', job.last_error)
+            self.assertGreaterEqual(job.run_at, before + timedelta(seconds=10))
+        self.assertEqual(queue.claim(10), [])
+
+        self.make_due()
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            queue.run_jobs(queue.claim(10))
+        self.assertTrue(all(job.run_at >= before + timedelta(seconds=20) for job in Job.objects.all()))
+
+    def test_dead_letter_after_max_attempts(self):
+        self.handlers(**{FLAKY: fail_all})
+        queue.enqueue(FLAKY, {'n': 7}, max_attempts=2)
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            queue.run_jobs(queue.claim(10))
+        self.assertEqual(DeadLetter.objects.count(), 0)
+        self.make_due()
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            self.assertEqual(queue.run_jobs(queue.claim(10)), (0, 1))
+
+        self.assertFalse(Job.objects.exists())
+        dead = DeadLetter.objects.get()
+        self.assertEqual((dead.name, dead.payload, dead.attempts), (FLAKY, {'n': 7}, 2))
+        self.assertIn('failed 7', dead.error)
+
+        queue.retry_dead_letters(DeadLetter.objects.all())
+        self.assertFalse(DeadLetter.objects.exists())
+        self.assertEqual(Job.objects.get().attempts, 0)
+
+    def test_wrong_result_count(self):
+        self.handlers(**{FLAKY: lambda payloads: [None]})
+        for n in range(3):
+            queue.enqueue(FLAKY, {'n': n})
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            self.assertEqual(queue.run_jobs(queue.claim(10)), (0, 3))
+        # Every job is requeued rather than left running
+        self.assertEqual(set(Job.objects.values_list('status', flat=True)), {'queued'})
+
+    def test_unknown_handler(self):
+        queue.enqueue('tests.missing')
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            self.assertEqual(queue.run_jobs(queue.claim(10)), (0, 1))
+        self.assertIn('No handler registered', Job.objects.get().last_error)
+
+
+class MailJobTests(TestCase):
+    """Queued emails are sent by the worker, a batch over one connection"""
+
+    def test_batched_send(self):
+        for n in range(3):
+            tasks.queue_mail(f'Subject {n}', 'Body', [f'user{n}@example.com'], html_message='<p>Body</p>')
+        self.assertEqual(len(mail.outbox), 0)
+
+        with mock.patch.object(tasks, 'get_connection', wraps=tasks.get_connection) as get_connection:
+            self.assertEqual(queue.run_jobs(queue.claim(10)), (3, 0))
+        get_connection.assert_called_once()
+        self.assertEqual([message.subject for message in mail.outbox], ['Subject 0', 'Subject 1', 'Subject 2'])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertFalse(Job.objects.exists())
+
+    def test_worker_burst(self):
+        tasks.queue_mail('Hello', 'Body', ['user@example.com'])
+        call_command('run_jobs', '--burst', verbosity=0, stdout=mock.Mock())
+        self.assertEqual(len(mail.outbox), 1)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Product, Order, OrderItem, ContactMessage
+from .models import Category, Product, Currency, Order, OrderItem, ContactMessage
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -17,6 +17,12 @@ class ProductAdmin(admin.ModelAdmin):
     raw_id_fields = ['vendor']
     date_hierarchy = 'created_at'
 
+@admin.register(Currency)
+class CurrencyAdmin(admin.ModelAdmin):
+    list_display = ['code', 'name', 'symbol', 'rate', 'decimal_places', 'is_enabled', 'updated_at']
+    list_editable = ['rate', 'is_enabled']
+    search_fields = ['code', 'name']
+
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     raw_id_fields = ['product']
@@ -3,4 +3,7 @@ from django.apps import AppConfig
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
-    verbose_name = 'Store'
\ No newline at end of file
+    verbose_name = 'Store'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,39 @@
+from functools import wraps
+
+from django.conf import settings
+from django.shortcuts import render
+from django.utils.module_loading import import_string
+
+# ============ ASYNC RENDERING ============
+# Templates render synchronously, and an async view must not touch the database
+# while they do. Async views therefore load the request's lazy session and user
+# and run the async context processors up front, then render with arender().
+# The sync context processors see the preloaded values and stand aside.
+
+
+async def aload_request(request):
+    """Resolve the lazy session and user so later reads stay off the database"""
+    if hasattr(request, 'session'):
+        await request.session.aitems()
+    if hasattr(request, 'auser'):
+        request.user = await request.auser()
+
+
+def preloadable(processor):
+    """Make a sync context processor return nothing when arender() already ran its async equivalent"""
+    @wraps(processor)
+    def wrapper(request):
+        if getattr(request, '_preloaded_context', False):
+            return {}
+        return processor(request)
+    return wrapper
+
+
+async def arender(request, template_name, context=None, status=None):
+    """render() for async views, with the ASYNC_CONTEXT_PROCESSORS values loaded beforehand"""
+    await aload_request(request)
+    preloaded = {}
+    for path in settings.ASYNC_CONTEXT_PROCESSORS:
+        preloaded.update(await import_string(path)(request))
+    request._preloaded_context = True
+    return render(request, template_name, {**preloaded, **(context or {})}, status=status)
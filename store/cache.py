@@ -0,0 +1,213 @@
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from . import db
+from .async_context import aload_request
+from .models import Category
+
+# ============ VERSION SCOPES ============
+# Cached data records the version of every scope it depends on. Saving a product
+# or category bumps its scopes, so stale entries stop matching immediately.
+CATALOG = 'catalog'
+CATEGORIES = 'categories'
+CURRENCIES = 'currencies'
+RECOMMENDATIONS = 'recommendations'
+
+
+def category_scope(category_id):
+    return f'category:{category_id}'
+
+
+def product_scope(product_slug):
+    return f'product:{product_slug}'
+
+
+def _version_key(scope):
+    return f'version:{scope}'
+
+
+def _new_version():
+    # Random, so an evicted stamp never matches old entries, and prefixed with
+    # the time it was made (see _check_replica_lag)
+    return f'{int(time.time())}:{uuid.uuid4().hex}'
+
+
+def _check_replica_lag(versions):
+    """
+    The read replica is copied every REPLICA_SYNC_INTERVAL, so for a while after
+    a bump it still holds the old data. Anything read then would be cached under
+    the new versions until the next bump; read it from the primary instead.
+    """
+    cutoff = time.time() - settings.REPLICA_PIN_SECONDS
+    for version in versions:
+        made_at, sep, _ = version.partition(':')
+        if sep and int(made_at) > cutoff:
+            db.read_from_primary()
+            return
+
+
+def get_versions(scopes):
+    """Return {scope: version} for the given scopes, creating missing ones"""
+    keys = {_version_key(scope): scope for scope in scopes}
+    found = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    _check_replica_lag(found.values())
+    return {keys[key]: version for key, version in found.items()}
+
+
+async def aget_versions(scopes):
+    """Async get_versions(), through the cache backend's async API"""
+    keys = {_version_key(scope): scope for scope in scopes}
+    found = await cache.aget_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        await cache.aset_many(missing, None)
+        found.update(missing)
+    _check_replica_lag(found.values())
+    return {keys[key]: version for key, version in found.items()}
+
+
+def bump(*scopes):
+    """Invalidate everything cached against the given scopes"""
+    cache.set_many({_version_key(scope): _new_version() for scope in scopes}, None)
+
+
+# ============ CATEGORY CACHE ============
+# (version, categories) for this process. Only the version stamp is read from the
+# shared cache per request; the list is reloaded when a Category signal bumps it,
+# from the primary while the replica may still lag behind that bump.
+_local_categories = (None, [])
+
+
+def get_categories():
+    """Return all categories from the process-local cache. Treat them as read-only."""
+    global _local_categories
+    version = get_versions([CATEGORIES])[CATEGORIES]
+    cached_version, categories = _local_categories
+    if cached_version != version:
+        categories = list(Category.objects.all())
+        _local_categories = (version, categories)
+    return categories
+
+
+async def aget_categories():
+    """Async get_categories()"""
+    global _local_categories
+    version = (await aget_versions([CATEGORIES]))[CATEGORIES]
+    cached_version, categories = _local_categories
+    if cached_version != version:
+        categories = [category async for category in Category.objects.all()]
+        _local_categories = (version, categories)
+    return categories
+
+
+# ============ PAGE CACHE ============
+def _is_cacheable(request):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if request.user.is_authenticated:
+        return False
+    # Visitors with a cookie cart see their own cart badge
+    if settings.CART_COOKIE_NAME in request.COOKIES:
+        return False
+    # Pending flash messages are per visitor
+    return len(get_messages(request)) == 0
+
+
+def _page_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    # Prices are rendered in the visitor's chosen currency (see store.currency)
+    currency = request.session.get('currency', '')
+    return f'page:{currency}:{path}'
+
+
+def depends_on(request, *scopes):
+    """
+    Declare the version scopes a cached page is built from.
+    Call it before running the queries that read the scoped data.
+    """
+    versions = getattr(request, '_page_cache_versions', None)
+    if versions is not None:
+        versions.update(get_versions(scopes))
+
+
+async def adepends_on(request, *scopes):
+    versions = getattr(request, '_page_cache_versions', None)
+    if versions is not None:
+        versions.update(await aget_versions(scopes))
+
+
+def _cached_response(entry):
+    return HttpResponse(entry['content'], content_type=entry['content_type'])
+
+
+def _cache_entry(request, response):
+    """The cache entry for a freshly rendered page, or None if it must not be cached"""
+    if response.status_code == 200 and not response.cookies and request._page_cache_versions:
+        return {
+            'versions': request._page_cache_versions,
+            'content': response.content,
+            'content_type': response['Content-Type'],
+        }
+    return None
+
+
+def cache_catalog_page(view_func):
+    """
+    Cache the rendered page for anonymous visitors until one of the
+    scopes declared with depends_on() is bumped by a model signal.
+    Async views get an async wrapper using the cache's async API.
+    """
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            # Resolve the session and user first so the checks below stay off the database
+            await aload_request(request)
+            if not _is_cacheable(request):
+                return await view_func(request, *args, **kwargs)
+
+            key = _page_key(request)
+            entry = await cache.aget(key)
+            if entry and await aget_versions(entry['versions']) == entry['versions']:
+                return _cached_response(entry)
+
+            request._page_cache_versions = {}
+            await adepends_on(request, CATEGORIES, CURRENCIES)
+            response = await view_func(request, *args, **kwargs)
+            entry = _cache_entry(request, response)
+            if entry:
+                await cache.aset(key, entry, settings.PAGE_CACHE_TIMEOUT)
+            return response
+        return async_wrapper
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not _is_cacheable(request):
+            return view_func(request, *args, **kwargs)
+
+        key = _page_key(request)
+        entry = cache.get(key)
+        if entry and get_versions(entry['versions']) == entry['versions']:
+            return _cached_response(entry)
+
+        request._page_cache_versions = {}
+        # Every page renders the category navigation and currency menu from base.html
+        depends_on(request, CATEGORIES, CURRENCIES)
+        response = view_func(request, *args, **kwargs)
+        entry = _cache_entry(request, response)
+        if entry:
+            cache.set(key, entry, settings.PAGE_CACHE_TIMEOUT)
+        return response
+    return wrapper
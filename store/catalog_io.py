@@ -0,0 +1,295 @@
+import csv
+import json
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import cache, currency, facets, search
+from .models import Category, Product
+
+User = get_user_model()
+
+FORMATS = ('csv', 'jsonl')
+
+# Columns read on import and written on export. Products are matched on slug;
+# category is a category slug (or name) and vendor a vendor's username.
+COLUMNS = ['slug', 'name', 'description', 'price', 'compare_price',
+           'category', 'vendor', 'stock', 'is_active', 'image']
+
+# Columns validated with the model field's own clean()
+FIELD_COLUMNS = ['name', 'description', 'price', 'compare_price', 'stock', 'is_active']
+
+REQUIRED_ON_CREATE = ['name', 'price', 'category']
+
+BOOLEAN_VALUES = {
+    'true': True, 't': True, 'yes': True, 'y': True, '1': True,
+    'false': False, 'f': False, 'no': False, 'n': False, '0': False,
+}
+
+BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 2000
+
+
+def guess_format(path):
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+# ============ READING ============
+def read_rows(stream, fmt):
+    """Yield (line_number, row_dict) from a CSV or JSONL text stream, one row at a time"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+            continue
+        yield line_number, row if isinstance(row, dict) else ValueError('expected a JSON object')
+
+
+# ============ IMPORT ============
+@dataclass
+class ImportResult:
+    created: int = 0
+    updated: int = 0
+    errors: list = field(default_factory=list)  # (line_number, message)
+
+
+class SlugAllocator:
+    """Hands out unique product slugs from the set of slugs already taken"""
+    max_length = Product._meta.get_field('slug').max_length
+
+    def __init__(self, taken):
+        self.taken = taken
+
+    def allocate(self, name):
+        base = slugify(name)[:self.max_length].strip('-') or 'product'
+        slug = base
+        n = 2
+        while slug in self.taken:
+            suffix = f'-{n}'
+            slug = base[:self.max_length - len(suffix)].strip('-') + suffix
+            n += 1
+        self.taken.add(slug)
+        return slug
+
+
+class ProductImporter:
+    """
+    Validate product rows and write them in batches: rows whose slug already
+    exists update that product, all others create a new one.
+
+    Categories and vendors are resolved from maps loaded once up front; each
+    batch costs one lookup query plus one bulk_create and one bulk_update.
+    Bulk writes skip model signals, so the search index, display prices and
+    page cache are refreshed here.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, default_vendor=None, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.result = ImportResult()
+        self.categories = {}
+        for category in Category.objects.all():
+            self.categories[category.slug] = category
+            self.categories.setdefault(category.name.lower(), category)
+        self.vendors = dict(User.objects.filter(user_type='vendor').values_list('username', 'id'))
+        self.default_vendor_id = None
+        if default_vendor is not None:
+            if default_vendor not in self.vendors:
+                raise ValueError(f"Unknown vendor '{default_vendor}'")
+            self.default_vendor_id = self.vendors[default_vendor]
+        self.existing_slugs = set(Product.objects.values_list('slug', flat=True).iterator())
+        self.slugs = SlugAllocator(set(self.existing_slugs))
+        self.seen_slugs = set()
+        self.touched_categories = set()
+
+    def run(self, rows):
+        batch = []
+        for line_number, row in rows:
+            cleaned = self.clean_row(line_number, row)
+            if cleaned is None:
+                continue
+            batch.append(cleaned)
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+        if not self.dry_run and (self.result.created or self.result.updated):
+            # Bulk writes send no Product signals
+            facets.rebuild(self.touched_categories)
+            cache.bump(cache.CATALOG, *(cache.category_scope(pk) for pk in self.touched_categories))
+        return self.result
+
+    # ---- validation ----
+    def clean_row(self, line_number, row):
+        """Return (slug, values) for a valid row, or record its errors and return None"""
+        if isinstance(row, Exception):
+            self.result.errors.append((line_number, str(row)))
+            return None
+
+        row = {key.strip(): value for key, value in row.items() if key}
+        errors = []
+        invalid = set()
+        values = {}
+        for name in FIELD_COLUMNS:
+            if name not in row:
+                continue
+            raw = row[name]
+            if isinstance(raw, str):
+                raw = raw.strip()
+            model_field = Product._meta.get_field(name)
+            if isinstance(raw, str) and name == 'is_active':
+                raw = BOOLEAN_VALUES.get(raw.lower(), raw)
+            if raw in ('', None) and model_field.null:
+                values[name] = None
+                continue
+            try:
+                values[name] = model_field.clean(raw, None)
+            except ValidationError as e:
+                errors.append(f"{name}: {' '.join(e.messages)}")
+                invalid.add(name)
+
+        category_key = str(row.get('category') or '').strip()
+        if category_key:
+            category = self.categories.get(category_key) or self.categories.get(category_key.lower())
+            if category is None:
+                errors.append(f"category: unknown category '{category_key}'")
+                invalid.add('category')
+            else:
+                values['category'] = category
+
+        vendor_key = str(row.get('vendor') or '').strip()
+        if vendor_key:
+            if vendor_key in self.vendors:
+                values['vendor_id'] = self.vendors[vendor_key]
+            else:
+                errors.append(f"vendor: unknown vendor '{vendor_key}'")
+                invalid.add('vendor')
+
+        if 'image' in row:
+            values['image'] = str(row['image'] or '').strip()
+
+        slug = str(row.get('slug') or '').strip()
+        if slug:
+            try:
+                slug = Product._meta.get_field('slug').clean(slug, None)
+            except ValidationError as e:
+                errors.append(f"slug: {' '.join(e.messages)}")
+            if slug in self.seen_slugs:
+                errors.append(f"slug: '{slug}' appears more than once in the input")
+
+        is_update = slug in self.existing_slugs
+        if not is_update:
+            missing = [name for name in REQUIRED_ON_CREATE if name not in values and name not in invalid]
+            if 'vendor_id' not in values and 'vendor' not in invalid:
+                if self.default_vendor_id is None:
+                    missing.append('vendor')
+                else:
+                    values['vendor_id'] = self.default_vendor_id
+            if missing:
+                errors.append(f"missing required value(s) for a new product: {', '.join(missing)}")
+
+        if errors:
+            self.result.errors.append((line_number, '; '.join(errors)))
+            return None
+
+        if not is_update:
+            if slug:
+                self.slugs.taken.add(slug)
+            else:
+                slug = self.slugs.allocate(values['name'])
+        self.seen_slugs.add(slug)
+        return slug, values
+
+    # ---- writing ----
+    def write(self, batch):
+        # The search index reads each product's category name
+        existing = Product.objects.select_related('category').in_bulk([slug for slug, _ in batch], field_name='slug')
+        to_create = []
+        to_update = []
+        update_fields = set()
+        now = timezone.now()
+        for slug, values in batch:
+            product = existing.get(slug)
+            if product is None:
+                to_create.append(Product(slug=slug, **values))
+                continue
+            self.touched_categories.add(product.category_id)
+            if 'image' in values and values['image'] != product.image.name:
+                # A new file has no variants until build_image_derivatives runs
+                product.image_variants = False
+                update_fields.add('image_variants')
+            for name, value in values.items():
+                setattr(product, name, value)
+            product.updated_at = now
+            update_fields.update(values)
+            to_update.append(product)
+
+        if self.dry_run:
+            self.result.created += len(to_create)
+            self.result.updated += len(to_update)
+            return
+
+        with transaction.atomic():
+            Product.objects.bulk_create(to_create)
+            if to_update:
+                fields = ['vendor' if name == 'vendor_id' else name for name in update_fields]
+                Product.objects.bulk_update(to_update, fields + ['updated_at'])
+            products = to_create + to_update
+            if to_create and to_create[0].pk is None:
+                # Backends that cannot return ids from bulk inserts
+                to_create = list(Product.objects.filter(slug__in=[p.slug for p in to_create]).select_related('category'))
+                products = to_create + to_update
+            search.index_products(products)
+            currency.refresh_product_prices(product_ids=[product.pk for product in products])
+
+        self.touched_categories.update(product.category_id for product in products)
+        self.result.created += len(to_create)
+        self.result.updated += len(to_update)
+
+
+# ============ EXPORT ============
+def _export_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def export_products(stream, fmt, queryset=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Write products to a text stream as CSV or JSONL in the import column layout.
+    Rows are read as plain tuples with iterator(), so memory stays flat however
+    large the catalog is. Returns the number of products written.
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+    rows = queryset.order_by('id').values_list(
+        'slug', 'name', 'description', 'price', 'compare_price',
+        'category__slug', 'vendor__username', 'stock', 'is_active', 'image',
+    ).iterator(chunk_size=chunk_size)
+
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow(['' if value is None else value for value in row])
+            count += 1
+    else:
+        for row in rows:
+            stream.write(json.dumps(dict(zip(COLUMNS, map(_export_value, row)))) + '\n')
+            count += 1
+    return count
@@ -1,22 +1,39 @@
 from django.conf import settings
-from .models import Category
+from .async_context import preloadable
+from .cache import aget_categories, get_categories
+from .currency import aget_active_currency, aget_currencies, get_active_currency, get_currencies
 
+@preloadable
 def categories(request):
     """
-    Make categories available to all templates
+    Make categories available to all templates, served from the process-local category cache
     """
     return {
-        'categories': Category.objects.all()
+        'categories': get_categories()
     }
 
-def currency_settings(request):
-    """
-    Add US Dollars currency settings to all templates
-    """
+async def acategories(request):
+    return {
+        'categories': await aget_categories()
+    }
+
+def _currency_settings(active_currency, currencies):
     return {
         'CURRENCY_SYMBOL': settings.CURRENCY_SYMBOL,
         'CURRENCY_CODE': settings.CURRENCY_CODE,
         'CURRENCY_NAME': settings.CURRENCY_NAME,
         'CURRENCY_SYMBOL_HTML': settings.CURRENCY_SYMBOL_HTML,
         'DECIMAL_PLACES': settings.DECIMAL_PLACES,
-    }
\ No newline at end of file
+        'active_currency': active_currency,
+        'currencies': currencies,
+    }
+
+@preloadable
+def currency_settings(request):
+    """
+    Add US Dollars currency settings to all templates
+    """
+    return _currency_settings(get_active_currency(request), get_currencies())
+
+async def acurrency_settings(request):
+    return _currency_settings(await aget_active_currency(request), await aget_currencies())
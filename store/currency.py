@@ -0,0 +1,179 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db.models import F, FilteredRelation, Q
+
+from . import cache
+from .models import Currency, Product, ProductPrice
+
+SESSION_KEY = 'currency'
+
+BATCH_SIZE = 500
+
+PRICE_FIELDS = [
+    'price', 'compare_price', 'price_display', 'price_no_decimal',
+    'compare_price_display', 'compare_price_no_decimal',
+    'discount_amount', 'discount_percentage',
+]
+
+
+# ============ FORMATTING ============
+def convert(amount, rate, places=2):
+    """Convert a base currency amount with the given rate, rounded to the currency's places"""
+    return (amount * Decimal(str(rate))).quantize(Decimal(1).scaleb(-places), rounding=ROUND_HALF_UP)
+
+
+def format_amount(amount, symbol, places=2):
+    return f"{symbol}{amount:,.{places}f}"
+
+
+def in_currency(amount, currency):
+    """A base currency amount converted like the stored display prices; no currency keeps the base amount"""
+    if currency is None:
+        return amount
+    return convert(amount, currency.rate, currency.decimal_places)
+
+
+def format_in(amount, currency, places=None):
+    """Format an amount that is already in the given currency (None: the base currency)"""
+    if currency is None:
+        symbol, default_places = settings.CURRENCY_SYMBOL, settings.DECIMAL_PLACES
+    else:
+        symbol, default_places = currency.symbol, currency.decimal_places
+    return format_amount(amount, symbol, default_places if places is None else places)
+
+
+def build_price_row(price, compare_price, symbol, rate, places=2):
+    """
+    Return the ProductPrice field values for one product in one currency
+    """
+    converted = convert(price, rate, places)
+    converted_compare = convert(compare_price, rate, places) if compare_price else None
+    on_sale = bool(compare_price and compare_price > price)
+    row = {
+        'price': converted,
+        'compare_price': converted_compare,
+        'price_display': format_amount(converted, symbol, places),
+        'price_no_decimal': format_amount(converted, symbol, 0),
+        'compare_price_display': format_amount(converted_compare, symbol, places) if converted_compare else '',
+        'compare_price_no_decimal': format_amount(converted_compare, symbol, 0) if converted_compare else '',
+        'discount_amount': '',
+        'discount_percentage': 0,
+    }
+    if on_sale:
+        row['discount_amount'] = format_amount(converted_compare - converted, symbol, places)
+        row['discount_percentage'] = round((compare_price - price) / compare_price * 100)
+    return row
+
+
+# ============ PRECOMPUTED PRICES ============
+def refresh_product_prices(product_ids=None, currencies=None):
+    """
+    Recompute stored display prices in bulk, for all products or the given ids,
+    in every enabled currency or the given ones. Returns the number of rows written.
+    """
+    if currencies is None:
+        currencies = list(Currency.objects.filter(is_enabled=True))
+    if not currencies:
+        return 0
+
+    products = Product.objects.order_by('id').values_list('id', 'price', 'compare_price')
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+
+    written = 0
+    batch = []
+    for product_id, price, compare_price in products.iterator(chunk_size=BATCH_SIZE):
+        for currency in currencies:
+            row = build_price_row(price, compare_price, currency.symbol,
+                                  currency.rate, currency.decimal_places)
+            batch.append(ProductPrice(product_id=product_id, currency_id=currency.id, **row))
+        if len(batch) >= BATCH_SIZE:
+            written += _write(batch)
+            batch = []
+    if batch:
+        written += _write(batch)
+    return written
+
+
+def _write(rows):
+    ProductPrice.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['product', 'currency'],
+        update_fields=PRICE_FIELDS,
+    )
+    return len(rows)
+
+
+# ============ ACTIVE CURRENCY ============
+_local_currencies = (None, [])
+
+
+def get_currencies():
+    """Enabled currencies from a process-local cache, reloaded when a Currency signal bumps the version"""
+    global _local_currencies
+    version = cache.get_versions([cache.CURRENCIES])[cache.CURRENCIES]
+    cached_version, currencies = _local_currencies
+    if cached_version != version:
+        currencies = list(Currency.objects.filter(is_enabled=True))
+        _local_currencies = (version, currencies)
+    return currencies
+
+
+async def aget_currencies():
+    """Async get_currencies()"""
+    global _local_currencies
+    version = (await cache.aget_versions([cache.CURRENCIES]))[cache.CURRENCIES]
+    cached_version, currencies = _local_currencies
+    if cached_version != version:
+        currencies = [currency async for currency in Currency.objects.filter(is_enabled=True)]
+        _local_currencies = (version, currencies)
+    return currencies
+
+
+def _choose(currencies, code):
+    for currency in currencies:
+        if currency.code == code:
+            return currency
+    for currency in currencies:
+        if currency.code == settings.CURRENCY_CODE:
+            return currency
+    return None
+
+
+def get_active_currency(request):
+    """
+    The visitor's chosen currency, falling back to the base currency.
+    Remembered on the request: the views and the cart and currency context
+    processors all ask for it while rendering one page.
+    """
+    if not hasattr(request, '_active_currency'):
+        code = request.session.get(SESSION_KEY, settings.CURRENCY_CODE) if hasattr(request, 'session') else settings.CURRENCY_CODE
+        request._active_currency = _choose(get_currencies(), code)
+    return request._active_currency
+
+
+async def aget_active_currency(request):
+    if not hasattr(request, '_active_currency'):
+        code = await request.session.aget(SESSION_KEY, settings.CURRENCY_CODE) if hasattr(request, 'session') else settings.CURRENCY_CODE
+        request._active_currency = _choose(await aget_currencies(), code)
+    return request._active_currency
+
+
+def with_display_prices(queryset, currency):
+    """
+    Join the stored display prices for one currency onto a product queryset.
+    Adds display_price, display_compare_price, display_discount_amount and
+    display_discount_percentage without any extra query.
+    """
+    if currency is None:
+        return queryset
+    return queryset.annotate(
+        active_price=FilteredRelation('display_prices', condition=Q(display_prices__currency=currency)),
+    ).annotate(
+        display_price=F('active_price__price_display'),
+        display_compare_price=F('active_price__compare_price_display'),
+        display_discount_amount=F('active_price__discount_amount'),
+        display_discount_percentage=F('active_price__discount_percentage'),
+    )
@@ -0,0 +1,193 @@
+import contextvars
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# ============ CONNECTION PRAGMAS ============
+# Per-connection SQLITE_PRAGMAS that leave the database file alone. They are the
+# only ones run on a query_only alias such as the replica: journal_mode would
+# try to rewrite the file header, and synchronous only concerns writers.
+READ_SAFE_PRAGMAS = {'busy_timeout', 'cache_size', 'mmap_size', 'temp_store'}
+
+
+def apply_pragmas(connection):
+    """
+    Run SQLITE_PRAGMAS, then the alias's own PRAGMAS from DATABASES, on a new
+    SQLite connection. Called from the connection_created signal.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    own = connection.settings_dict.get('PRAGMAS', {})
+    pragmas = dict(settings.SQLITE_PRAGMAS)
+    if str(own.get('query_only', '')).upper() in ('ON', '1', 'TRUE'):
+        pragmas = {name: value for name, value in pragmas.items() if name in READ_SAFE_PRAGMAS}
+    pragmas.update(own)
+    for name, value in pragmas.items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+# ============ READ REPLICA ============
+@dataclass
+class _RequestState:
+    pinned: bool = False
+    wrote: bool = False
+
+
+# Set by ReplicaPinMiddleware for the duration of a request. Outside a request
+# (commands, the job worker) it is None and every query goes to the primary.
+_request_state = contextvars.ContextVar('replica_request_state', default=None)
+
+
+# Table written by an INSERT, UPDATE or DELETE, including raw SQL upserts behind a WITH clause
+WRITE_RE = re.compile(
+    r'^\s*(?:WITH\b.*?\)\s*)?(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+"?(\w+)',
+    re.IGNORECASE | re.DOTALL,
+)
+
+_table_apps = {}
+
+
+def _app_for_table(table):
+    if not _table_apps:
+        _table_apps.update((model._meta.db_table, model._meta.app_label) for model in apps.get_models())
+    return _table_apps.get(table)
+
+
+def _track_writes(execute, sql, params, many, context):
+    """
+    Execute wrapper pinning the current visitor to the primary once the request
+    writes to a REPLICA_PIN_APPS table. Watching the SQL rather than the router
+    also catches raw SQL, and ignores db_for_write calls Django makes only to
+    tag unsaved instances.
+    """
+    state = _request_state.get()
+    if state is not None and not state.wrote:
+        match = WRITE_RE.match(sql)
+        if match and _app_for_table(match.group(1)) in settings.REPLICA_PIN_APPS:
+            state.pinned = state.wrote = True
+    return execute(sql, params, many, context)
+
+
+def install(connection):
+    """Watch a primary connection for writes; connected from connection_created"""
+    if (connection.alias == DEFAULT_DB_ALIAS and settings.REPLICA_DATABASE in settings.DATABASES
+            and _track_writes not in connection.execute_wrappers):
+        connection.execute_wrappers.append(_track_writes)
+
+
+def read_from_primary():
+    """Send the rest of this request's reads to the primary, without pinning the visitor"""
+    state = _request_state.get()
+    if state is not None:
+        state.pinned = True
+
+
+class ReplicaRouter:
+    """
+    Send catalog reads made while serving a request to the replica, and
+    everything else to the primary. A request that writes to a pinning app
+    pins the visitor to the primary for REPLICA_PIN_SECONDS, longer than the
+    replica can lag behind, so they always see their own cart and orders
+    (see _track_writes). Reads for cache scopes bumped within that time go to
+    the primary as well, so no stale copy is cached (see store.cache).
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if (state is None or state.pinned
+                or model._meta.label_lower not in settings.REPLICA_READ_MODELS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return settings.REPLICA_DATABASE
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica is a copy of the primary, so objects from either relate freely
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinMiddleware:
+    """
+    Track reads and writes per request for ReplicaRouter. Unsafe requests and
+    visitors holding the pin cookie read from the primary; a request that
+    writes sets the cookie. Only active when the replica database is configured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.REPLICA_DATABASE not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def start(self, request):
+        # Connections of this thread may have been opened before the middleware loaded
+        install(connections[DEFAULT_DB_ALIAS])
+        state = _RequestState(
+            pinned=request.method not in ('GET', 'HEAD', 'OPTIONS')
+            or settings.REPLICA_PIN_COOKIE in request.COOKIES,
+        )
+        return state, _request_state.set(state)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.finish(response, state)
+
+    async def __acall__(self, request):
+        # The async ORM runs queries in a thread with a copy of this context, which shares the state object
+        state, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.finish(response, state)
+
+    def finish(self, response, state):
+        if state.wrote:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+def sync_replica(alias=None):
+    """
+    Copy the primary database into the replica file with SQLite's online
+    backup API. The copy runs inside one read transaction on the primary and
+    one write transaction on the replica, so replica readers switch from the
+    old snapshot to the new one atomically. Returns the seconds taken.
+    """
+    alias = alias or settings.REPLICA_DATABASE
+    timeout = settings.SQLITE_PRAGMAS.get('busy_timeout', 5000) / 1000
+    start = time.perf_counter()
+    source = sqlite3.connect(settings.DATABASES[DEFAULT_DB_ALIAS]['NAME'], timeout=timeout)
+    target = sqlite3.connect(settings.DATABASES[alias]['NAME'], timeout=timeout)
+    try:
+        source.backup(target)
+        target.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        target.close()
+        source.close()
+    return time.perf_counter() - start
@@ -0,0 +1,289 @@
+import bisect
+from collections import Counter
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, Case, Count, ExpressionWrapper, F, IntegerField, Q, Sum, Value, When
+
+from .currency import convert, format_amount
+from .models import CategoryFacetCount, Product
+from .rollups import increment
+
+# A product's facet key is (category_id, vendor_id, price_band, in_stock, on_sale).
+# CategoryFacetCount stores how many active products share each key, so every
+# count in the filter sidebar is a sum over a category's few stored cells
+# instead of a GROUP BY over its products per facet.
+KEY_FIELDS = ['category', 'vendor', 'price_band', 'in_stock', 'on_sale']
+IN_STOCK = KEY_FIELDS.index('in_stock')
+
+
+# ============ FACET VALUES ============
+def price_band(price):
+    """Number of the FACET_PRICE_BANDS band a base currency price falls in"""
+    return bisect.bisect_right(settings.FACET_PRICE_BANDS, price)
+
+
+def band_bounds(band):
+    """(low, high) base currency bounds of a band; high is None for the open-ended last band"""
+    bounds = settings.FACET_PRICE_BANDS
+    return (bounds[band - 1] if band else 0), (bounds[band] if band < len(bounds) else None)
+
+
+def facet_key(category_id, vendor_id, price, stock, compare_price, is_active):
+    """Facet key of a product from its field values, or None when it is not listed"""
+    if not is_active:
+        return None
+    return category_id, vendor_id, price_band(price), stock > 0, bool(compare_price and compare_price > price)
+
+
+def product_key(product):
+    return facet_key(product.category_id, product.vendor_id, product.price, product.stock,
+                     product.compare_price, product.is_active)
+
+
+def _band_expression():
+    return Case(
+        *[When(price__lt=bound, then=Value(band)) for band, bound in enumerate(settings.FACET_PRICE_BANDS)],
+        default=Value(len(settings.FACET_PRICE_BANDS)), output_field=IntegerField(),
+    )
+
+
+def cells(queryset, *group_by):
+    """
+    (vendor_id, price_band, in_stock, on_sale, products) for any product
+    queryset, such as search results, in one GROUP BY query. Extra group_by
+    fields come first in each row.
+    """
+    return queryset.order_by().annotate(
+        facet_band=_band_expression(),
+        facet_in_stock=ExpressionWrapper(Q(stock__gt=0), output_field=BooleanField()),
+        # compare_price is nullable, and NULL > price is NULL rather than false
+        facet_on_sale=Case(When(compare_price__gt=F('price'), then=Value(True)),
+                           default=Value(False), output_field=BooleanField()),
+    ).values_list(*group_by, 'vendor', 'facet_band', 'facet_in_stock', 'facet_on_sale').annotate(products=Count('id'))
+
+
+def stored_cells(category_id=None):
+    """The cells of one category's active products, or of the whole catalog, from the stored counts"""
+    rows = CategoryFacetCount.objects.filter(products__gt=0)
+    if category_id is not None:
+        return rows.filter(category=category_id).values_list('vendor', 'price_band', 'in_stock', 'on_sale', 'products')
+    return rows.order_by().values_list('vendor', 'price_band', 'in_stock', 'on_sale').annotate(total=Sum('products'))
+
+
+# ============ INCREMENTAL UPDATES ============
+def apply(keys, sign=1):
+    """Add (sign=1) or remove (sign=-1) products, given by their facet keys, from the stored counts"""
+    totals = Counter(key for key in keys if key is not None)
+    increment(CategoryFacetCount, KEY_FIELDS, [
+        {**dict(zip(KEY_FIELDS, key)), 'products': sign * count} for key, count in totals.items()
+    ], ['products'])
+
+
+def product_changed(old_key, new_key):
+    if old_key != new_key:
+        apply([old_key], sign=-1)
+        apply([new_key])
+
+
+def sold_out(products):
+    """
+    Move products whose stock has just reached zero to the out-of-stock counts.
+    Checkout calls this directly since its update() sends no Product signals;
+    the products still hold the stock they had before the sale.
+    """
+    keys = [product_key(product) for product in products]
+    apply(keys, sign=-1)
+    apply([key[:IN_STOCK] + (False,) + key[IN_STOCK + 1:] for key in keys if key is not None])
+
+
+# ============ REBUILD ============
+def rebuild(category_ids=None):
+    """
+    Recount the stored facet counts from the product table, for every category
+    or only the given ones. Bulk writes that bypass the Product signals call
+    this for the categories they touched. Returns the number of rows written.
+    """
+    products = Product.objects.filter(is_active=True)
+    counts = CategoryFacetCount.objects.all()
+    if category_ids is not None:
+        products = products.filter(category__in=category_ids)
+        counts = counts.filter(category__in=category_ids)
+    with transaction.atomic():
+        counts.delete()
+        rows = CategoryFacetCount.objects.bulk_create(
+            CategoryFacetCount(category_id=category_id, vendor_id=vendor_id, price_band=band,
+                               in_stock=in_stock, on_sale=on_sale, products=count)
+            for category_id, vendor_id, band, in_stock, on_sale, count in cells(products, 'category')
+        )
+    return len(rows)
+
+
+# ============ FILTERING ============
+# Longer ids would overflow a 64-bit SQL integer
+MAX_ID_DIGITS = 18
+
+
+def _ints(values):
+    """The plain ASCII numbers among query values; isdigit() alone also accepts characters like '²'"""
+    return {int(value) for value in values
+            if value.isascii() and value.isdecimal() and len(value) <= MAX_ID_DIGITS}
+
+
+@dataclass(frozen=True)
+class FacetFilters:
+    """The facet values selected on a listing page: ?price=1&price=2&vendor=7&in_stock=1&on_sale=1"""
+    price_bands: frozenset = frozenset()
+    vendors: frozenset = frozenset()
+    in_stock: bool = False
+    on_sale: bool = False
+
+    @classmethod
+    def from_query(cls, query):
+        return cls(
+            price_bands=frozenset(band for band in _ints(query.getlist('price'))
+                                  if band <= len(settings.FACET_PRICE_BANDS)),
+            vendors=frozenset(_ints(query.getlist('vendor'))),
+            in_stock=query.get('in_stock') == '1',
+            on_sale=query.get('on_sale') == '1',
+        )
+
+    def __bool__(self):
+        return bool(self.price_bands or self.vendors or self.in_stock or self.on_sale)
+
+    def q(self):
+        """
+        Filter for the listing queryset. Adjacent selected bands merge into a
+        single price range, so the SQL has one range per run of bands.
+        """
+        q = Q()
+        if self.price_bands:
+            ranges = Q()
+            for first, last in _runs(sorted(self.price_bands)):
+                low, high = band_bounds(first)[0], band_bounds(last)[1]
+                price_range = Q(price__gte=low) if low else Q()
+                if high is not None:
+                    price_range &= Q(price__lt=high)
+                ranges |= price_range
+            q &= ranges
+        if self.vendors:
+            q &= Q(vendor__in=self.vendors)
+        if self.in_stock:
+            q &= Q(stock__gt=0)
+        if self.on_sale:
+            q &= Q(compare_price__gt=F('price'))
+        return q
+
+    def matches(self, cell, skip=None):
+        """Whether a cell passes every selection except the `skip` facet's own"""
+        vendor_id, band, in_stock, on_sale, _ = cell
+        return ((skip == 'price' or not self.price_bands or band in self.price_bands)
+                and (skip == 'vendor' or not self.vendors or vendor_id in self.vendors)
+                and (skip == 'in_stock' or not self.in_stock or in_stock)
+                and (skip == 'on_sale' or not self.on_sale or on_sale))
+
+
+def _runs(bands):
+    """Merge sorted band numbers into (first, last) runs of adjacent bands"""
+    runs = []
+    for band in bands:
+        if runs and runs[-1][1] == band - 1:
+            runs[-1][1] = band
+        else:
+            runs.append([band, band])
+    return runs
+
+
+# ============ COUNTS ============
+@dataclass
+class FacetCounts:
+    total: int
+    price: Counter
+    vendor: Counter
+    in_stock: int
+    on_sale: int
+
+
+def count(cells, filters):
+    """
+    Facet counts for a listing from its cells. Each facet is counted with the
+    other facets' selections applied but not its own, so a shopper who picked
+    one price band still sees what the other bands would add.
+    """
+    counts = FacetCounts(total=0, price=Counter(), vendor=Counter(), in_stock=0, on_sale=0)
+    for cell in cells:
+        vendor_id, band, in_stock, on_sale, products = cell
+        if filters.matches(cell):
+            counts.total += products
+        if filters.matches(cell, skip='price'):
+            counts.price[band] += products
+        if filters.matches(cell, skip='vendor'):
+            counts.vendor[vendor_id] += products
+        if in_stock and filters.matches(cell, skip='in_stock'):
+            counts.in_stock += products
+        if on_sale and filters.matches(cell, skip='on_sale'):
+            counts.on_sale += products
+    return counts
+
+
+def vendor_ids(counts, filters):
+    """Vendors shown in the sidebar: the FACET_VENDOR_LIMIT with most products, plus any selected"""
+    top = [vendor_id for vendor_id, _ in counts.vendor.most_common(settings.FACET_VENDOR_LIMIT)]
+    return top + sorted(filters.vendors - set(top))
+
+
+# ============ SIDEBAR ============
+def _toggle_url(query, name, value):
+    query = query.copy()
+    values = query.getlist(name)
+    query.setlist(name, [v for v in values if v != value] if value in values else values + [value])
+    # Filters change the result set, so paging starts over
+    query.pop('cursor', None)
+    return f'?{query.urlencode()}'
+
+
+def band_label(band, currency=None):
+    """'Under $25', '$25 - $50' or '$1,000 and up', in the visitor's currency"""
+    def amount(bound):
+        if currency is None:
+            return format_amount(bound, settings.CURRENCY_SYMBOL, 0)
+        return format_amount(convert(bound, currency.rate, 0), currency.symbol, 0)
+    low, high = band_bounds(band)
+    if not low:
+        return f'Under {amount(high)}'
+    if high is None:
+        return f'{amount(low)} and up'
+    return f'{amount(low)} - {amount(high)}'
+
+
+def sidebar(counts, filters, query, vendor_names, currency=None):
+    """Filter groups for the listing template: options with their count, state and toggle URL"""
+    def option(name, value, label, count, selected):
+        return {'label': label, 'count': count, 'selected': selected, 'url': _toggle_url(query, name, value)}
+
+    bands = range(len(settings.FACET_PRICE_BANDS) + 1)
+    groups = [
+        {'title': 'Price', 'options': [
+            option('price', str(band), band_label(band, currency), counts.price[band], band in filters.price_bands)
+            for band in bands if counts.price[band] or band in filters.price_bands
+        ]},
+        {'title': 'Availability', 'options': [
+            option('in_stock', '1', 'In stock', counts.in_stock, filters.in_stock),
+            option('on_sale', '1', 'On sale', counts.on_sale, filters.on_sale),
+        ]},
+        {'title': 'Vendor', 'options': [
+            option('vendor', str(vendor_id), vendor_names.get(vendor_id, ''), counts.vendor[vendor_id],
+                   vendor_id in filters.vendors)
+            for vendor_id in vendor_ids(counts, filters) if vendor_id in vendor_names
+        ]},
+    ]
+    clear = query.copy()
+    for name in ('price', 'vendor', 'in_stock', 'on_sale', 'cursor'):
+        clear.pop(name, None)
+    return {
+        'groups': [group for group in groups if group['options']],
+        'total': counts.total,
+        'active': bool(filters),
+        'clear_url': f'?{clear.urlencode()}',
+    }
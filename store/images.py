@@ -0,0 +1,191 @@
+import os
+import re
+from io import BytesIO
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Widths generated for every uploaded image, smallest first
+DERIVATIVE_WIDTHS = (150, 300, 600)
+
+# Folders holding uploaded originals (Product.image, Category.image, CustomUser.profile_picture)
+UPLOAD_DIRS = ('products', 'categories', 'profile_pics')
+
+# Image fields rendered with {% picture %}. Each has a BooleanField named
+# <field>_variants recording whether its variants exist, so rendering never
+# asks the storage.
+IMAGE_FIELDS = (('store.Product', 'image'), ('store.Category', 'image'), ('users.CustomUser', 'profile_picture'))
+
+MARK_BATCH_SIZE = 500
+
+DERIVATIVE_RE = re.compile(r'\.\d+w\.[a-z]+$')
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+
+def is_derivative(name):
+    return bool(DERIVATIVE_RE.search(name))
+
+
+def _fallback_format(name):
+    ext = os.path.splitext(name)[1].lower()
+    if ext in ('.jpg', '.jpeg'):
+        return 'JPEG', ext
+    return 'PNG', '.png'
+
+
+def derivative_name(name, width, webp=False):
+    """
+    products/laptop.jpg -> products/laptop.jpg.300w.jpg (or .jpg.300w.webp). The
+    original extension stays in the name, so laptop.jpg and laptop.png never
+    share variants.
+    """
+    ext = '.webp' if webp else _fallback_format(name)[1]
+    return f'{name}.{width}w{ext}'
+
+
+def has_derivatives(name, storage=default_storage):
+    return storage.exists(derivative_name(name, DERIVATIVE_WIDTHS[-1], webp=True))
+
+
+def variants_field(field_name):
+    return f'{field_name}_variants'
+
+
+def has_variants(image):
+    """Whether the variants of an image field's file exist, from the flag stored on its instance"""
+    return bool(getattr(image.instance, variants_field(image.field.name), False))
+
+
+def _encode(image, image_format):
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    if image_format == 'JPEG':
+        image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    elif image_format == 'WEBP':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    else:
+        image.save(buffer, image_format, optimize=True)
+    return buffer.getvalue()
+
+
+def generate_derivatives(name, storage=default_storage, force=False):
+    """
+    Write resized copies of an uploaded image next to the original,
+    one per width in its own format and one in WebP.
+    Returns the number of files written.
+    """
+    if not name or is_derivative(name):
+        return 0
+    if not force and has_derivatives(name, storage):
+        return 0
+
+    try:
+        with storage.open(name) as original:
+            image = Image.open(original)
+            image.load()
+    except (FileNotFoundError, UnidentifiedImageError, OSError):
+        return 0
+
+    image = ImageOps.exif_transpose(image)
+    fallback_format = _fallback_format(name)[0]
+    written = 0
+    for width in DERIVATIVE_WIDTHS:
+        resized = image.copy()
+        # Bound the width only; never upscale
+        resized.thumbnail((width, resized.height), Image.Resampling.LANCZOS)
+        for webp in (False, True):
+            target = derivative_name(name, width, webp=webp)
+            content = _encode(resized, 'WEBP' if webp else fallback_format)
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(content))
+            written += 1
+    return written
+
+
+def delete_derivatives(name, storage=default_storage):
+    for width in DERIVATIVE_WIDTHS:
+        for webp in (False, True):
+            target = derivative_name(name, width, webp=webp)
+            if storage.exists(target):
+                storage.delete(target)
+
+
+def srcsets(name, storage=default_storage):
+    """(fallback_srcset, webp_srcset) for an image whose variants exist"""
+    fallback = ', '.join(
+        f'{storage.url(derivative_name(name, width))} {width}w' for width in DERIVATIVE_WIDTHS
+    )
+    webp = ', '.join(
+        f'{storage.url(derivative_name(name, width, webp=True))} {width}w' for width in DERIVATIVE_WIDTHS
+    )
+    return fallback, webp
+
+
+# ============ MODEL HOOKS ============
+def previous_name(instance, field_name, update_fields=None):
+    """
+    The stored file name of an image field before a save. Read from the row
+    a pre_save handler kept on instance._previous when there is one, and
+    queried otherwise; called from pre_save in that case.
+    """
+    if not instance.pk or (update_fields is not None and field_name not in update_fields):
+        return None
+    if hasattr(instance, '_previous'):
+        return getattr(instance._previous, field_name).name if instance._previous else None
+    return type(instance)._default_manager.filter(pk=instance.pk).values_list(field_name, flat=True).first()
+
+
+def image_saved(instance, field_name, previous=None, update_fields=None):
+    """
+    Called from post_save: build the variants of a new image and store the
+    flag, and drop the variants of the image it replaced once the save commits.
+    """
+    if update_fields is not None and field_name not in update_fields:
+        return
+    image = getattr(instance, field_name)
+    flag = variants_field(field_name)
+    if previous and previous != image.name:
+        transaction.on_commit(lambda: delete_derivatives(previous, image.storage))
+    elif previous == image.name and getattr(instance, flag):
+        return
+    built = bool(image.name) and (generate_derivatives(image.name, image.storage) > 0
+                                  or has_derivatives(image.name, image.storage))
+    if built != getattr(instance, flag):
+        setattr(instance, flag, built)
+        type(instance)._default_manager.filter(pk=instance.pk).update(**{flag: built})
+
+
+def image_deleted(instance, field_name):
+    """Called from post_delete: remove the variants once the delete commits"""
+    image = getattr(instance, field_name)
+    if image.name:
+        name, storage = image.name, image.storage
+        transaction.on_commit(lambda: delete_derivatives(name, storage))
+
+
+def mark_built(names):
+    """Set the variants flag on every row whose image is one of the given file names"""
+    names = list(names)
+    for label, field_name in IMAGE_FIELDS:
+        model = apps.get_model(label)
+        for start in range(0, len(names), MARK_BATCH_SIZE):
+            model._default_manager.filter(**{f'{field_name}__in': names[start:start + MARK_BATCH_SIZE]}) \
+                .update(**{variants_field(field_name): True})
+
+
+def iter_originals(storage=default_storage):
+    """Yield the names of all uploaded originals under the upload folders"""
+    for folder in UPLOAD_DIRS:
+        if not storage.exists(folder):
+            continue
+        for filename in storage.listdir(folder)[1]:
+            name = f'{folder}/{filename}'
+            if not is_derivative(name):
+                yield name
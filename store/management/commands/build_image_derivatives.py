@@ -0,0 +1,40 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+
+from store import cache, images
+
+
+def _build(name, force):
+    written = images.generate_derivatives(name, force=force)
+    return name, written, bool(written) or images.has_derivatives(name)
+
+
+class Command(BaseCommand):
+    help = 'Generate resized and WebP variants for uploaded images under MEDIA_ROOT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes (defaults to the number of CPUs)')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate variants that already exist')
+
+    def handle(self, *args, **options):
+        names = list(images.iter_originals())
+        built = 0
+        available = []
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            for name, written, exists in pool.map(_build, names, [options['force']] * len(names)):
+                if exists:
+                    available.append(name)
+                if written:
+                    built += 1
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'{name}: {written} files')
+        # Record which images have variants, then re-render the cached pages showing them
+        images.mark_built(available)
+        cache.bump(cache.CATALOG, cache.CATEGORIES)
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {len(names)} images, generated variants for {built}.'
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from store import recommendations, tasks
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored product recommendations from co-purchases and category bestsellers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='store_true',
+                            help='Queue the rebuild for the job worker instead of running it here')
+
+    def handle(self, *args, **options):
+        if options['queue']:
+            tasks.queue_recommendations_build()
+            self.stdout.write(self.style.SUCCESS('Queued a recommendations rebuild.'))
+            return
+        rows = recommendations.build()
+        self.stdout.write(self.style.SUCCESS(f'Stored {rows} recommendations.'))
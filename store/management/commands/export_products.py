@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import catalog_io
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Write products as CSV or JSONL, in the layout import_products reads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Output file (stdout by default)')
+        parser.add_argument('--format', choices=catalog_io.FORMATS,
+                            help='Output format (guessed from the file extension by default)')
+        parser.add_argument('--chunk-size', type=int, default=catalog_io.EXPORT_CHUNK_SIZE,
+                            help='Rows fetched from the database at a time')
+        parser.add_argument('--category', help='Only export products in this category slug')
+        parser.add_argument('--vendor', help='Only export products of this vendor username')
+        parser.add_argument('--active-only', action='store_true', help='Skip inactive products')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or catalog_io.guess_format(path)
+        products = Product.objects.all()
+        if options['category']:
+            products = products.filter(category__slug=options['category'])
+        if options['vendor']:
+            products = products.filter(vendor__username=options['vendor'])
+        if options['active_only']:
+            products = products.filter(is_active=True)
+
+        if path == '-':
+            count = catalog_io.export_products(sys.stdout, fmt, products, options['chunk_size'])
+            self.stderr.write(f'Exported {count} products.')
+            return
+        try:
+            with open(path, 'w', newline='', encoding='utf-8') as stream:
+                count = catalog_io.export_products(stream, fmt, products, options['chunk_size'])
+        except OSError as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(f'Exported {count} products to {path}.'))
@@ -0,0 +1,52 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import catalog_io
+
+
+class Command(BaseCommand):
+    help = 'Create or update products from a CSV or JSONL file (use - for stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file, or - to read stdin')
+        parser.add_argument('--format', choices=catalog_io.FORMATS,
+                            help='Input format (guessed from the file extension by default)')
+        parser.add_argument('--batch-size', type=int, default=catalog_io.BATCH_SIZE,
+                            help='Rows written per bulk insert/update')
+        parser.add_argument('--vendor', help='Username of the vendor for rows without a vendor column')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate the input without writing anything')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or catalog_io.guess_format(path)
+        try:
+            importer = catalog_io.ProductImporter(
+                batch_size=options['batch_size'],
+                default_vendor=options['vendor'],
+                dry_run=options['dry_run'],
+            )
+        except ValueError as e:
+            raise CommandError(e)
+
+        if path == '-':
+            result = importer.run(catalog_io.read_rows(sys.stdin, fmt))
+        else:
+            try:
+                with open(path, newline='', encoding='utf-8-sig') as stream:
+                    result = importer.run(catalog_io.read_rows(stream, fmt))
+            except OSError as e:
+                raise CommandError(e)
+
+        for line_number, message in result.errors:
+            self.stderr.write(f'Line {line_number}: {message}')
+
+        prefix = 'Dry run: would have ' if options['dry_run'] else ''
+        summary = f'{prefix}created {result.created} and updated {result.updated} products'
+        if result.errors:
+            self.stdout.write(self.style.WARNING(f'{summary}; rejected {len(result.errors)} rows.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{summary}.'))
+        if result.created and not options['dry_run']:
+            self.stdout.write('Run build_image_derivatives to generate variants for imported images.')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from store import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollup tables from the order tables'
+
+    def handle(self, *args, **options):
+        days = rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt sales rollups for {days} days.'))
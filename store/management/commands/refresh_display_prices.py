@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from store import currency
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored display prices of every product in every enabled currency'
+
+    def handle(self, *args, **options):
+        count = currency.refresh_product_prices()
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} display prices.'))
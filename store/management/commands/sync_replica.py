@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from store import db
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary database into the read replica file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=int, metavar='SECONDS',
+                            help=f'Keep syncing at this interval (REPLICA_SYNC_INTERVAL is {settings.REPLICA_SYNC_INTERVAL})')
+
+    def handle(self, *args, **options):
+        if settings.REPLICA_DATABASE not in settings.DATABASES:
+            raise CommandError('No replica database is configured; set DJANGO_DB_PROFILE=production.')
+        try:
+            while True:
+                seconds = db.sync_replica()
+                self.stdout.write(self.style.SUCCESS(f'Synced the replica in {seconds:.2f}s.'))
+                if not options['every']:
+                    break
+                time.sleep(options['every'])
+        except KeyboardInterrupt:
+            pass
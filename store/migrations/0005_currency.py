@@ -0,0 +1,102 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:07
+
+from decimal import Decimal, ROUND_HALF_UP
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _format(amount, symbol, places):
+    return f"{symbol}{amount:,.{places}f}"
+
+
+def base_price_row(price, compare_price, symbol, places):
+    """ProductPrice values in the base currency (rate 1), as store.currency computed them at this migration"""
+    quantum = Decimal(1).scaleb(-places)
+    converted = price.quantize(quantum, rounding=ROUND_HALF_UP)
+    converted_compare = compare_price.quantize(quantum, rounding=ROUND_HALF_UP) if compare_price else None
+    row = {
+        'price': converted,
+        'compare_price': converted_compare,
+        'price_display': _format(converted, symbol, places),
+        'price_no_decimal': _format(converted, symbol, 0),
+        'compare_price_display': _format(converted_compare, symbol, places) if converted_compare else '',
+        'compare_price_no_decimal': _format(converted_compare, symbol, 0) if converted_compare else '',
+        'discount_amount': '',
+        'discount_percentage': 0,
+    }
+    if compare_price and compare_price > price:
+        row['discount_amount'] = _format(converted_compare - converted, symbol, places)
+        row['discount_percentage'] = round((compare_price - price) / compare_price * 100)
+    return row
+
+
+def create_base_currency(apps, schema_editor):
+    Currency = apps.get_model('store', 'Currency')
+    Product = apps.get_model('store', 'Product')
+    ProductPrice = apps.get_model('store', 'ProductPrice')
+    currency, _ = Currency.objects.get_or_create(
+        code=settings.CURRENCY_CODE,
+        defaults={
+            'name': settings.CURRENCY_NAME,
+            'symbol': settings.CURRENCY_SYMBOL,
+            'rate': 1,
+            'decimal_places': settings.DECIMAL_PLACES,
+        },
+    )
+    ProductPrice.objects.bulk_create([
+        ProductPrice(
+            product_id=product_id,
+            currency=currency,
+            **base_price_row(price, compare_price, currency.symbol, currency.decimal_places),
+        )
+        for product_id, price, compare_price in Product.objects.values_list('id', 'price', 'compare_price')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Currency',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=3, unique=True)),
+                ('name', models.CharField(max_length=50)),
+                ('symbol', models.CharField(max_length=5)),
+                ('rate', models.DecimalField(decimal_places=6, default=1, help_text='Units of this currency per one unit of the base currency', max_digits=14)),
+                ('decimal_places', models.PositiveSmallIntegerField(default=2)),
+                ('is_enabled', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Currencies',
+                'ordering': ['code'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('compare_price', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('price_display', models.CharField(max_length=30)),
+                ('price_no_decimal', models.CharField(max_length=30)),
+                ('compare_price_display', models.CharField(blank=True, max_length=30)),
+                ('compare_price_no_decimal', models.CharField(blank=True, max_length=30)),
+                ('discount_amount', models.CharField(blank=True, max_length=30)),
+                ('discount_percentage', models.PositiveSmallIntegerField(default=0)),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_prices', to='store.currency')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='display_prices', to='store.product')),
+            ],
+            options={
+                'unique_together': {('product', 'currency')},
+            },
+        ),
+        migrations.RunPython(create_base_currency, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from store.facets import cells
+
+
+def count_facets(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    CategoryFacetCount = apps.get_model('store', 'CategoryFacetCount')
+    CategoryFacetCount.objects.bulk_create(
+        CategoryFacetCount(category_id=category_id, vendor_id=vendor_id, price_band=band,
+                           in_stock=in_stock, on_sale=on_sale, products=count)
+        for category_id, vendor_id, band, in_stock, on_sale, count
+        in cells(Product.objects.filter(is_active=True), 'category')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_band', models.PositiveSmallIntegerField()),
+                ('in_stock', models.BooleanField()),
+                ('on_sale', models.BooleanField()),
+                ('products', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.category')),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('category', 'vendor', 'price_band', 'in_stock', 'on_sale')},
+            },
+        ),
+        migrations.RunPython(count_facets, migrations.RunPython.noop),
+    ]
@@ -11,6 +11,8 @@ class Category(models.Model):
     slug = models.SlugField(unique=True)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='categories/', blank=True)
+    # Set once the resized and WebP variants of image exist (see store.images)
+    image_variants = models.BooleanField(default=False, editable=False)
 
     class Meta:
         verbose_name_plural = "Categories"
@@ -33,12 +35,30 @@ class Product(models.Model):
     compare_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     image = models.ImageField(upload_to='products/')
+    # Set once the resized and WebP variants of image exist (see store.images)
+    image_variants = models.BooleanField(default=False, editable=False)
     stock = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     vendor = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'user_type': 'vendor'})
 
+    class Meta:
+        # is_active filters compile to a bare WHERE "is_active" that no index
+        # column can match, so the storefront indexes are partial on it instead
+        indexes = [
+            # Catalog listings and the home page: active products, newest first
+            models.Index(fields=['created_at'], condition=models.Q(is_active=True),
+                         name='product_active_created_idx'),
+            # Category listings and related products
+            models.Index(fields=['category', 'created_at'], condition=models.Q(is_active=True),
+                         name='product_active_cat_created_idx'),
+            # Vendor dashboard table in its default order
+            models.Index(fields=['vendor', 'created_at'], name='product_vendor_created_idx'),
+            # Low-stock counts on the dashboards
+            models.Index(fields=['stock'], name='product_stock_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -103,6 +123,45 @@ class Product(models.Model):
         }
 
 
+class Currency(models.Model):
+    """Currency that product prices can be displayed in"""
+    code = models.CharField(max_length=3, unique=True)
+    name = models.CharField(max_length=50)
+    symbol = models.CharField(max_length=5)
+    rate = models.DecimalField(max_digits=14, decimal_places=6, default=1,
+                               help_text="Units of this currency per one unit of the base currency")
+    decimal_places = models.PositiveSmallIntegerField(default=2)
+    is_enabled = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Currencies"
+        ordering = ['code']
+
+    def __str__(self):
+        return self.code
+
+
+class ProductPrice(models.Model):
+    """Display prices of one product in one currency, precomputed by store.currency"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='display_prices')
+    currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='product_prices')
+    price = models.DecimalField(max_digits=14, decimal_places=2)
+    compare_price = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    price_display = models.CharField(max_length=30)
+    price_no_decimal = models.CharField(max_length=30)
+    compare_price_display = models.CharField(max_length=30, blank=True)
+    compare_price_no_decimal = models.CharField(max_length=30, blank=True)
+    discount_amount = models.CharField(max_length=30, blank=True)
+    discount_percentage = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['product', 'currency']
+
+    def __str__(self):
+        return f"{self.product_id} ({self.currency_id}): {self.price_display}"
+
+
 class Order(models.Model):
     """Order model to track customer purchases"""
     ORDER_STATUS = (
@@ -121,6 +180,14 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     shipping_address = models.TextField()
 
+    class Meta:
+        indexes = [
+            # Order history, newest first
+            models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),
+            # Admin order list filtered by status and date
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+        ]
+
     def __str__(self):
         return self.order_number
 
@@ -146,7 +213,8 @@ class Order(models.Model):
             'total_amount': self.get_total_amount_display(),
             'total_amount_no_decimal': self.get_total_amount_no_decimal(),
             'status': self.get_status_display(),
-            'items_count': self.items.count(),
+            # Uses the item_count annotation from store.orders.order_history when present
+            'items_count': self.item_count if hasattr(self, 'item_count') else self.items.count(),
             'currency_symbol': settings.CURRENCY_SYMBOL,
             'currency_code': settings.CURRENCY_CODE,
         }
@@ -200,4 +268,104 @@ class ContactMessage(models.Model):
         ordering = ['-created_at']
 
     def __str__(self):
-        return f"{self.name} - {self.subject}"
\ No newline at end of file
+        return f"{self.name} - {self.subject}"
+
+# ============ SALES ROLLUPS ============
+# Maintained incrementally by store.rollups; rebuild with `manage.py rebuild_sales_rollups`.
+# Sales figures leave out cancelled orders; OrderStatusDay counts every order.
+
+class SalesDay(models.Model):
+    """Orders, units and revenue per day"""
+    date = models.DateField(unique=True)
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.date}: {self.revenue}"
+
+
+class CategorySalesDay(models.Model):
+    """Units and revenue per category per day"""
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-date']
+        unique_together = ('date', 'category')
+
+
+class VendorSalesDay(models.Model):
+    """Units and revenue per vendor per day"""
+    date = models.DateField()
+    vendor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-date']
+        unique_together = ('date', 'vendor')
+
+
+class OrderStatusDay(models.Model):
+    """Orders and order value per status, by the day the order was placed"""
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.ORDER_STATUS)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-date']
+        unique_together = ('date', 'status')
+
+
+# ============ FACET COUNTS ============
+# Maintained incrementally by store.facets; rebuild with `manage.py rebuild_facet_counts`,
+# which is also needed after changing FACET_PRICE_BANDS.
+
+class CategoryFacetCount(models.Model):
+    """Active products in a category for one combination of facet values"""
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    vendor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    price_band = models.PositiveSmallIntegerField()
+    in_stock = models.BooleanField()
+    on_sale = models.BooleanField()
+    products = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('category', 'vendor', 'price_band', 'in_stock', 'on_sale')
+
+    def __str__(self):
+        return f"{self.category_id}/{self.vendor_id}/{self.price_band}/{self.in_stock}/{self.on_sale}: {self.products}"
+
+
+# ============ RECOMMENDATIONS ============
+# Built offline by store.recommendations; rebuild with `manage.py build_recommendations`.
+
+class ProductRecommendation(models.Model):
+    """One of a product's top recommendations, ranked from 0"""
+    CO_PURCHASE = 'co_purchase'
+    BESTSELLER = 'bestseller'
+    SOURCES = (
+        (CO_PURCHASE, 'Bought together'),
+        (BESTSELLER, 'Category bestseller'),
+    )
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_in')
+    rank = models.PositiveSmallIntegerField()
+    # Orders shared with the product for co-purchases, units sold for bestsellers
+    score = models.IntegerField()
+    source = models.CharField(max_length=20, choices=SOURCES)
+
+    class Meta:
+        ordering = ['product', 'rank']
+        unique_together = ('product', 'rank')
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id} ({self.source})"
@@ -0,0 +1,174 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(direction, values):
+    """Pack a direction ('next' or 'prev') and the boundary key values into a URL-safe token"""
+    payload = json.dumps({'d': direction, 'k': [str(value) for value in values]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, key_length):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction, values = payload['d'], payload['k']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+    if direction not in ('next', 'prev') or not isinstance(values, list) or len(values) != key_length:
+        raise InvalidCursor(cursor)
+    return direction, values
+
+
+class KeysetPage:
+    """One page of results plus the tokens needed to move next/back"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination over a queryset ordered by unique, non-null keys.
+
+    Instead of OFFSET, every page continues from the key values of the last row
+    seen, e.g. WHERE (created_at, id) < (?, ?), so page 500 costs the same as page 1.
+    The last ordering field must be unique (normally the primary key).
+    """
+
+    def __init__(self, queryset, ordering=('-created_at', '-id'), per_page=None):
+        self.queryset = queryset
+        self.ordering = [
+            (field.lstrip('-'), field.startswith('-')) for field in ordering
+        ]
+        self.per_page = per_page or settings.PRODUCTS_PER_PAGE
+
+    def _order_by(self, reverse):
+        return [
+            f"{'-' if descending != reverse else ''}{name}"
+            for name, descending in self.ordering
+        ]
+
+    def _after(self, values, reverse):
+        """Q() matching rows strictly after the given key values in travel order"""
+        condition = Q()
+        for position, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != reverse else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[position]})
+            for earlier, (earlier_name, _) in enumerate(self.ordering[:position]):
+                step &= Q(**{earlier_name: values[earlier]})
+            condition |= step
+        return condition
+
+    def _key(self, obj):
+        # Rows from values() querysets are dicts
+        if isinstance(obj, dict):
+            return [obj[name] for name, _ in self.ordering]
+        return [getattr(obj, name) for name, _ in self.ordering]
+
+    def _prepare(self, cursor):
+        """Return (queryset, key values, reverse) for a cursor token"""
+        direction, values = 'next', None
+        if cursor:
+            try:
+                direction, values = decode_cursor(cursor, len(self.ordering))
+            except InvalidCursor:
+                direction, values = 'next', None
+
+        reverse = direction == 'prev'
+        queryset = self.queryset.order_by(*self._order_by(reverse))
+        if values is not None:
+            try:
+                queryset = queryset.filter(self._after(values, reverse))
+            except (ValidationError, ValueError, TypeError):
+                # Tampered key values that do not parse for the field type
+                return self._prepare(None)
+        return queryset[:self.per_page + 1], values, reverse
+
+    def _page(self, rows, values, reverse):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage([])
+
+        if reverse:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor('next', self._key(rows[-1])) if has_next else None,
+            previous_cursor=encode_cursor('prev', self._key(rows[0])) if has_previous else None,
+        )
+
+    def page(self, cursor=None):
+        queryset, values, reverse = self._prepare(cursor)
+        return self._page(list(queryset), values, reverse)
+
+    async def apage(self, cursor=None):
+        queryset, values, reverse = self._prepare(cursor)
+        return self._page([obj async for obj in queryset], values, reverse)
+
+    def stream(self, cursor=None, chunk_size=100):
+        """
+        One forward page read with a server-side cursor, for streaming
+        responses that should not hold the page in memory. 'prev' cursors
+        start from the beginning.
+        """
+        queryset, values, reverse = self._prepare(cursor)
+        if reverse:
+            queryset, values, reverse = self._prepare(None)
+        return KeysetStream(self, queryset, chunk_size)
+
+
+class KeysetStream:
+    """Rows of a streamed page; next_cursor is set once iteration has passed the last row"""
+
+    def __init__(self, paginator, queryset, chunk_size):
+        self.paginator = paginator
+        self.queryset = queryset
+        self.chunk_size = chunk_size
+        self.next_cursor = None
+
+    def __iter__(self):
+        last = None
+        for position, row in enumerate(self.queryset.iterator(chunk_size=self.chunk_size)):
+            if position == self.paginator.per_page:
+                # The extra row only tells there is another page
+                self.next_cursor = encode_cursor('next', self.paginator._key(last))
+                break
+            last = row
+            yield row
@@ -0,0 +1,155 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+# ============ DECLARING BUDGETS ============
+def query_budget(max_queries):
+    """
+    Declare the most SQL queries a view may run per request, counting the
+    session, user and context processor queries. Apply it outermost so the
+    attribute sits on the function the URLconf routes to.
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def get_budget(view_func):
+    return getattr(view_func, 'query_budget', None)
+
+
+# ============ COUNTING ============
+class QueryTimer:
+    """Number of queries and total SQL seconds seen by count_queries()"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+# The timers of the count_queries() blocks enclosing the running code. A context
+# variable rather than a per-connection wrapper: under ASGI the async ORM runs
+# queries in a worker thread with its own connection objects, and only the
+# request's context travels there with it.
+_active_timers = contextvars.ContextVar('query_timers', default=())
+
+
+def _timed_execute(execute, sql, params, many, context):
+    timers = _active_timers.get()
+    if not timers:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        for timer in timers:
+            timer.count += 1
+            timer.duration += elapsed
+
+
+def install(connection):
+    """Add the counting execute wrapper to a connection; connected from connection_created"""
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
+
+
+@contextmanager
+def count_queries():
+    """Count the queries run inside the block, including those the async ORM sends to its worker thread"""
+    timer = QueryTimer()
+    # Connections of this thread may have been opened before counting was set up
+    for connection in connections.all():
+        install(connection)
+    token = _active_timers.set(_active_timers.get() + (timer,))
+    try:
+        yield timer
+    finally:
+        _active_timers.reset(token)
+
+
+# ============ MIDDLEWARE ============
+
+
+# view_name -> {'requests', 'queries', 'sql_time', 'max_queries', 'over_budget'}
+_view_stats = defaultdict(lambda: {'requests': 0, 'queries': 0, 'sql_time': 0.0, 'max_queries': 0, 'over_budget': 0})
+_stats_lock = threading.Lock()
+
+
+def get_view_stats():
+    """Totals recorded by QueryBudgetMiddleware in this process, per view name"""
+    with _stats_lock:
+        return {name: dict(stats) for name, stats in _view_stats.items()}
+
+
+class QueryBudgetMiddleware:
+    """
+    Count the queries and SQL time of every request, record them per resolved
+    view name, log views that exceed their @query_budget and report the
+    totals in a Server-Timing header. Enabled by QUERY_BUDGET_ENABLED.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with count_queries() as timer:
+            response = self.get_response(request)
+        return self.finish(request, response, timer)
+
+    async def __acall__(self, request):
+        with count_queries() as timer:
+            response = await self.get_response(request)
+        return self.finish(request, response, timer)
+
+    def finish(self, request, response, timer):
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            self.record(request, match, timer)
+
+        sql_ms = timer.duration * 1000
+        header = f'db;desc="{timer.count} queries";dur={sql_ms:.1f}'
+        if response.has_header('Server-Timing'):
+            header = f"{response['Server-Timing']}, {header}"
+        response['Server-Timing'] = header
+        return response
+
+    def record(self, request, match, timer):
+        view_name = match.view_name or match._func_path
+        budget = get_budget(match.func)
+        over = budget is not None and timer.count > budget
+        with _stats_lock:
+            stats = _view_stats[view_name]
+            stats['requests'] += 1
+            stats['queries'] += timer.count
+            stats['sql_time'] += timer.duration
+            stats['max_queries'] = max(stats['max_queries'], timer.count)
+            stats['over_budget'] += over
+        if over:
+            logger.warning(
+                "%s ran %d queries (budget %d, %.1f ms SQL) for %s %s",
+                view_name, timer.count, budget, timer.duration * 1000, request.method, request.get_full_path(),
+            )
+        else:
+            logger.debug("%s ran %d queries (%.1f ms SQL)", view_name, timer.count, timer.duration * 1000)
+
@@ -0,0 +1,110 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum, Window
+from django.db.models.functions import Coalesce, RowNumber
+from django.utils import timezone
+
+from . import cache
+from .models import Order, OrderItem, Product, ProductRecommendation
+from .vendor_stats import EXCLUDED_ORDER_STATUSES
+
+BATCH_SIZE = 1000
+
+
+# ============ CO-PURCHASES ============
+def co_purchases(limit, min_orders, since):
+    """
+    Yield (product_id, recommended_id, orders) for the `limit` active products
+    bought together with each product most often, counting distinct orders
+    placed since `since`. The whole sparse co-purchase matrix is counted in
+    one self-join GROUP BY, and only each row's top entries leave the database.
+    """
+    quote = connection.ops.quote_name
+    item = quote(OrderItem._meta.db_table)
+    order = quote(Order._meta.db_table)
+    product = quote(Product._meta.db_table)
+    excluded = ', '.join(['%s'] * len(EXCLUDED_ORDER_STATUSES))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT product_id, recommended_id, orders FROM ("
+            "  SELECT a.product_id, b.product_id AS recommended_id, COUNT(DISTINCT a.order_id) AS orders,"
+            "    ROW_NUMBER() OVER (PARTITION BY a.product_id"
+            "                       ORDER BY COUNT(DISTINCT a.order_id) DESC, b.product_id) AS position"
+            f"  FROM {item} a"
+            f"  JOIN {item} b ON b.order_id = a.order_id AND b.product_id <> a.product_id"
+            f"  JOIN {order} o ON o.id = a.order_id"
+            f"  JOIN {product} p ON p.id = b.product_id"
+            f"  WHERE o.created_at >= %s AND o.status NOT IN ({excluded}) AND p.is_active"
+            "  GROUP BY a.product_id, b.product_id"
+            "  HAVING COUNT(DISTINCT a.order_id) >= %s"
+            ") ranked WHERE position <= %s",
+            [since, *EXCLUDED_ORDER_STATUSES, min_orders, limit],
+        )
+        yield from cursor
+
+
+def category_bestsellers(limit):
+    """
+    {category_id: [(product_id, units sold)]} with the `limit` best-selling
+    active products of every category; unsold products follow, newest first.
+    """
+    units = Coalesce(Sum('orderitem__quantity', filter=~Q(orderitem__order__status__in=EXCLUDED_ORDER_STATUSES)), 0)
+    ranked = Product.objects.filter(is_active=True).annotate(units=units).annotate(position=Window(
+        RowNumber(), partition_by=F('category'), order_by=[F('units').desc(), F('created_at').desc(), F('id').desc()],
+    )).filter(position__lte=limit).order_by('category', 'position')
+    bestsellers = defaultdict(list)
+    for category_id, product_id, sold in ranked.values_list('category', 'id', 'units'):
+        bestsellers[category_id].append((product_id, sold))
+    return bestsellers
+
+
+# ============ BUILD ============
+def build(limit=None):
+    """
+    Replace the stored recommendations of every active product: its most
+    frequent co-purchases, topped up with bestsellers from its category.
+    Runs in one transaction, so the storefront keeps reading the previous set
+    until the new one is complete. Returns the number of rows written.
+    """
+    limit = limit or settings.RECOMMENDATIONS_PER_PRODUCT
+    since = timezone.now() - timedelta(days=settings.RECOMMENDATIONS_ORDER_DAYS)
+    bought_together = defaultdict(list)
+    for product_id, recommended_id, orders in co_purchases(limit, settings.RECOMMENDATIONS_MIN_ORDERS, since):
+        bought_together[product_id].append((recommended_id, orders))
+    # Enough per category to fill every slot after skipping the product and its co-purchases
+    bestsellers = category_bestsellers(2 * limit + 1)
+
+    written = 0
+    with transaction.atomic():
+        ProductRecommendation.objects.all().delete()
+        rows = []
+        for product_id, category_id in Product.objects.filter(is_active=True).values_list('id', 'category_id').iterator():
+            picks = [(recommended_id, orders, ProductRecommendation.CO_PURCHASE)
+                     for recommended_id, orders in bought_together.get(product_id, [])]
+            chosen = {product_id, *(recommended_id for recommended_id, _, _ in picks)}
+            for recommended_id, sold in bestsellers.get(category_id, []):
+                if len(picks) >= limit:
+                    break
+                if recommended_id not in chosen:
+                    picks.append((recommended_id, sold, ProductRecommendation.BESTSELLER))
+                    chosen.add(recommended_id)
+            rows.extend(
+                ProductRecommendation(product_id=product_id, recommended_id=recommended_id,
+                                      rank=rank, score=score, source=source)
+                for rank, (recommended_id, score, source) in enumerate(picks)
+            )
+            if len(rows) >= BATCH_SIZE:
+                written += len(ProductRecommendation.objects.bulk_create(rows))
+                rows = []
+        written += len(ProductRecommendation.objects.bulk_create(rows))
+    cache.bump(cache.RECOMMENDATIONS)
+    return written
+
+
+# ============ STOREFRONT ============
+def recommended_products(products, product_id):
+    """The stored recommendations of a product, best first, from one indexed query on `products`"""
+    return products.filter(recommended_in__product=product_id).order_by('recommended_in__rank')
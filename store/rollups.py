@@ -0,0 +1,210 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CategorySalesDay, Order, OrderItem, OrderStatusDay, SalesDay, VendorSalesDay
+from .vendor_stats import EXCLUDED_ORDER_STATUSES
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def counts_as_sale(status):
+    return status not in EXCLUDED_ORDER_STATUSES
+
+
+def order_day(order):
+    """Rollup day of an order: the local date it was placed on"""
+    return timezone.localdate(order.created_at)
+
+
+# ============ INCREMENTAL UPDATES ============
+def increment(model, key_fields, rows, value_fields):
+    """
+    Add each row's values onto the matching rollup row, creating it if needed,
+    with one INSERT ... ON CONFLICT DO UPDATE statement per row.
+    """
+    if not rows:
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = [model._meta.get_field(name).column for name in key_fields + value_fields]
+    keys = ', '.join(columns[:len(key_fields)])
+    updates = ', '.join(f"{column} = {table}.{column} + excluded.{column}" for column in columns[len(key_fields):])
+    placeholders = ', '.join(['%s'] * len(columns))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) "
+            f"ON CONFLICT ({keys}) DO UPDATE SET {updates}",
+            [[row[name] for name in key_fields + value_fields] for row in rows],
+        )
+
+
+def item_line(item):
+    """(category_id, vendor_id, units, revenue) for an order item with its product loaded"""
+    return item.product.category_id, item.product.vendor_id, item.quantity, item.price * item.quantity
+
+
+def apply_lines(day, lines, sign=1, orders=0):
+    """Add (sign=1) or remove (sign=-1) order lines, and optionally whole orders, from the sales rollups"""
+    units = sum(line[2] for line in lines)
+    revenue = sum((line[3] for line in lines), Decimal(0))
+    by_category = defaultdict(lambda: [0, Decimal(0)])
+    by_vendor = defaultdict(lambda: [0, Decimal(0)])
+    for category_id, vendor_id, line_units, line_revenue in lines:
+        by_category[category_id][0] += line_units
+        by_category[category_id][1] += line_revenue
+        by_vendor[vendor_id][0] += line_units
+        by_vendor[vendor_id][1] += line_revenue
+
+    increment(SalesDay, ['date'], [
+        {'date': day, 'orders': sign * orders, 'units': sign * units, 'revenue': sign * revenue},
+    ], ['orders', 'units', 'revenue'])
+    increment(CategorySalesDay, ['date', 'category'], [
+        {'date': day, 'category': category_id, 'units': sign * u, 'revenue': sign * r}
+        for category_id, (u, r) in by_category.items()
+    ], ['units', 'revenue'])
+    increment(VendorSalesDay, ['date', 'vendor'], [
+        {'date': day, 'vendor': vendor_id, 'units': sign * u, 'revenue': sign * r}
+        for vendor_id, (u, r) in by_vendor.items()
+    ], ['units', 'revenue'])
+
+
+def apply_status(day, status, amount, sign=1):
+    increment(OrderStatusDay, ['date', 'status'], [
+        {'date': day, 'status': status, 'orders': sign, 'revenue': sign * amount},
+    ], ['orders', 'revenue'])
+
+
+def order_added(order):
+    apply_status(order_day(order), order.status, order.total_amount)
+    if counts_as_sale(order.status):
+        apply_lines(order_day(order), [], orders=1)
+
+
+def order_changed(order, old_status, old_total):
+    """Move an order between statuses and in or out of the sales figures"""
+    day = order_day(order)
+    if (old_status, old_total) != (order.status, order.total_amount):
+        apply_status(day, old_status, old_total, sign=-1)
+        apply_status(day, order.status, order.total_amount)
+    was_sale, is_sale = counts_as_sale(old_status), counts_as_sale(order.status)
+    if was_sale != is_sale:
+        lines = [item_line(item) for item in order.items.select_related('product')]
+        apply_lines(day, lines, sign=1 if is_sale else -1, orders=1)
+
+
+def order_removed(order):
+    """Called after delete; the order's items have already been removed through their own signal"""
+    apply_status(order_day(order), order.status, order.total_amount, sign=-1)
+    if counts_as_sale(order.status):
+        apply_lines(order_day(order), [], sign=-1, orders=1)
+
+
+def record_items(order, items, sign=1):
+    """
+    Add order items to the sales rollups. Checkout calls this directly since
+    its bulk_create sends no OrderItem signals.
+    """
+    if counts_as_sale(order.status):
+        apply_lines(order_day(order), [item_line(item) for item in items], sign=sign)
+
+
+# ============ REBUILD ============
+def rebuild():
+    """Recompute every rollup table from the raw order tables"""
+    day = TruncDate('created_at')
+    item_day = TruncDate('order__created_at')
+    sold_items = OrderItem.objects.exclude(order__status__in=EXCLUDED_ORDER_STATUSES).order_by()
+    line_revenue = Sum(F('price') * F('quantity'), output_field=MONEY)
+
+    with transaction.atomic():
+        for model in (SalesDay, CategorySalesDay, VendorSalesDay, OrderStatusDay):
+            model.objects.all().delete()
+
+        days = {}
+        for row in Order.objects.exclude(status__in=EXCLUDED_ORDER_STATUSES).order_by() \
+                .annotate(day=day).values('day').annotate(orders=Count('id')):
+            days[row['day']] = SalesDay(date=row['day'], orders=row['orders'])
+        for row in sold_items.annotate(day=item_day).values('day').annotate(units=Sum('quantity'), revenue=line_revenue):
+            sales_day = days.setdefault(row['day'], SalesDay(date=row['day']))
+            sales_day.units, sales_day.revenue = row['units'], row['revenue']
+        SalesDay.objects.bulk_create(days.values())
+
+        CategorySalesDay.objects.bulk_create(
+            CategorySalesDay(date=row['day'], category_id=row['product__category'],
+                             units=row['units'], revenue=row['revenue'])
+            for row in sold_items.annotate(day=item_day).values('day', 'product__category')
+            .annotate(units=Sum('quantity'), revenue=line_revenue)
+        )
+        VendorSalesDay.objects.bulk_create(
+            VendorSalesDay(date=row['day'], vendor_id=row['product__vendor'],
+                           units=row['units'], revenue=row['revenue'])
+            for row in sold_items.annotate(day=item_day).values('day', 'product__vendor')
+            .annotate(units=Sum('quantity'), revenue=line_revenue)
+        )
+        OrderStatusDay.objects.bulk_create(
+            OrderStatusDay(date=row['day'], status=row['status'], orders=row['orders'], revenue=row['revenue'])
+            for row in Order.objects.order_by().annotate(day=day).values('day', 'status')
+            .annotate(orders=Count('id'), revenue=Sum('total_amount'))
+        )
+    return len(days)
+
+
+# ============ DASHBOARD ============
+def get_sales_dashboard(days=30):
+    """Sales KPIs and chart series for the last `days` days, read from the rollups only"""
+    today = timezone.localdate()
+    since = today - timedelta(days=days - 1)
+
+    by_day = {row.date: row for row in SalesDay.objects.filter(date__gte=since)}
+    series = []
+    for offset in range(days):
+        date = since + timedelta(days=offset)
+        row = by_day.get(date)
+        series.append({
+            'date': date,
+            'orders': row.orders if row else 0,
+            'units': row.units if row else 0,
+            'revenue': row.revenue if row else Decimal('0.00'),
+        })
+
+    period_orders = sum(point['orders'] for point in series)
+    period_revenue = sum((point['revenue'] for point in series), Decimal('0.00'))
+    totals = SalesDay.objects.aggregate(orders=Sum('orders'), revenue=Sum('revenue'))
+    statuses = {
+        row['status']: row
+        for row in OrderStatusDay.objects.order_by().values('status')
+        .annotate(orders=Sum('orders'), revenue=Sum('revenue'))
+    }
+
+    return {
+        'days': days,
+        'series': series,
+        'today': series[-1],
+        'period_orders': period_orders,
+        'period_units': sum(point['units'] for point in series),
+        'period_revenue': period_revenue,
+        'average_order_value': (period_revenue / period_orders).quantize(Decimal('0.01')) if period_orders else Decimal('0.00'),
+        'total_orders': totals['orders'] or 0,
+        'total_revenue': totals['revenue'] or Decimal('0.00'),
+        'status_counts': [
+            {'status': status, 'label': label,
+             'orders': statuses.get(status, {}).get('orders') or 0,
+             'revenue': statuses.get(status, {}).get('revenue') or Decimal('0.00')}
+            for status, label in Order.ORDER_STATUS
+        ],
+        'top_categories': list(
+            CategorySalesDay.objects.filter(date__gte=since).order_by()
+            .values('category__name').annotate(units=Sum('units'), revenue=Sum('revenue'))
+            .order_by('-revenue')[:5]
+        ),
+        'top_vendors': list(
+            VendorSalesDay.objects.filter(date__gte=since).order_by()
+            .values('vendor__username').annotate(units=Sum('units'), revenue=Sum('revenue'))
+            .order_by('-revenue')[:5]
+        ),
+    }
@@ -0,0 +1,139 @@
+import re
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import connection, DatabaseError, transaction
+from django.db.models import Q
+
+FTS_TABLE = 'store_product_fts'
+
+# Column weights for bm25(): name, description, category name
+RANK_WEIGHTS = (10.0, 1.0, 5.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_supported():
+    """
+    The search index is an SQLite FTS5 table; other backends fall back to LIKE scans
+    """
+    return connection.vendor == 'sqlite'
+
+
+def create_index(cursor):
+    """Create the FTS5 shadow table if it does not exist yet"""
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "name, description, category_name, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+
+
+def build_match_query(search_query):
+    """
+    Turn free text into a safe FTS5 MATCH expression.
+    Every word becomes a quoted prefix term, so "lap del" matches "Dell Laptop".
+    """
+    tokens = TOKEN_RE.findall(search_query.lower())
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def index_products(products):
+    """Insert or refresh index rows for the given products"""
+    if not is_supported():
+        return
+    rows = [
+        (product.pk, product.name, product.description, product.category.name)
+        for product in products
+    ]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, description, category_name) "
+            "VALUES (%s, %s, %s, %s)",
+            rows,
+        )
+
+
+def index_category(category):
+    """Refresh the category name on every indexed product of a category"""
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {FTS_TABLE} SET category_name = %s "
+            "WHERE rowid IN (SELECT id FROM store_product WHERE category_id = %s)",
+            [category.name, category.pk],
+        )
+
+
+def remove_products(product_ids):
+    """Drop index rows for deleted products"""
+    if not is_supported() or not product_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+            [(product_id,) for product_id in product_ids],
+        )
+
+
+def rebuild_index():
+    """
+    Repopulate the whole index from the product and category tables.
+    Returns the number of indexed products.
+    """
+    with connection.cursor() as cursor:
+        create_index(cursor)
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description, category_name) "
+            "SELECT p.id, p.name, p.description, c.name "
+            "FROM store_product p INNER JOIN store_category c ON c.id = p.category_id"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def search_product_ids(search_query, products=None, limit=None):
+    """
+    Return product ids matching the query, best match first. When a products
+    queryset is given, only its rows are ranked, so the limit applies after
+    filters such as the category rather than before them.
+    Returns None when the index cannot be used, so callers can fall back to filter_products.
+    """
+    if not is_supported():
+        return None
+    match = build_match_query(search_query)
+    if not match:
+        return []
+    limit = limit or settings.SEARCH_RESULT_LIMIT
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    restrict, params = '', []
+    if products is not None:
+        subquery, params = products.order_by().values('pk').query.sql_with_params()
+        restrict = f"AND rowid IN ({subquery}) "
+    # Inside a transaction the MATCH gets a savepoint of its own: swallowing
+    # its error must not leave the enclosing transaction unusable
+    savepoint = transaction.atomic() if connection.in_atomic_block else nullcontext()
+    try:
+        with savepoint, connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s {restrict}"
+                f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s",
+                [match, *params, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+    except DatabaseError:
+        return None
+
+
+def filter_products(products, search_query):
+    """Unindexed LIKE search, used when FTS5 is unavailable"""
+    return products.filter(
+        Q(name__icontains=search_query) |
+        Q(description__icontains=search_query) |
+        Q(category__name__icontains=search_query)
+    )
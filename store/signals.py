@@ -0,0 +1,158 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import cache, currency, db, facets, images, querybudget, rollups, search
+from .models import Category, Currency, Order, OrderItem, Product
+
+
+# ============ PREVIOUS ROW ============
+# Connected first: the image, facet and page cache handlers below all compare
+# against the stored row, loaded here once per save
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=Category)
+def remember_previous(sender, instance, raw=False, **kwargs):
+    instance._previous = None
+    if instance.pk and not raw:
+        instance._previous = sender._default_manager.filter(pk=instance.pk).first()
+
+
+# ============ SEARCH INDEX ============
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def index_category(sender, instance, created=False, raw=False, **kwargs):
+    if not raw and not created:
+        search.index_category(instance)
+
+
+# ============ DISPLAY PRICES ============
+@receiver(post_save, sender=Product)
+def refresh_display_prices(sender, instance, raw=False, **kwargs):
+    if not raw:
+        currency.refresh_product_prices(product_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Currency)
+def currency_changed(sender, instance, raw=False, **kwargs):
+    if not raw and instance.is_enabled:
+        currency.refresh_product_prices(currencies=[instance])
+    cache.bump(cache.CURRENCIES)
+
+
+@receiver(post_delete, sender=Currency)
+def currency_deleted(sender, instance, **kwargs):
+    cache.bump(cache.CURRENCIES)
+
+
+# ============ IMAGE DERIVATIVES ============
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def build_image_derivatives(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        images.image_saved(instance, 'image', images.previous_name(instance, 'image', update_fields), update_fields)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+def delete_image_derivatives(sender, instance, **kwargs):
+    images.image_deleted(instance, 'image')
+
+
+# ============ SALES ROLLUPS ============
+@receiver(pre_save, sender=Order)
+def remember_order_state(sender, instance, raw=False, **kwargs):
+    instance._previous_state = None
+    if instance.pk and not raw:
+        instance._previous_state = (
+            Order.objects.filter(pk=instance.pk).values_list('status', 'total_amount').first()
+        )
+
+
+@receiver(post_save, sender=Order)
+def rollup_order(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_state', None)
+    if created or previous is None:
+        rollups.order_added(instance)
+    else:
+        rollups.order_changed(instance, *previous)
+
+
+@receiver(post_delete, sender=Order)
+def rollup_order_deleted(sender, instance, **kwargs):
+    rollups.order_removed(instance)
+
+
+@receiver(pre_save, sender=OrderItem)
+def remember_order_item(sender, instance, raw=False, **kwargs):
+    instance._previous_item = None
+    if instance.pk and not raw:
+        instance._previous_item = (
+            OrderItem.objects.select_related('order', 'product').filter(pk=instance.pk).first()
+        )
+
+
+@receiver(post_save, sender=OrderItem)
+def rollup_order_item(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_item', None)
+    if previous is not None:
+        rollups.record_items(previous.order, [previous], sign=-1)
+    rollups.record_items(instance.order, [instance])
+
+
+@receiver(post_delete, sender=OrderItem)
+def rollup_order_item_deleted(sender, instance, **kwargs):
+    rollups.record_items(instance.order, [instance], sign=-1)
+
+
+# ============ FACET COUNTS ============
+@receiver(post_save, sender=Product)
+def count_product_facets(sender, instance, raw=False, **kwargs):
+    if not raw:
+        previous = getattr(instance, '_previous', None)
+        facets.product_changed(facets.product_key(previous) if previous else None, facets.product_key(instance))
+
+
+@receiver(post_delete, sender=Product)
+def uncount_product_facets(sender, instance, **kwargs):
+    facets.apply([facets.product_key(instance)], sign=-1)
+
+
+# ============ PAGE CACHE ============
+# Connected last so versions are bumped after the index and stored prices are up to date
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def bump_product_versions(sender, instance, **kwargs):
+    scopes = {cache.CATALOG, cache.product_scope(instance.slug), cache.category_scope(instance.category_id)}
+    # The old slug and category pages must be invalidated too when they change
+    previous = getattr(instance, '_previous', None)
+    if previous:
+        scopes.update({cache.product_scope(previous.slug), cache.category_scope(previous.category_id)})
+    cache.bump(*scopes)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_category_versions(sender, instance, **kwargs):
+    cache.bump(cache.CATALOG, cache.CATEGORIES, cache.category_scope(instance.pk))
+
+
+# ============ DATABASE CONNECTIONS ============
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    db.apply_pragmas(connection)
+    db.install(connection)
+    querybudget.install(connection)
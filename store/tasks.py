@@ -0,0 +1,20 @@
+from jobs.queue import enqueue, register
+
+from . import recommendations
+
+BUILD_RECOMMENDATIONS = 'recommendations.build'
+
+
+def queue_recommendations_build():
+    """Queue a rebuild of the stored recommendations for the job worker"""
+    return enqueue(BUILD_RECOMMENDATIONS)
+
+
+@register(BUILD_RECOMMENDATIONS)
+def build_recommendations(payloads):
+    """Rebuild once for the whole batch; every queued build is satisfied by it"""
+    try:
+        recommendations.build()
+    except Exception as e:
+        return [e] * len(payloads)
+    return [None] * len(payloads)
@@ -0,0 +1,25 @@
+from django import template
+
+from store import images
+
+register = template.Library()
+
+
+@register.inclusion_tag('store/includes/picture.html')
+def picture(image, alt='', sizes='100vw', css_class='', style='', placeholder=''):
+    """
+    Render an uploaded image as <picture> with WebP and fallback srcsets.
+    Falls back to the original file until its derivatives exist.
+    """
+    name = image.name if image else ''
+    # The stored flag says whether variants exist; rendering never touches the storage
+    sets = images.srcsets(name, image.storage) if name and images.has_variants(image) else None
+    return {
+        'src': image.url if name else placeholder,
+        'srcset': sets[0] if sets else '',
+        'webp_srcset': sets[1] if sets else '',
+        'sizes': sizes,
+        'alt': alt,
+        'css_class': css_class,
+        'style': style,
+    }
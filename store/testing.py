@@ -0,0 +1,32 @@
+from urllib.parse import urlsplit
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, resolve
+
+from .querybudget import get_budget
+
+
+class QueryBudgetTestMixin:
+    """TestCase mixin asserting URLs stay within their view's declared @query_budget"""
+
+    def assertWithinQueryBudget(self, url, method='get', data=None, user=None, status=200):
+        """Request the URL, check the response status and the query count, and return the response"""
+        match = resolve(urlsplit(url).path)
+        budget = get_budget(match.func)
+        self.assertIsNotNone(budget, f'{match.view_name} declares no @query_budget')
+        if user is not None:
+            self.client.force_login(user)
+        with CaptureQueriesContext(connections['default']) as captured:
+            response = getattr(self.client, method)(url, data)
+        self.assertEqual(response.status_code, status, url)
+        if len(captured) > budget:
+            queries = '\n'.join(f"{n}. {query['sql']}" for n, query in enumerate(captured.captured_queries, 1))
+            self.fail(f'{match.view_name} ran {len(captured)} queries, budget {budget}, for {method.upper()} {url}:\n{queries}')
+        return response
+
+    def assertAllViewsBudgeted(self, namespace):
+        """Every URL pattern in the namespace must declare a budget next to its view"""
+        _, sub_resolver = get_resolver().namespace_dict[namespace]
+        for pattern in sub_resolver.url_patterns:
+            self.assertIsNotNone(get_budget(pattern.callback), f'{namespace}:{pattern.name} declares no @query_budget')
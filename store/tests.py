@@ -1,3 +1,1051 @@
-from django.test import TestCase
+import json
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from decimal import Decimal
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache as django_cache
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.http import QueryDict
+from django.template import Context, Template
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from PIL import Image
+
+from cart.models import Cart, CartItem
+from cart.operations import add_item
+from jobs.models import Job
+from jobs.tasks import SEND_MAIL
+from . import cache, catalog_io, context_processors, db, facets, images, orders, recommendations, rollups, search, vendor_stats
+from .currency import SESSION_KEY as CURRENCY_SESSION_KEY
+from .models import (
+    Category, CategorySalesDay, ContactMessage, Currency, Order, OrderItem, OrderStatusDay, Product,
+    ProductRecommendation, SalesDay, VendorSalesDay,
+)
+from .pagination import KeysetPaginator, encode_cursor
+from .testing import QueryBudgetTestMixin
+
+User = get_user_model()
+
+# Lookup tables small enough that scanning them is expected
+SMALL_TABLES = {'store_category', 'store_currency'}
+
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)$')
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'store-tests'}}
+
+
+def seed_catalog(products_per_category=20, orders=15):
+    vendor = User.objects.create_user('plan-vendor', 'vendor@example.com', 'pw', user_type='vendor')
+    buyer = User.objects.create_user('plan-buyer', 'buyer@example.com', 'pw')
+    categories = [Category.objects.create(name=f'Category {n}', slug=f'category-{n}') for n in range(3)]
+    products = []
+    for category in categories:
+        for n in range(products_per_category):
+            products.append(Product.objects.create(
+                name=f'{category.name} item {n}', slug=f'{category.slug}-item-{n}',
+                description='Seeded product', price=Decimal('10.00') + n, stock=n,
+                category=category, vendor=vendor, is_active=n % 5 != 0,
+            ))
+    for n in range(orders):
+        order = Order.objects.create(user=buyer, total_amount=Decimal('30.00'), shipping_address='Street 1')
+        for product in products[n:n + 3]:
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+    return vendor, buyer, categories, products
+
+
+@override_settings(CACHES=NO_CACHE)
+class QueryPlanTests(TestCase):
+    """
+    Run each hot view on a seeded database and check the EXPLAIN QUERY PLAN
+    of every SELECT it issues, so a dropped index or a rewritten query that
+    falls back to a full table scan fails here instead of in production.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog()
+        cls.order = Order.objects.filter(user=cls.buyer).first()
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plan assertions are written against SQLite EXPLAIN QUERY PLAN output')
+
+    def explain_view(self, url, user=None):
+        """Return [(sql, [plan lines])] for every SELECT the view runs"""
+        if user is not None:
+            self.client.force_login(user)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in captured.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+        return plans
+
+    def assertNoFullScans(self, url, user=None):
+        for sql, plan in self.explain_view(url, user):
+            for line in plan:
+                match = FULL_SCAN_RE.match(line)
+                if match and match.group(1) not in SMALL_TABLES:
+                    self.fail(f'{url} runs a full table scan ({line}):\n{sql}\n' + '\n'.join(plan))
+
+    def assertPagedWithoutSort(self, url, table, user=None):
+        """The keyset page query of a listing must read rows in index order, not sort them"""
+        page_queries = [
+            (sql, plan) for sql, plan in self.explain_view(url, user)
+            if f'FROM "{table}"' in sql and 'ORDER BY' in sql and 'LIMIT' in sql
+        ]
+        self.assertTrue(page_queries, f'{url} ran no paged query on {table}')
+        for sql, plan in page_queries:
+            self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan, f'{url} sorts {table}:\n{sql}\n{plan}')
+
+    # ============ STOREFRONT ============
+    def test_home(self):
+        self.assertNoFullScans(reverse('store:home'))
+
+    def test_product_list(self):
+        url = reverse('store:product_list')
+        self.assertNoFullScans(url)
+        self.assertPagedWithoutSort(url, 'store_product')
+
+    def test_product_list_next_page(self):
+        response = self.client.get(reverse('store:product_list'))
+        url = f"{reverse('store:product_list')}?cursor={response.context['page_obj'].next_cursor}"
+        self.assertNoFullScans(url)
+        self.assertPagedWithoutSort(url, 'store_product')
+
+    def test_category_list(self):
+        url = reverse('store:product_list_by_category', args=[self.categories[1].slug])
+        self.assertNoFullScans(url)
+        self.assertPagedWithoutSort(url, 'store_product')
+
+    def test_search(self):
+        self.assertNoFullScans(f"{reverse('store:product_list')}?search=item")
+
+    def test_product_detail(self):
+        self.assertNoFullScans(reverse('store:product_detail', args=[self.products[1].slug]))
+
+    # ============ ACCOUNTS ============
+    def test_vendor_dashboard(self):
+        url = reverse('store:dashboard')
+        self.assertNoFullScans(url, self.vendor)
+        self.assertPagedWithoutSort(url, 'store_product', self.vendor)
+
+    def test_vendor_dashboard_sorted(self):
+        self.assertNoFullScans(f"{reverse('store:dashboard')}?sort=-price", self.vendor)
+
+    def test_order_history(self):
+        url = reverse('store:order_history')
+        self.assertNoFullScans(url, self.buyer)
+        self.assertPagedWithoutSort(url, 'store_order', self.buyer)
+
+    def test_order_detail(self):
+        self.assertNoFullScans(reverse('store:order_detail', args=[self.order.order_number]), self.buyer)
+
+    def test_cart(self):
+        self.assertNoFullScans(reverse('cart:cart_view'), self.buyer)
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursors walk a listing forward and back without skipping or repeating rows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(products_per_category=4, orders=0)
+        # Ties on created_at are broken by id
+        Product.objects.filter(id__in=[product.id for product in cls.products[2:9]]) \
+            .update(created_at=cls.products[2].created_at)
+
+    def setUp(self):
+        self.paginator = KeysetPaginator(Product.objects.all(), per_page=5)
+        self.expected = list(Product.objects.order_by('-created_at', '-id'))
+
+    def walk_forward(self):
+        pages = [self.paginator.page()]
+        while pages[-1].has_next():
+            pages.append(self.paginator.page(pages[-1].next_cursor))
+        return pages
+
+    def test_round_trip(self):
+        pages = self.walk_forward()
+        self.assertEqual([product for page in pages for product in page], self.expected)
+        self.assertFalse(pages[0].has_previous())
+        self.assertTrue(all(page.has_previous() for page in pages[1:]))
+
+        # Walk back from the last page through the previous cursors
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = self.paginator.page(page.previous_cursor)
+            self.assertEqual(list(page), list(expected))
+            self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+
+    def test_stream_matches_page(self):
+        first = self.paginator.page()
+        stream = self.paginator.stream(first.next_cursor, chunk_size=2)
+        self.assertEqual(list(stream), list(self.paginator.page(first.next_cursor)))
+        self.assertEqual(stream.next_cursor, self.paginator.page(first.next_cursor).next_cursor)
+
+    def test_invalid_cursors_start_over(self):
+        first = list(self.paginator.page())
+        for cursor in ('garbage', encode_cursor('next', ['not a date', 'x']), encode_cursor('next', [1])):
+            self.assertEqual(list(self.paginator.page(cursor)), first, cursor)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class PageCacheTests(TestCase):
+    """Anonymous catalog pages are served from the cache until a product or category save bumps them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(products_per_category=4, orders=0)
+
+    def setUp(self):
+        django_cache.clear()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response, len(captured)
+
+    def assertCached(self, url):
+        response, queries = self.get(url)
+        self.assertEqual(queries, 0, f'{url} was not served from the page cache')
+        return response
+
+    def assertRendered(self, url):
+        response, queries = self.get(url)
+        self.assertGreater(queries, 0, f'{url} was served from a stale page cache entry')
+        return response
+
+    def test_product_save(self):
+        product = self.products[1]
+        urls = [reverse('store:product_detail', args=[product.slug]),
+                reverse('store:product_list_by_category', args=[self.categories[0].slug])]
+        other = reverse('store:product_list_by_category', args=[self.categories[2].slug])
+        for url in urls + [other]:
+            self.assertRendered(url)
+            self.assertCached(url)
+
+        product.name = 'Renamed item'
+        product.save()
+        for url in urls:
+            self.assertContains(self.assertRendered(url), 'Renamed item')
+            self.assertCached(url)
+        # Another category's listing does not depend on the product
+        self.assertCached(other)
+
+    def test_product_move(self):
+        product = self.products[1]
+        old_urls = [reverse('store:product_detail', args=[product.slug]),
+                    reverse('store:product_list_by_category', args=[self.categories[0].slug])]
+        for url in old_urls:
+            self.assertRendered(url)
+            self.assertCached(url)
+
+        product.slug = 'moved-item'
+        product.category = self.categories[2]
+        with CaptureQueriesContext(connection) as captured:
+            product.save()
+        # The image, facet and page cache handlers share one read of the stored row
+        reads = [q['sql'] for q in captured if q['sql'].startswith('SELECT') and 'WHERE "store_product"."id" = ' in q['sql']]
+        self.assertEqual(len(reads), 1, reads)
+        self.assertEqual(self.client.get(old_urls[0]).status_code, 404)
+        self.assertNotContains(self.assertRendered(old_urls[1]), 'moved-item')
+        self.assertContains(self.assertRendered(reverse('store:product_detail', args=['moved-item'])), product.name)
+
+    def test_category_save(self):
+        url = reverse('store:home')
+        self.assertRendered(url)
+        self.assertCached(url)
+        category = self.categories[0]
+        category.name = 'Renamed category'
+        category.save()
+        self.assertContains(self.assertRendered(url), 'Renamed category')
+
+    def test_logged_in_not_cached(self):
+        url = reverse('store:home')
+        self.assertRendered(url)
+        self.client.force_login(self.buyer)
+        self.assertRendered(url)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CategoryContextTests(TestCase):
+    """The categories context is served from the process-local cache until a Category save bumps its version"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(products_per_category=1, orders=0)
+
+    def setUp(self):
+        django_cache.clear()
+        self.factory = RequestFactory()
+
+    def names(self):
+        return [category.name for category in context_processors.categories(self.factory.get('/'))['categories']]
+
+    def test_cached_until_category_save(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.names(), [category.name for category in self.categories])
+        with self.assertNumQueries(0):
+            self.names()
+
+        category = self.categories[1]
+        category.name = 'Renamed category'
+        category.save()
+        with self.assertNumQueries(1):
+            self.assertIn('Renamed category', self.names())
+        with self.assertNumQueries(0):
+            self.names()
+
+    def test_async_context(self):
+        acategories = async_to_sync(context_processors.acategories)
+        with self.assertNumQueries(1):
+            acategories(self.factory.get('/'))
+        with self.assertNumQueries(0):
+            categories = acategories(self.factory.get('/'))['categories']
+        self.assertEqual(len(categories), len(self.categories))
+
+
+def uploaded_image(name, image_format):
+    buffer = BytesIO()
+    Image.new('RGB', (800, 600), 'teal').save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(CACHES=NO_CACHE)
+class ImageDerivativeTests(TestCase):
+    """Variants are built on save, flagged on the row, and removed with the image they belong to"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(products_per_category=1, orders=0)
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def make_product(self, slug, image):
+        return Product.objects.create(name=slug, slug=slug, description='Photo', price=Decimal('5.00'), stock=1,
+                                      category=self.categories[0], vendor=self.vendor, image=image)
+
+    def variants(self, name):
+        return [images.derivative_name(name, width, webp) for width in images.DERIVATIVE_WIDTHS for webp in (False, True)]
+
+    def assertVariants(self, name, exist=True):
+        for variant in self.variants(name):
+            self.assertEqual(default_storage.exists(variant), exist, variant)
+
+    def test_same_stem_different_formats(self):
+        jpeg = self.make_product('photo-jpeg', uploaded_image('photo.jpg', 'JPEG'))
+        png = self.make_product('photo-png', uploaded_image('photo.png', 'PNG'))
+        self.assertNotEqual(set(self.variants(jpeg.image.name)), set(self.variants(png.image.name)))
+        for product in (jpeg, png):
+            self.assertVariants(product.image.name)
+            self.assertTrue(Product.objects.get(pk=product.pk).image_variants)
+
+    def test_replace_and_delete(self):
+        product = self.make_product('photo', uploaded_image('photo.jpg', 'JPEG'))
+        old_name = product.image.name
+        product.image = uploaded_image('other.png', 'PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertVariants(old_name, exist=False)
+        self.assertVariants(product.image.name)
+
+        name = product.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertVariants(name, exist=False)
+
+    def test_picture_reads_stored_flag(self):
+        product = self.make_product('photo', uploaded_image('photo.jpg', 'JPEG'))
+        template = Template('{% load store_images %}{% picture product.image %}')
+        product = Product.objects.get(pk=product.pk)
+        with mock.patch.object(FileSystemStorage, 'exists', side_effect=AssertionError('storage was queried')):
+            html = template.render(Context({'product': product}))
+            self.assertIn(images.derivative_name(product.image.name, 300, webp=True), html)
+            Product.objects.filter(pk=product.pk).update(image_variants=False)
+            html = template.render(Context({'product': Product.objects.get(pk=product.pk)}))
+            self.assertNotIn('.webp', html)
+
+
+@override_settings(CACHES=NO_CACHE)
+class CurrencyTests(TestCase):
+    """Visitors switch the display currency with a POST; prices come from the stored rows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(products_per_category=2, orders=0)
+        Currency.objects.create(code='EUR', name='Euro', symbol='€', rate=Decimal('0.5'))
+
+    def test_switch(self):
+        product = self.products[1]
+        detail = reverse('store:product_detail', args=[product.slug])
+        response = self.client.post(reverse('store:set_currency', args=['EUR']), {'next': detail})
+        self.assertRedirects(response, detail)
+        self.assertEqual(self.client.session['currency'], 'EUR')
+        page = self.client.get(detail)
+        self.assertContains(page, f'€{product.price / 2:,.2f}')
+        self.assertContains(page, f'formaction="{reverse("store:set_currency", args=["USD"])}"')
+
+        self.client.post(reverse('store:set_currency', args=['XXX']), {'next': detail})
+        self.assertEqual(self.client.session['currency'], 'EUR')
+
+    def test_post_only(self):
+        url = reverse('store:set_currency', args=['EUR'])
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertNotIn('currency', self.client.session)
+        # The switcher on cached pages posts without a CSRF token
+        client = Client(enforce_csrf_checks=True)
+        response = client.post(url, {'next': 'https://example.com/'})
+        self.assertRedirects(response, reverse('store:home'))
+        self.assertEqual(client.session['currency'], 'EUR')
+
+
+@override_settings(CACHES=NO_CACHE)
+class CatalogImportTests(TestCase):
+    """Bulk import validates rows, allocates slugs and round-trips with export"""
+
+    FIELDS = ('slug', 'name', 'description', 'price', 'compare_price', 'category__slug', 'vendor__username',
+              'stock', 'is_active', 'image')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(products_per_category=5, orders=0)
+
+    def snapshot(self):
+        return list(Product.objects.order_by('slug').values_list(*self.FIELDS))
+
+    def run_import(self, text, fmt='csv', **kwargs):
+        return catalog_io.ProductImporter(**kwargs).run(catalog_io.read_rows(StringIO(text), fmt))
+
+    def test_round_trip(self):
+        for fmt in catalog_io.FORMATS:
+            before = self.snapshot()
+            exported = StringIO()
+            self.assertEqual(catalog_io.export_products(exported, fmt), len(before))
+            Product.objects.all().delete()
+
+            result = self.run_import(exported.getvalue(), fmt)
+            self.assertEqual((result.created, result.updated, result.errors), (len(before), 0, []))
+            self.assertEqual(self.snapshot(), before)
+            # Re-importing the same file only updates
+            result = self.run_import(exported.getvalue(), fmt)
+            self.assertEqual((result.created, result.updated), (0, len(before)))
+            self.assertEqual(self.snapshot(), before)
+        self.assertCountEqual(search.search_product_ids('item') or [], Product.objects.values_list('id', flat=True))
+
+    def test_validation_errors(self):
+        text = (
+            'slug,name,price,category,vendor,stock\n'
+            'good,Good lamp,12.50,category-0,plan-vendor,3\n'
+            'bad-price,Bad price,cheap,category-0,plan-vendor,1\n'
+            'no-category,No category,5,unknown,plan-vendor,1\n'
+            'no-vendor,No vendor,5,category-0,nobody,1\n'
+            'missing,,5,category-0,plan-vendor,1\n'
+            'good,Duplicate,5,category-0,plan-vendor,1\n'
+            'negative,Negative stock,5,category-0,plan-vendor,-1\n'
+        )
+        result = self.run_import(text)
+        self.assertEqual(result.created, 1)
+        errors = dict(result.errors)
+        self.assertEqual(sorted(errors), [3, 4, 5, 6, 7, 8])
+        self.assertIn('price', errors[3])
+        self.assertIn("unknown category 'unknown'", errors[4])
+        self.assertIn("unknown vendor 'nobody'", errors[5])
+        self.assertIn('name', errors[6])
+        self.assertIn('appears more than once', errors[7])
+        self.assertIn('stock', errors[8])
+        self.assertEqual(Product.objects.get(slug='good').price, Decimal('12.50'))
+
+        result = self.run_import('{"slug": "x"\n[1, 2]\n', 'jsonl')
+        self.assertEqual([line for line, _ in result.errors], [1, 2])
+
+    def test_slug_allocation(self):
+        text = (
+            'name,price,category\n'
+            'Category 0 item 1,5,category-0\n'
+            'Category 0 item 1,5,category-0\n'
+            'Brand new,5,Category 1\n'
+        )
+        result = self.run_import(text, default_vendor=self.vendor.username)
+        self.assertEqual((result.created, result.errors), (3, []))
+        slugs = ['category-0-item-1-2', 'category-0-item-1-3', 'brand-new']
+        self.assertEqual(Product.objects.filter(slug__in=slugs).count(), 3)
+
+        allocator = catalog_io.SlugAllocator({'a' * 50})
+        self.assertEqual(allocator.allocate('a' * 80), 'a' * 48 + '-2')
+        self.assertEqual(allocator.allocate('!!!'), 'product')
+
+    def test_update_queries_do_not_grow(self):
+        def count(products):
+            text = 'slug,name,category\n' + ''.join(f'{p.slug},{p.name} v2,category-1\n' for p in products)
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.run_import(text).updated, len(products))
+            return len(captured)
+        self.assertEqual(count(self.products[:2]), count(self.products[2:12]))
+        # The re-indexed rows carry the new category name
+        moved = Product.objects.filter(category=self.categories[1], name__endswith=' v2')
+        self.assertCountEqual(search.search_product_ids('"category 1" v2'), moved.values_list('id', flat=True))
+
+
+@override_settings(CACHES=NO_CACHE)
+class SearchTests(TestCase):
+    """The FTS5 index ranks matches and follows product and category changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(orders=0)
+
+    def setUp(self):
+        if not search.is_supported():
+            self.skipTest('The search index is an SQLite FTS5 table')
+
+    def make_product(self, name, description='Seeded product', category=None):
+        return Product.objects.create(
+            name=name, slug=name.lower().replace(' ', '-'), description=description, price=Decimal('10.00'),
+            stock=1, category=category or self.categories[0], vendor=self.vendor,
+        )
+
+    def test_name_outranks_description(self):
+        in_description = self.make_product('Plain mug', description='Holds coffee')
+        in_name = self.make_product('Coffee grinder')
+        self.assertEqual(search.search_product_ids('coffee'), [in_name.id, in_description.id])
+
+    def test_prefix_terms(self):
+        product = self.make_product('Dell Laptop')
+        self.assertEqual(search.search_product_ids('lap del'), [product.id])
+        self.assertEqual(search.search_product_ids('"*'), [])
+
+    def test_index_follows_changes(self):
+        product = self.make_product('Walnut desk')
+        product.name = 'Oak desk'
+        product.save()
+        self.assertEqual(search.search_product_ids('walnut'), [])
+        self.assertEqual(search.search_product_ids('oak'), [product.id])
+
+        category = self.categories[0]
+        category.name = 'Furniture'
+        category.save()
+        self.assertIn(product.id, search.search_product_ids('furniture'))
+
+        product.delete()
+        self.assertEqual(search.search_product_ids('oak'), [])
+        self.assertEqual(search.rebuild_index(), Product.objects.count())
+
+    def test_bad_match_inside_transaction(self):
+        # build_match_query quotes every word; force an expression FTS5 rejects
+        with mock.patch.object(search, 'build_match_query', return_value='foo AND'):
+            with transaction.atomic(), CaptureQueriesContext(connection) as captured:
+                self.assertIsNone(search.search_product_ids('foo AND'))
+                # The enclosing transaction is still usable
+                self.assertEqual(Product.objects.filter(pk=self.products[0].pk).count(), 1)
+        self.assertTrue(any(q['sql'].startswith('ROLLBACK TO SAVEPOINT') for q in captured))
+
+    @override_settings(SEARCH_RESULT_LIMIT=5)
+    def test_limit_applies_within_category(self):
+        category = self.categories[2]
+        url = reverse('store:product_list_by_category', args=[category.slug])
+        response = self.client.get(url, {'search': 'item'})
+        expected = Product.objects.filter(is_active=True, category=category).count()
+        self.assertEqual(len(response.context['products']), min(expected, 5))
+        self.assertTrue(all(product.category_id == category.id for product in response.context['products']))
+
+
+@override_settings(CACHES=NO_CACHE)
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Every store view stays within the @query_budget declared next to it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog()
+        cls.admin = User.objects.create_user('plan-admin', 'admin@example.com', 'pw', user_type='admin')
+        cls.order = Order.objects.filter(user=cls.buyer).first()
+
+    def test_all_views_budgeted(self):
+        self.assertAllViewsBudgeted('store')
+
+    def test_catalog_pages(self):
+        product = self.products[-1]  # Newest, so on the first page
+        for user in (None, self.buyer):
+            self.assertWithinQueryBudget(reverse('store:home'), user=user)
+            response = self.assertWithinQueryBudget(reverse('store:product_list'), user=user)
+            self.assertContains(response, product.name)
+            response = self.assertWithinQueryBudget(
+                reverse('store:product_list_by_category', args=[self.categories[1].slug]), user=user)
+            self.assertContains(response, self.categories[1].name)
+            self.assertNotContains(response, f'{self.categories[0].name} item')
+            response = self.assertWithinQueryBudget(f"{reverse('store:product_list')}?search=item", user=user)
+            self.assertContains(response, 'item')
+            response = self.assertWithinQueryBudget(reverse('store:product_detail', args=[product.slug]), user=user)
+            self.assertContains(response, product.name)
+        inactive = next(product for product in self.products if not product.is_active)
+        self.assertWithinQueryBudget(reverse('store:product_detail', args=[inactive.slug]), status=404)
+
+    def test_set_currency(self):
+        Currency.objects.create(code='EUR', name='Euro', symbol='€', rate=Decimal('0.5'))
+        response = self.assertWithinQueryBudget(reverse('store:set_currency', args=['EUR']), method='post',
+                                                data={'next': '/products/'}, status=302)
+        self.assertEqual(response.url, '/products/')
+        self.assertEqual(self.client.session[CURRENCY_SESSION_KEY], 'EUR')
+
+    def test_dashboards(self):
+        templates = {self.buyer: 'store/customer_dashboard.html', self.vendor: 'store/vendor_dashboard.html',
+                     self.admin: 'store/admin_dashboard.html'}
+        for user, template in templates.items():
+            response = self.assertWithinQueryBudget(reverse('store:dashboard'), user=user)
+            self.assertTemplateUsed(response, template)
+
+    def test_orders(self):
+        response = self.assertWithinQueryBudget(reverse('store:order_history'), user=self.buyer)
+        self.assertContains(response, Order.objects.filter(user=self.buyer).latest('created_at').order_number)
+        response = self.assertWithinQueryBudget(reverse('store:order_detail', args=[self.order.order_number]),
+                                                user=self.buyer)
+        self.assertContains(response, self.order.order_number)
+        self.assertWithinQueryBudget(reverse('store:order_detail', args=[self.order.order_number]),
+                                     user=self.vendor, status=404)
+
+    def test_contact(self):
+        self.assertWithinQueryBudget(reverse('store:contact'))
+        response = self.assertWithinQueryBudget(reverse('store:contact'), method='post', data={
+            'name': 'Ann', 'email': 'ann@example.com', 'subject': 'Hi', 'message': 'Hello',
+        })
+        self.assertTrue(response.context['success'])
+        self.assertTrue(ContactMessage.objects.filter(email='ann@example.com', subject='Hi').exists())
+        self.assertTrue(Job.objects.filter(name=SEND_MAIL, payload__reply_to=['ann@example.com']).exists())
+
+
+@override_settings(CACHES=NO_CACHE)
+class ReplicaPinTests(TestCase):
+    """A request is pinned to the primary by the writes it runs, not by the router calls Django makes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(products_per_category=3, orders=0)
+
+    def track(self):
+        """Start a request state and watch this connection's SQL for writes, as ReplicaPinMiddleware does"""
+        state = db._RequestState()
+        token = db._request_state.set(state)
+        self.addCleanup(db._request_state.reset, token)
+        self.enterContext(connection.execute_wrapper(db._track_writes))
+        return state
+
+    def test_reads_and_unsaved_instances_do_not_pin(self):
+        state = self.track()
+        product = Product.objects.get(pk=self.products[1].pk)
+        # Cookie cart lines are unsaved instances; tagging them asks the router where they would be written
+        CartItem(product=product, quantity=1)
+        db.ReplicaRouter().db_for_write(CartItem)
+        self.assertFalse(state.wrote)
+        # Writes outside REPLICA_PIN_APPS do not pin either
+        User.objects.filter(pk=self.buyer.pk).update(first_name='Ann')
+        self.assertFalse(state.wrote)
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -2000})
+    def test_replica_gets_read_safe_pragmas(self):
+        def applied(pragmas):
+            raw = sqlite3.connect(':memory:')
+            statements = []
+            raw.set_trace_callback(statements.append)
+            db.apply_pragmas(SimpleNamespace(vendor='sqlite', settings_dict={'PRAGMAS': pragmas}, connection=raw))
+            raw.close()
+            return statements
+
+        self.assertEqual(applied({}), ['PRAGMA journal_mode = WAL', 'PRAGMA synchronous = NORMAL',
+                                       'PRAGMA cache_size = -2000'])
+        self.assertEqual(applied({'query_only': 'ON'}), ['PRAGMA cache_size = -2000', 'PRAGMA query_only = ON'])
+
+    def test_orm_writes_pin(self):
+        state = self.track()
+        Cart.objects.create(user=self.buyer)
+        self.assertTrue(state.pinned and state.wrote)
+
+    def test_raw_sql_upserts_pin(self):
+        state = self.track()
+        add_item(self.buyer, self.products[1].id)
+        self.assertTrue(state.wrote)
+        self.assertEqual(db.WRITE_RE.match('WITH stock AS (SELECT 1) INSERT INTO "cart_cartitem" (id) VALUES (1)')
+                         .group(1), 'cart_cartitem')
+
+    @override_settings(CACHES=LOCAL_CACHE)
+    def test_recent_bumps_read_from_primary(self):
+        django_cache.clear()
+        cache.get_versions([cache.CATALOG, cache.CATEGORIES])
+        later = time.time() + settings.REPLICA_PIN_SECONDS + 1
+        with mock.patch('store.cache.time.time', return_value=later):
+            state = self.track()
+            self.assertEqual(cache.get_categories(), list(Category.objects.all()))
+            self.assertFalse(state.pinned)
+            # The replica may not have this change for up to REPLICA_PIN_SECONDS
+            cache.bump(cache.CATALOG)
+            cache.get_versions([cache.CATEGORIES])
+            self.assertFalse(state.pinned)
+            cache.get_versions([cache.CATEGORIES, cache.CATALOG])
+            self.assertTrue(state.pinned)
+            # Only this request reads from the primary; the visitor gets no pin cookie
+            self.assertFalse(state.wrote)
+
+    def test_outside_a_request(self):
+        with connection.execute_wrapper(db._track_writes):
+            Cart.objects.create(user=self.buyer)
+        self.assertIsNone(db._request_state.get())
+        self.assertEqual(db.ReplicaRouter().db_for_read(Product), 'default')
+
+
+@override_settings(CACHES=NO_CACHE)
+class AsyncViewTests(TestCase):
+    """The async catalog views render through the ASGI handler with the async context processors"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(orders=0)
+
+    async def assertRenders(self, url, *texts):
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        for text in texts:
+            self.assertContains(response, text)
+        return response
+
+    async def test_catalog_pages(self):
+        product = self.products[1]
+        for user in (None, self.buyer):
+            if user is not None:
+                await self.async_client.aforce_login(user)
+            await self.assertRenders(reverse('store:home'), self.categories[0].name)
+            await self.assertRenders(reverse('store:product_list_by_category', args=[self.categories[0].slug]), product.name)
+            await self.assertRenders(f"{reverse('store:product_list')}?search=item", product.name)
+            await self.assertRenders(reverse('store:product_detail', args=[product.slug]), product.name)
+
+    async def test_missing_product(self):
+        response = await self.async_client.get(reverse('store:product_detail', args=['no-such-product']))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_cart(self):
+        product = self.products[1]
+        await self.async_client.post(reverse('cart:add_to_cart', args=[product.id]))
+        await self.assertRenders(reverse('cart:cart_view'), product.name)
+        await self.async_client.aforce_login(self.buyer)
+        await self.async_client.post(reverse('cart:add_to_cart', args=[product.id]))
+        await self.assertRenders(reverse('cart:cart_view'), product.name)
+
+
+class FacetCountTests(TestCase):
+    """The stored facet counts follow product changes and match a fresh count"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(orders=0)
+
+    def assertCountsCurrent(self):
+        for category in self.categories:
+            live = Product.objects.filter(is_active=True, category=category)
+            self.assertEqual(
+                sorted(facets.stored_cells(category.id)), sorted(facets.cells(live)), category.slug,
+            )
+
+    def test_product_changes(self):
+        self.assertCountsCurrent()
+        product = self.products[1]
+        product.price, product.compare_price, product.stock = Decimal('300.00'), Decimal('400.00'), 0
+        product.save()
+        self.assertCountsCurrent()
+        product.category = self.categories[1]
+        product.save()
+        self.assertCountsCurrent()
+        product.is_active = False
+        product.save()
+        self.assertCountsCurrent()
+        self.products[2].delete()
+        self.assertCountsCurrent()
+
+    def test_checkout_sell_out(self):
+        from cart.checkout import place_order
+        from cart.models import Cart, CartItem
+        product = self.products[3]
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=product, quantity=product.stock)
+        place_order(self.buyer, 'Street 1')
+        self.assertCountsCurrent()
+
+    def test_rebuild(self):
+        stored = sorted(facets.stored_cells())
+        facets.rebuild()
+        self.assertEqual(sorted(facets.stored_cells()), stored)
+
+    def test_filters(self):
+        category = self.categories[0]
+        live = Product.objects.filter(is_active=True, category=category)
+        query = QueryDict('price=0&price=1&in_stock=1&vendor=%d' % self.vendor.pk)
+        filters = facets.FacetFilters.from_query(query)
+        counts = facets.count(facets.stored_cells(category.id), filters)
+        self.assertEqual(counts.total, live.filter(filters.q()).count())
+        self.assertEqual(counts.in_stock, live.filter(price__lt=50, stock__gt=0).count())
+
+        response = self.client.get(f"{reverse('store:product_list_by_category', args=[category.slug])}?{query.urlencode()}")
+        self.assertEqual(len(response.context['products']), counts.total)
+        self.assertEqual(response.context['facets']['total'], counts.total)
+
+    def test_bad_filter_values_are_ignored(self):
+        category = self.categories[0]
+        url = reverse('store:product_list_by_category', args=[category.slug])
+        unfiltered = self.client.get(url)
+        bad = {'price': ['\u00b2', '-1', '1.5', '99', ''], 'vendor': ['\u0661', 'x', '9' * 30]}
+        filters = facets.FacetFilters.from_query(QueryDict(urlencode(bad, doseq=True)))
+        self.assertFalse(filters)
+
+        response = self.client.get(url, bad)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['facets']['total'], unfiltered.context['facets']['total'])
+        self.assertEqual(len(response.context['products']), len(unfiltered.context['products']))
+
+        response = self.client.get(reverse('api:product_list'), {**bad, 'category': category.slug, 'limit': 500})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(b''.join(response.streaming_content))['products']),
+                         Product.objects.filter(category=category, is_active=True).count())
+
+
+@override_settings(CACHES=NO_CACHE)
+class OrderHistoryTests(TestCase):
+    """Order history counts, prefetched items and per-user scoping"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(products_per_category=5, orders=0)
+        cls.other = User.objects.create_user('other-buyer', 'other-buyer@example.com', 'pw')
+        cls.order = Order.objects.create(user=cls.buyer, total_amount=Decimal('1234.50'), shipping_address='Street 1')
+        cls.lines = [(cls.products[1], 2, '11.00'), (cls.products[2], 1, '12.00'), (cls.products[6], 4, '16.00')]
+        for product, quantity, price in cls.lines:
+            OrderItem.objects.create(order=cls.order, product=product, quantity=quantity, price=Decimal(price))
+        cls.empty = Order.objects.create(user=cls.buyer, total_amount=Decimal('0.00'), shipping_address='Street 1')
+        cls.foreign = Order.objects.create(user=cls.other, total_amount=Decimal('5.00'), shipping_address='Street 2')
+        OrderItem.objects.create(order=cls.foreign, product=cls.products[1], quantity=1, price=Decimal('5.00'))
+
+    def test_counts_and_prefetched_items(self):
+        history = {order.pk: order for order in orders.order_history(self.buyer)}
+        self.assertEqual(set(history), {self.order.pk, self.empty.pk})
+        order = history[self.order.pk]
+        self.assertEqual((order.item_count, order.unit_count), (3, 7))
+        self.assertEqual((history[self.empty.pk].item_count, history[self.empty.pk].unit_count), (0, 0))
+        with self.assertNumQueries(0):
+            items = [(item.product.name, item.quantity, item.get_total_price()) for item in order.items.all()]
+        self.assertEqual(items, [(product.name, quantity, Decimal(price) * quantity)
+                                 for product, quantity, price in self.lines])
+
+    def test_order_summary(self):
+        annotated = orders.order_history(self.buyer).get(pk=self.order.pk)
+        plain = Order.objects.get(pk=self.order.pk)
+        for order in (annotated, plain):
+            summary = order.get_order_summary()
+            self.assertEqual(summary['items_count'], 3)
+            self.assertEqual(summary['total_amount'], f'{settings.CURRENCY_SYMBOL}1,234.50')
+            self.assertEqual(summary['total_amount_no_decimal'], f'{settings.CURRENCY_SYMBOL}1,234')
+        with self.assertNumQueries(0):
+            annotated.get_order_summary()
+
+    def test_pages_are_scoped_to_the_owner(self):
+        self.client.force_login(self.buyer)
+        response = self.client.get(reverse('store:order_history'))
+        self.assertEqual({order.pk for order in response.context['orders']}, {self.order.pk, self.empty.pk})
+        self.assertContains(response, '7 items')
+
+        response = self.client.get(reverse('store:order_detail', args=[self.order.order_number]))
+        self.assertEqual([item.quantity for item in response.context['order'].items.all()], [2, 1, 4])
+        response = self.client.get(reverse('store:order_detail', args=[self.foreign.order_number]))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=NO_CACHE, LOW_STOCK_THRESHOLD=10)
+class VendorStatsTests(TestCase):
+    """The vendor dashboard figures, checked against hand-computed values"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('stats-vendor', 'stats@example.com', 'pw', user_type='vendor')
+        cls.other = User.objects.create_user('other-vendor', 'other@example.com', 'pw', user_type='vendor')
+        cls.buyer = User.objects.create_user('stats-buyer', 'stats-buyer@example.com', 'pw')
+        category = Category.objects.create(name='Stats', slug='stats')
+
+        def product(slug, price, stock, vendor=None, compare_price=None, is_active=True):
+            return Product.objects.create(
+                name=slug, slug=slug, price=Decimal(price), stock=stock, category=category,
+                vendor=vendor or cls.vendor, is_active=is_active,
+                compare_price=Decimal(compare_price) if compare_price else None,
+            )
+        cls.lamp = product('lamp', '10.00', 5, compare_price='12.00')   # low stock, on sale
+        cls.desk = product('desk', '100.00', 20, compare_price='90.00')  # compare price below price: not on sale
+        cls.chair = product('chair', '25.50', 10, is_active=False)      # at the threshold
+        cls.rival = product('rival', '7.00', 1, vendor=cls.other)
+
+        def order(status, *lines):
+            placed = Order.objects.create(user=cls.buyer, total_amount=Decimal('1.00'), status=status,
+                                          shipping_address='Street 1')
+            for item, quantity, price in lines:
+                OrderItem.objects.create(order=placed, product=item, quantity=quantity, price=Decimal(price))
+        order('delivered', (cls.lamp, 2, '9.00'), (cls.rival, 4, '7.00'))
+        order('pending', (cls.lamp, 1, '10.00'), (cls.desk, 1, '95.50'))
+        order('shipped', (cls.chair, 3, '25.50'))
+        order('cancelled', (cls.lamp, 5, '10.00'), (cls.desk, 2, '100.00'))
+
+    def test_totals(self):
+        self.assertEqual(vendor_stats.get_vendor_stats(self.vendor), {
+            'total_products': 3,
+            'active_products': 2,
+            'low_stock_count': 2,
+            'on_sale_count': 1,
+            'stock_value': Decimal('2305.00'),    # 10*5 + 100*20 + 25.50*10
+            'units_sold': 7,                       # cancelled lines left out
+            'total_sales': Decimal('200.00'),      # 18 + 10 + 95.50 + 76.50
+        })
+        self.assertEqual(vendor_stats.get_vendor_stats(self.buyer), {
+            'total_products': 0, 'active_products': 0, 'low_stock_count': 0, 'on_sale_count': 0,
+            'stock_value': Decimal('0.00'), 'units_sold': 0, 'total_sales': Decimal('0.00'),
+        })
+
+    def test_units_sold_per_product(self):
+        sold = dict(vendor_stats.vendor_products(self.vendor).values_list('slug', 'units_sold'))
+        self.assertEqual(sold, {'lamp': 3, 'desk': 1, 'chair': 3})
+
+    def test_dashboard(self):
+        self.client.force_login(self.vendor)
+        response = self.client.get(reverse('store:dashboard'), {'sort': 'stock'})
+        self.assertEqual(response.context['total_sales'], Decimal('200.00'))
+        self.assertEqual(response.context['low_stock_count'], 2)
+        self.assertEqual([(p.slug, p.units_sold) for p in response.context['products']],
+                         [('lamp', 3), ('chair', 3), ('desk', 1)])
+
+
+@override_settings(CACHES=NO_CACHE)
+class SalesRollupTests(TestCase):
+    """The signal-maintained rollups always equal a rebuild from the order tables"""
+
+    ROLLUPS = (
+        (SalesDay, ('date', 'orders', 'units', 'revenue')),
+        (CategorySalesDay, ('date', 'category', 'units', 'revenue')),
+        (VendorSalesDay, ('date', 'vendor', 'units', 'revenue')),
+        (OrderStatusDay, ('date', 'status', 'orders', 'revenue')),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(products_per_category=5, orders=4)
+
+    def snapshot(self):
+        """Every rollup row, skipping rows that incremental updates brought back down to zero"""
+        return {
+            model.__name__: sorted(row for row in model.objects.values_list(*fields) if any(row[2:]))
+            for model, fields in self.ROLLUPS
+        }
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        rollups.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_order_created(self):
+        order = Order.objects.create(user=self.buyer, total_amount=Decimal('25.00'), shipping_address='Street 2')
+        OrderItem.objects.create(order=order, product=self.products[6], quantity=2, price=Decimal('12.50'))
+        self.assertTrue(SalesDay.objects.exists())
+        self.assertMatchesRebuild()
+
+    def test_status_changes(self):
+        order = Order.objects.filter(user=self.buyer).first()
+        for status in ('shipped', 'cancelled', 'pending'):
+            order.status = status
+            order.save()
+            self.assertMatchesRebuild()
+        order.total_amount += 5
+        order.save()
+        self.assertMatchesRebuild()
+
+    def test_item_edits(self):
+        item = OrderItem.objects.select_related('order').first()
+        item.quantity = 4
+        item.price = Decimal('99.99')
+        item.save()
+        self.assertMatchesRebuild()
+        item.product = self.products[-1]
+        item.save()
+        self.assertMatchesRebuild()
+
+        order = item.order
+        order.status = 'cancelled'
+        order.save()
+        # Edits to an excluded order stay out of the sales figures
+        item.quantity = 1
+        item.save()
+        self.assertMatchesRebuild()
+
+    def test_deletes(self):
+        OrderItem.objects.first().delete()
+        self.assertMatchesRebuild()
+        Order.objects.filter(user=self.buyer).first().delete()
+        self.assertMatchesRebuild()
+
+        cancelled = Order.objects.filter(user=self.buyer).first()
+        cancelled.status = 'cancelled'
+        cancelled.save()
+        cancelled.delete()
+        self.assertMatchesRebuild()
+
+
+@override_settings(CACHES=NO_CACHE, RECOMMENDATIONS_MIN_ORDERS=2)
+class RecommendationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Each order holds products n, n+1 and n+2
+        cls.vendor, cls.buyer, cls.categories, cls.products = seed_catalog(orders=15)
+
+    def test_build(self):
+        recommendations.build()
+        product = self.products[3]
+        stored = list(ProductRecommendation.objects.filter(product=product))
+        # Product 3 is in orders 1-3: products 2 and 4 share two of them, products 1 and 5 only one
+        self.assertEqual([row.source for row in stored],
+                         [ProductRecommendation.CO_PURCHASE] * 2 + [ProductRecommendation.BESTSELLER] * 2)
+        self.assertEqual({row.recommended_id for row in stored[:2]}, {self.products[2].id, self.products[4].id})
+        self.assertEqual(len(stored), settings.RECOMMENDATIONS_PER_PRODUCT)
+
+        response = self.client.get(reverse('store:product_detail', args=[product.slug]))
+        self.assertEqual([p.id for p in response.context['related_products']], [row.recommended_id for row in stored])
+
+    def test_bestseller_fallback(self):
+        recommendations.build()
+        # Only sold in category 0; nothing in category 2 was ever ordered
+        product = self.products[-1]
+        stored = ProductRecommendation.objects.filter(product=product)
+        self.assertTrue(stored)
+        self.assertTrue(all(row.source == ProductRecommendation.BESTSELLER for row in stored))
+        self.assertTrue(all(row.recommended.category_id == product.category_id for row in stored))
+
+    def test_unbuilt_product(self):
+        response = self.client.get(reverse('store:product_detail', args=[self.products[1].slug]))
+        self.assertEqual(len(response.context['related_products']), settings.RECOMMENDATIONS_PER_PRODUCT)
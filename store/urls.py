@@ -8,6 +8,9 @@ urlpatterns = [
     path('products/', views.product_list, name='product_list'),
     path('products/<slug:category_slug>/', views.product_list, name='product_list_by_category'),
     path('product/<slug:product_slug>/', views.product_detail, name='product_detail'),
+    path('currency/<str:code>/', views.set_currency, name='set_currency'),
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('orders/', views.order_history, name='order_history'),
+    path('orders/<str:order_number>/', views.order_detail, name='order_detail'),
     path('contact/', views.contact, name='contact'),  # Contact page
 ]
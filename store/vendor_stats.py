@@ -0,0 +1,86 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import (
+    Count, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value,
+)
+from django.db.models.functions import Coalesce
+
+from .models import OrderItem, Product
+
+User = get_user_model()
+
+# Orders in these states do not count towards units and revenue sold
+EXCLUDED_ORDER_STATUSES = ('cancelled',)
+
+# ?sort= value -> keyset ordering; the last key must be unique
+SORT_OPTIONS = {
+    'newest': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+    'name': ('name', 'id'),
+    '-name': ('-name', '-id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+    'stock': ('stock', 'id'),
+    '-stock': ('-stock', '-id'),
+}
+DEFAULT_SORT = 'newest'
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _scalar(queryset, expression, output_field):
+    """Correlated subquery returning one aggregate over the outer vendor's rows"""
+    return Coalesce(
+        Subquery(queryset.annotate(value=expression).values('value')[:1], output_field=output_field),
+        Value(0, output_field=output_field),
+    )
+
+
+def _sold_items():
+    return OrderItem.objects.exclude(order__status__in=EXCLUDED_ORDER_STATUSES)
+
+
+def get_vendor_stats(vendor):
+    """
+    Dashboard totals for one vendor, computed by the database in a single query.
+
+    Each figure is a correlated subquery on the vendor row, so nothing is
+    loaded into Python however many products or order lines the vendor has.
+    """
+    products = Product.objects.filter(vendor=OuterRef('pk')).order_by().values('vendor')
+    sold = _sold_items().filter(product__vendor=OuterRef('pk')).order_by().values('product__vendor')
+    threshold = settings.LOW_STOCK_THRESHOLD
+
+    stats = User.objects.filter(pk=vendor.pk).annotate(
+        total_products=_scalar(products, Count('id'), IntegerField()),
+        active_products=_scalar(products, Count('id', filter=Q(is_active=True)), IntegerField()),
+        low_stock_count=_scalar(products, Count('id', filter=Q(stock__lte=threshold)), IntegerField()),
+        on_sale_count=_scalar(products, Count('id', filter=Q(compare_price__gt=F('price'))), IntegerField()),
+        stock_value=_scalar(products, Sum(F('price') * F('stock'), output_field=MONEY), MONEY),
+        units_sold=_scalar(sold, Sum('quantity'), IntegerField()),
+        total_sales=_scalar(sold, Sum(F('price') * F('quantity'), output_field=MONEY), MONEY),
+    ).values(
+        'total_products', 'active_products', 'low_stock_count', 'on_sale_count',
+        'stock_value', 'units_sold', 'total_sales',
+    ).first()
+    # Decimal arithmetic on SQLite can come back with stray digits
+    for key in ('stock_value', 'total_sales'):
+        stats[key] = Decimal(stats[key]).quantize(Decimal('0.01'))
+    return stats
+
+
+def vendor_products(vendor):
+    """
+    The vendor's products for the dashboard table, with units sold per row.
+    The sold subquery only runs for the rows of the page being fetched.
+    """
+    units_sold = _sold_items().filter(product=OuterRef('pk')).order_by().values('product')
+    return Product.objects.filter(vendor=vendor).select_related('category').annotate(
+        units_sold=_scalar(units_sold, Sum('quantity'), IntegerField()),
+    )
+
+
+def get_sort(value):
+    return value if value in SORT_OPTIONS else DEFAULT_SORT
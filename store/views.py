@@ -1,81 +1,200 @@
-from django.shortcuts import render, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, redirect
+from django.http import Http404
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-from .models import Product, Category
-from django.core.mail import send_mail
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.db.models import Case, When, IntegerField
+from .models import Product, Category, ContactMessage, Order
+from . import facets, orders, recommendations, rollups, search, vendor_stats
+from .async_context import arender
+from .currency import SESSION_KEY as CURRENCY_SESSION_KEY, aget_active_currency, get_currencies, with_display_prices
+from .pagination import KeysetPaginator
+from .querybudget import query_budget
+from .cache import CATALOG, RECOMMENDATIONS, adepends_on, aget_categories, cache_catalog_page, category_scope, product_scope
+from jobs.tasks import queue_mail
 from django.conf import settings
 
+User = get_user_model()
+
 # Home view
-def home(request):
-    featured_products = Product.objects.filter(is_active=True)[:8]
-    categories = Category.objects.all()[:6]
+@query_budget(12)
+@cache_catalog_page
+async def home(request):
+    await adepends_on(request, CATALOG)
+    currency = await aget_active_currency(request)
+    featured_products = with_display_prices(Product.objects.filter(is_active=True), currency).order_by('-created_at')[:8]
+    categories = (await aget_categories())[:6]
     context = {
-        'featured_products': featured_products,
+        'featured_products': [product async for product in featured_products],
         'categories': categories,
     }
-    return render(request, 'store/home.html', context)
+    return await arender(request, 'store/home.html', context)
 
 # Product list
-def product_list(request, category_slug=None):
+# Includes the two savepoint statements a search runs inside a transaction, as in tests
+@query_budget(14)
+@cache_catalog_page
+async def product_list(request, category_slug=None):
     category = None
-    categories = Category.objects.all()
+    categories = await aget_categories()
+    currency = await aget_active_currency(request)
     products = Product.objects.filter(is_active=True)
+    ordering = ('-created_at', '-id')
     
+    if category_slug:
+        category = next((cat for cat in categories if cat.slug == category_slug), None)
+        if category is None:
+            raise Http404("No Category matches the given query.")
+        products = products.filter(category=category)
+        await adepends_on(request, category_scope(category.id))
+    else:
+        await adepends_on(request, CATALOG)
+
     search_query = request.GET.get('search', '')
+    ranked_ids = None
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(category__name__icontains=search_query)
+        # The index is queried through a raw cursor, which has no async API.
+        # It ranks only this listing's products, so the result limit never drops category matches.
+        ranked_ids = await sync_to_async(search.search_product_ids)(search_query, products)
+        if ranked_ids is None:
+            products = search.filter_products(products, search_query)
+        else:
+            products = products.filter(id__in=ranked_ids)
+
+    # Whole categories are counted from the stored facet counts; search results on the fly in one query
+    cells = facets.cells(products) if search_query else facets.stored_cells(category.id if category else None)
+    filters = facets.FacetFilters.from_query(request.GET)
+    counts = facets.count([cell async for cell in cells], filters)
+    vendor_names = {
+        vendor_id: username async for vendor_id, username
+        in User.objects.filter(id__in=facets.vendor_ids(counts, filters)).values_list('id', 'username')
+    }
+
+    products = with_display_prices(products.filter(filters.q()), currency)
+    if ranked_ids is not None:
+        # Keep the index ranking: best match first
+        products = products.annotate(
+            search_rank=Case(
+                *[When(id=product_id, then=rank) for rank, product_id in enumerate(ranked_ids)],
+                output_field=IntegerField(),
+            )
         )
-    
-    if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
-        products = products.filter(category=category)
+        ordering = ('search_rank', 'id')
+
+    page = await KeysetPaginator(products, ordering).apage(request.GET.get('cursor'))
     
     context = {
         'category': category,
         'categories': categories,
-        'products': products,
+        'products': page,
+        'page_obj': page,
         'search_query': search_query,
+        'facets': facets.sidebar(counts, filters, request.GET, vendor_names, currency),
     }
-    return render(request, 'store/product_list.html', context)
+    return await arender(request, 'store/product_list.html', context)
 
 # Product detail
-def product_detail(request, product_slug):
-    product = get_object_or_404(Product, slug=product_slug, is_active=True)
-    related_products = Product.objects.filter(category=product.category, is_active=True).exclude(id=product.id)[:4]
+@query_budget(14)
+@cache_catalog_page
+async def product_detail(request, product_slug):
+    await adepends_on(request, product_scope(product_slug), RECOMMENDATIONS)
+    products = with_display_prices(Product.objects.filter(is_active=True), await aget_active_currency(request))
+    try:
+        # The template shows the category and vendor names
+        product = await products.select_related('category', 'vendor').aget(slug=product_slug)
+    except Product.DoesNotExist:
+        raise Http404("No Product matches the given query.")
+    await adepends_on(request, category_scope(product.category_id))
+    # Precomputed by `manage.py build_recommendations`
+    recommended = recommendations.recommended_products(products, product.id)[:settings.RECOMMENDATIONS_PER_PRODUCT]
+    related_products = [related async for related in recommended]
+    if not related_products:
+        # Products added since the last build have none stored yet
+        newest = products.filter(category=product.category_id).exclude(id=product.id).order_by('-created_at')
+        related_products = [related async for related in newest[:settings.RECOMMENDATIONS_PER_PRODUCT]]
     context = {
         'product': product,
         'related_products': related_products,
     }
-    return render(request, 'store/product_detail.html', context)
+    return await arender(request, 'store/product_detail.html', context)
+
+# Currency switcher
+# The switcher form is part of cached catalog pages, which cannot carry a
+# per-visitor CSRF token; changing the display currency exposes nothing.
+@query_budget(6)
+@csrf_exempt
+@require_POST
+def set_currency(request, code):
+    if any(currency.code == code for currency in get_currencies()):
+        request.session[CURRENCY_SESSION_KEY] = code
+    next_url = request.POST.get('next', '')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        next_url = 'store:home'
+    return redirect(next_url)
 
 # Dashboard
+@query_budget(18)
 @login_required
 def dashboard(request):
     user = request.user
     context = {'user': user}
     
     if hasattr(user, 'is_admin') and user.is_admin():
+        # Sales figures come from the rollup tables, never the raw order tables
+        sales = rollups.get_sales_dashboard()
         total_products = Product.objects.count()
         total_categories = Category.objects.count()
         context.update({
             'total_products': total_products,
             'total_categories': total_categories,
+            'user_count': User.objects.filter(is_active=True).count(),
+            'low_stock_count': Product.objects.filter(stock__lte=settings.LOW_STOCK_THRESHOLD).count(),
+            'total_orders': sales['total_orders'],
+            'sales': sales,
+            'sales_chart': {
+                'labels': [point['date'].strftime('%b %d') for point in sales['series']],
+                'revenue': [float(point['revenue']) for point in sales['series']],
+                'orders': [point['orders'] for point in sales['series']],
+            },
         })
         return render(request, 'store/admin_dashboard.html', context)
     elif hasattr(user, 'is_vendor') and user.is_vendor():
-        vendor_products = Product.objects.filter(vendor=user)
+        sort = vendor_stats.get_sort(request.GET.get('sort'))
+        paginator = KeysetPaginator(vendor_stats.vendor_products(user), vendor_stats.SORT_OPTIONS[sort])
+        page = paginator.page(request.GET.get('cursor'))
+        context.update(vendor_stats.get_vendor_stats(user))
         context.update({
-            'products': vendor_products,
-            'total_products': vendor_products.count(),
+            'products': page,
+            'page_obj': page,
+            'sort': sort,
+            'low_stock_threshold': settings.LOW_STOCK_THRESHOLD,
         })
         return render(request, 'store/vendor_dashboard.html', context)
     else:
+        context['order_count'] = Order.objects.filter(user=user).count()
         return render(request, 'store/customer_dashboard.html', context)
 
+# Order history
+@query_budget(10)
+@login_required
+def order_history(request):
+    paginator = KeysetPaginator(
+        orders.order_history(request.user), ('-created_at', '-id'), per_page=settings.ORDERS_PER_PAGE,
+    )
+    page = paginator.page(request.GET.get('cursor'))
+    return render(request, 'store/order_history.html', {'orders': page, 'page_obj': page})
+
+@query_budget(10)
+@login_required
+def order_detail(request, order_number):
+    order = get_object_or_404(orders.order_with_items(request.user), order_number=order_number)
+    return render(request, 'store/order_detail.html', {'order': order})
+
 # Contact page
+@query_budget(8)
 def contact(request):
     success = False
     if request.method == 'POST':
@@ -85,16 +204,14 @@ def contact(request):
         message = request.POST.get('message', '')
 
         if name and email and subject and message:
-            try:
-                send_mail(
-                    subject=f"Contact Form: {subject}",
-                    message=f"From: {name} <{email}>\n\n{message}",
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[settings.DEFAULT_FROM_EMAIL],
-                    fail_silently=False,
-                )
-                success = True
-            except Exception as e:
-                print("Email send failed:", e)
-    
+            # Saved right away; the notification email is sent by the job worker
+            ContactMessage.objects.create(name=name, email=email, subject=subject, message=message)
+            queue_mail(
+                subject=f"Contact Form: {subject}",
+                message=f"From: {name} <{email}>\n\n{message}",
+                recipient_list=[settings.DEFAULT_FROM_EMAIL],
+                reply_to=[email],
+            )
+            success = True
+
     return render(request, 'contact/contact.html', {'success': success})
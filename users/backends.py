@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+UserModel = get_user_model()
+
+
+class EmailOrUsernameBackend(ModelBackend):
+    """
+    Authenticate with a username or an email address, resolved in one query.
+
+    Emails match case-insensitively through the unique index on LOWER(email)
+    (see CustomUser.Meta). When one account's username equals another
+    account's email, the username wins.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if not username or password is None:
+            return None
+
+        candidates = list(
+            UserModel._default_manager.alias(email_lower=Lower('email'))
+            # Repeating the index condition (email <> '') lets the database use the partial index
+            .filter(Q(username=username) | (~Q(email='') & Q(email_lower=username.lower())))[:2]
+        )
+        user = next((c for c in candidates if c.username == username), None)
+        if user is None and candidates:
+            user = candidates[0]
+
+        if user is None:
+            # Run the hasher anyway so response times do not reveal unknown accounts
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
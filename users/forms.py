@@ -1,6 +1,8 @@
 from django import forms
-from django.contrib.auth.forms import UserCreationForm, UserChangeForm
-from django.contrib.auth import get_user_model
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm, UserChangeForm
+from django.template import loader
+from django.contrib.auth import authenticate, get_user_model
+from jobs.tasks import queue_mail
 from .models import CustomUser
 
 User = get_user_model()
@@ -50,12 +52,39 @@ class LoginForm(forms.Form):
         widget=forms.PasswordInput(attrs={'class': 'form-control', 'placeholder': 'Password'})
     )
 
-    def clean_username(self):
-        username_or_email = self.cleaned_data['username']
-        if '@' in username_or_email:
-            if not User.objects.filter(email=username_or_email).exists():
-                raise forms.ValidationError("This email is not registered.")
-        else:
-            if not User.objects.filter(username=username_or_email).exists():
-                raise forms.ValidationError("This username is not registered.")
-        return username_or_email
+    error_messages = {
+        'invalid_login': "Invalid username/email or password.",
+    }
+
+    def __init__(self, request=None, *args, **kwargs):
+        self.request = request
+        self.user_cache = None
+        super().__init__(*args, **kwargs)
+
+    def clean(self):
+        username = self.cleaned_data.get('username')
+        password = self.cleaned_data.get('password')
+        if username and password:
+            # One user query through users.backends.EmailOrUsernameBackend.
+            # The same error for unknown accounts and wrong passwords.
+            self.user_cache = authenticate(self.request, username=username, password=password)
+            if self.user_cache is None:
+                raise forms.ValidationError(self.error_messages['invalid_login'], code='invalid_login')
+        return self.cleaned_data
+
+    def get_user(self):
+        return self.user_cache
+
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    """Renders the reset email in the request and leaves sending it to the job worker"""
+
+    def send_mail(self, subject_template_name, email_template_name, context,
+                  from_email, to_email, html_email_template_name=None):
+        subject = loader.render_to_string(subject_template_name, context)
+        subject = ''.join(subject.splitlines())
+        body = loader.render_to_string(email_template_name, context)
+        html_message = None
+        if html_email_template_name is not None:
+            html_message = loader.render_to_string(html_email_template_name, context)
+        queue_mail(subject, body, [to_email], from_email=from_email, html_message=html_message)
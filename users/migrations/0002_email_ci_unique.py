@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:19
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+
+def release_duplicate_emails(apps, schema_editor):
+    """
+    Emails that differ only in case would violate the new constraint. The
+    first account registered with an address keeps it; the later ones are
+    blanked (blank emails are outside the constraint) and can set it again
+    from their profile.
+    """
+    User = apps.get_model('users', 'CustomUser')
+    owners = {}
+    duplicates = []
+    rows = User.objects.using(schema_editor.connection.alias).exclude(email='') \
+        .annotate(email_lower=Lower('email')).order_by('pk').values_list('pk', 'email_lower')
+    for pk, email_lower in rows:
+        if email_lower in owners:
+            duplicates.append(pk)
+        else:
+            owners[email_lower] = pk
+    if duplicates:
+        User.objects.using(schema_editor.connection.alias).filter(pk__in=duplicates).update(email='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(release_duplicate_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='customuser',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), condition=models.Q(('email', ''), _negated=True), name='users_customuser_email_ci_unique', violation_error_message='A user with that email address already exists.'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Lower
 
 class CustomUser(AbstractUser):
     """
@@ -16,6 +18,19 @@ class CustomUser(AbstractUser):
     address = models.TextField(blank=True)
     date_of_birth = models.DateField(null=True, blank=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True)
+    # Set once the resized and WebP variants of profile_picture exist (see store.images)
+    profile_picture_variants = models.BooleanField(default=False, editable=False)
+
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            # Also the index behind email logins in users.backends
+            models.UniqueConstraint(
+                Lower('email'),
+                condition=~Q(email=''),
+                name='users_customuser_email_ci_unique',
+                violation_error_message='A user with that email address already exists.',
+            ),
+        ]
     
     def __str__(self):
         return self.username
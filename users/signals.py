@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from store import images
+from .models import CustomUser
+
+
+@receiver(pre_save, sender=CustomUser)
+def remember_profile_picture(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._previous_picture = None if raw else images.previous_name(instance, 'profile_picture', update_fields)
+
+
+@receiver(post_save, sender=CustomUser)
+def build_profile_picture_derivatives(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        images.image_saved(instance, 'profile_picture', getattr(instance, '_previous_picture', None), update_fields)
+
+
+@receiver(post_delete, sender=CustomUser)
+def delete_profile_picture_derivatives(sender, instance, **kwargs):
+    images.image_deleted(instance, 'profile_picture')
@@ -1,3 +1,118 @@
+from django.contrib.auth import SESSION_KEY, authenticate, get_user_model
+from django.db import IntegrityError, transaction
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from jobs.models import Job
+from jobs.tasks import SEND_MAIL
+from store.testing import QueryBudgetTestMixin
+
+User = get_user_model()
+
+
+class EmailLoginTests(TestCase):
+    """EmailOrUsernameBackend: username or case-insensitive email, one account per address"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('jane', 'Jane.Doe@Example.com', 'pw-Jane-1')
+
+    def test_username_and_email(self):
+        self.assertEqual(authenticate(username='jane', password='pw-Jane-1'), self.user)
+        self.assertEqual(authenticate(username='Jane.Doe@Example.com', password='pw-Jane-1'), self.user)
+        self.assertIsNone(authenticate(username='jane', password='wrong'))
+        self.assertIsNone(authenticate(username='nobody@example.com', password='pw-Jane-1'))
+        self.assertIsNone(authenticate(username='', password='pw-Jane-1'))
+
+    def test_email_is_case_insensitive(self):
+        self.assertEqual(authenticate(username='JANE.DOE@example.COM', password='pw-Jane-1'), self.user)
+        # Usernames stay case-sensitive
+        self.assertIsNone(authenticate(username='JANE', password='pw-Jane-1'))
+
+    def test_username_wins_over_email(self):
+        other = User.objects.create_user('jane.doe@example.com', 'other@example.com', 'pw-Other-1')
+        self.assertEqual(authenticate(username='jane.doe@example.com', password='pw-Other-1'), other)
+        self.assertIsNone(authenticate(username='jane.doe@example.com', password='pw-Jane-1'))
+        self.assertEqual(authenticate(username='JANE.DOE@EXAMPLE.COM', password='pw-Jane-1'), self.user)
+
+    def test_inactive_user_cannot_log_in(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(authenticate(username='jane', password='pw-Jane-1'))
+        self.assertIsNone(authenticate(username='jane.doe@example.com', password='pw-Jane-1'))
+
+    def test_email_unique_ignoring_case(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user('john', 'JANE.DOE@EXAMPLE.COM', 'pw-John-1')
+        # Blank emails are outside the constraint
+        User.objects.create_user('no-email-1', '', 'pw')
+        User.objects.create_user('no-email-2', '', 'pw')
+
+    def test_meta_keeps_abstract_user_options(self):
+        self.assertEqual(User._meta.verbose_name, 'user')
+        self.assertEqual(User._meta.verbose_name_plural, 'users')
+
+    def test_login_view_with_email(self):
+        response = self.client.post(reverse('users:login'), {'username': 'JANE.DOE@example.com', 'password': 'pw-Jane-1'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.pk)
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Account views stay within the @query_budget declared next to them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('budget-user', 'budget@example.com', 'pw-Budget-1')
+
+    def test_all_views_budgeted(self):
+        self.assertAllViewsBudgeted('users')
+
+    def logged_in_user_id(self):
+        user_id = self.client.session.get(SESSION_KEY)
+        return int(user_id) if user_id is not None else None
+
+    def test_register(self):
+        self.assertWithinQueryBudget(reverse('users:register'))
+        response = self.assertWithinQueryBudget(reverse('users:register'), method='post', data={
+            'username': 'new-user', 'email': 'new@example.com', 'user_type': 'customer',
+            'password1': 'pw-Budget-2x', 'password2': 'pw-Budget-2x',
+        }, status=302)
+        self.assertEqual(response.url, reverse('store:home'))
+        self.assertEqual(self.logged_in_user_id(), User.objects.get(username='new-user').pk)
+
+    def test_login_logout(self):
+        self.assertWithinQueryBudget(reverse('users:login'))
+        response = self.assertWithinQueryBudget(reverse('users:login'), method='post', data={
+            'username': 'BUDGET@example.com', 'password': 'pw-Budget-1',
+        }, status=302)
+        self.assertEqual(response.url, reverse('store:home'))
+        self.assertEqual(self.logged_in_user_id(), self.user.pk)
+        self.assertWithinQueryBudget(reverse('users:logout'), status=302)
+        self.assertIsNone(self.logged_in_user_id())
+
+    def test_failed_login(self):
+        response = self.assertWithinQueryBudget(reverse('users:login'), method='post', data={
+            'username': 'budget-user', 'password': 'wrong',
+        })
+        self.assertIsNone(self.logged_in_user_id())
+        self.assertTrue(response.context['form'].non_field_errors())
+
+    def test_profile(self):
+        self.assertWithinQueryBudget(reverse('users:profile'), user=self.user)
+        self.assertWithinQueryBudget(reverse('users:profile'), method='post', data={
+            'username': 'budget-user', 'email': 'budget@example.com', 'user_type': 'customer',
+            'phone_number': '555-0100',
+        }, status=302)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.phone_number, '555-0100')
+
+    def test_password_reset(self):
+        self.assertWithinQueryBudget(reverse('users:password_reset'))
+        response = self.assertWithinQueryBudget(reverse('users:password_reset'), method='post',
+                                                data={'email': 'budget@example.com'}, status=302)
+        self.assertEqual(response.url, reverse('users:password_reset_done'))
+        self.assertTrue(Job.objects.filter(name=SEND_MAIL, payload__recipient_list=['budget@example.com']).exists())
+        self.assertWithinQueryBudget(reverse('users:password_reset_done'))
+        response = self.assertWithinQueryBudget(reverse('users:password_reset_confirm', args=['MQ', 'bad-token']))
+        self.assertFalse(response.context['validlink'])
+        self.assertWithinQueryBudget(reverse('users:password_reset_complete'))
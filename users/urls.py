@@ -1,6 +1,8 @@
-from django.urls import path
+from django.urls import path, reverse_lazy
 from django.contrib.auth import views as auth_views
 from . import views
+from store.querybudget import query_budget
+from .forms import QueuedPasswordResetForm
 
 app_name = 'users'
 
@@ -12,19 +14,24 @@ urlpatterns = [
     
     # Password reset URLs
     path('password-reset/', 
-         auth_views.PasswordResetView.as_view(
+         query_budget(5)(auth_views.PasswordResetView.as_view(
              template_name='users/password_reset.html',
+             form_class=QueuedPasswordResetForm,
+             success_url=reverse_lazy('users:password_reset_done'),
              email_template_name='users/password_reset_email.html',
              subject_template_name='users/password_reset_subject.txt'
-         ), 
+         )), 
          name='password_reset'),
     path('password-reset/done/', 
-         auth_views.PasswordResetDoneView.as_view(template_name='users/password_reset_done.html'), 
+         query_budget(2)(auth_views.PasswordResetDoneView.as_view(template_name='users/password_reset_done.html')), 
          name='password_reset_done'),
     path('password-reset-confirm/<uidb64>/<token>/', 
-         auth_views.PasswordResetConfirmView.as_view(template_name='users/password_reset_confirm.html'), 
+         query_budget(3)(auth_views.PasswordResetConfirmView.as_view(
+             template_name='users/password_reset_confirm.html',
+             success_url=reverse_lazy('users:password_reset_complete'),
+         )), 
          name='password_reset_confirm'),
     path('password-reset-complete/', 
-         auth_views.PasswordResetCompleteView.as_view(template_name='users/password_reset_complete.html'), 
+         query_budget(2)(auth_views.PasswordResetCompleteView.as_view(template_name='users/password_reset_complete.html')), 
          name='password_reset_complete'),
 ]
\ No newline at end of file
@@ -1,12 +1,13 @@
 from django.shortcuts import render, redirect
-from django.contrib.auth import login, authenticate, logout
+from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.contrib.auth import get_user_model
 from .forms import CustomUserCreationForm, LoginForm, CustomUserChangeForm
+from cart.cookie import merge_cookie_cart
+from store.querybudget import query_budget
 
-User = get_user_model()
-
+# Merging a cookie cart adds its upsert to a registration
+@query_budget(18)
 def register_view(request):
     if request.method == 'POST':
         form = CustomUserCreationForm(request.POST)
@@ -14,47 +15,43 @@ def register_view(request):
             user = form.save()
             login(request, user)
             messages.success(request, 'Registration successful!')
-            return redirect('store:home')
+            response = redirect('store:home')
+            merge_cookie_cart(request, response, user)
+            return response
         messages.error(request, 'Please correct the errors below.')
     else:
         form = CustomUserCreationForm()
     return render(request, 'users/register.html', {'form': form})
 
 
+# Merging a cookie cart adds its upsert to a login
+@query_budget(13)
 def login_view(request):
     if request.user.is_authenticated:
         return redirect('store:home')
 
     if request.method == 'POST':
-        form = LoginForm(request.POST)
+        form = LoginForm(request, data=request.POST)
         if form.is_valid():
-            username_or_email = form.cleaned_data['username']
-            password = form.cleaned_data['password']
-
-            # Determine username if email is entered
-            if '@' in username_or_email:
-                user_obj = User.objects.get(email=username_or_email)
-                username = user_obj.username
-            else:
-                username = username_or_email
-
-            user = authenticate(request, username=username, password=password)
-            if user:
-                login(request, user)
-                messages.success(request, f'Welcome back, {user.username}!')
-                return redirect(request.GET.get('next', 'store:home'))
-            messages.error(request, 'Invalid username/email or password.')
+            user = form.get_user()
+            login(request, user)
+            messages.success(request, f'Welcome back, {user.username}!')
+            response = redirect(request.GET.get('next', 'store:home'))
+            merge_cookie_cart(request, response, user)
+            return response
     else:
-        form = LoginForm()
+        form = LoginForm(request)
     return render(request, 'users/login.html', {'form': form})
 
 
+@query_budget(6)
 def logout_view(request):
     logout(request)
     messages.success(request, 'You have been logged out.')
     return redirect('store:home')
 
 
+@query_budget(8)
 @login_required
 def profile_view(request):
     if request.method == 'POST':